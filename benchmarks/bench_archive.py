@@ -0,0 +1,68 @@
+"""
+Cost of keeping a ColumnArchive behind the ring buffer: OP_NP_XLYL
+ingest rate with and without one, then how long it takes to find
+and read back a window of history from an archive of an hour of
+1 kHz samples, about 29 MB, both raw and as a ScrollbackLoader
+envelope for a 1000 pixel wide plot, first from disk and then from
+its cache.
+
+Usage: python bench_archive.py [batch] [max_pts]
+
+"""
+import queue
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from simplertplot import protocols
+from simplertplot.archive import ColumnArchive, ScrollbackLoader
+from simplertplot.queues import ColumnRingBuffer
+
+
+def ingest_rate(proto, batch, duration=1):
+    x = np.arange(batch, dtype=np.float64)
+    y = np.sin(x)
+    n = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        proto.ingest(proto.OP_NP_XLYL, (x.tobytes(), y.tobytes()))
+        x += batch
+        n += batch
+    return n / (time.perf_counter() - start)
+
+
+def main(batch=10000, max_pts=300000):
+    print("OP_NP_XLYL ingest, batch=%d points, max_pts=%d" % (batch, max_pts))
+    with tempfile.TemporaryDirectory() as d:
+        for name, a in (("ring only", None), ("ring + archive", ColumnArchive(d + "/ingest"))):
+            proto = protocols.XYPlotterProtocol(ColumnRingBuffer(max_pts, 2), queue.Queue(), queue.Queue(),
+                                                archive=a)
+            print("%-16s %8.2f Mpts/s" % (name, ingest_rate(proto, batch) / 1e6))
+
+        a = ColumnArchive(d + "/hour")
+        t = np.arange(3600 * 1000) / 1000
+        for i in range(0, len(t), batch):
+            a.append([t[i:i + batch], np.sin(t[i:i + batch])])
+        a.close()
+        a = ColumnArchive(d + "/hour", mode='r')
+        print()
+        print("%d rows in %d chunks" % (len(a), a.nchunks))
+        print("%-12s %10s %14s %14s" % ("window (s)", "read (ms)", "envelope (ms)", "cached (ms)"))
+        rng = np.random.RandomState(0)
+        for width in (1, 60, 600, 3600):
+            t0s = rng.uniform(0, 3600 - width, 20)
+            times = []
+            loader = ScrollbackLoader(a)
+            for f in (a.read_time, lambda t0, t1: loader.fetch(t0, t1, 1000),
+                      lambda t0, t1: loader.fetch(t0, t1, 1000)):
+                start = time.perf_counter()
+                for t0 in t0s:
+                    f(t0, t0 + width)
+                times.append((time.perf_counter() - start) / len(t0s) * 1e3)
+            print("%-12d %10.3f %14.3f %14.3f" % ((width,) + tuple(times)))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,73 @@
+"""
+Per-frame cost of drawing the line at growing max_pts, drawing
+the whole buffer vs a min/max envelope of the axes' pixel width,
+decimated from the full buffer or from LODColumnRingBuffer's
+pyramid. Rendered off screen with Agg, as draw_artist() does in
+run_plot. Also the ingest cost of keeping the pyramid up to date.
+
+Usage: python bench_decimate.py
+
+"""
+import timeit
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from simplertplot.decimate import minmax_decimate
+from simplertplot.queues import ColumnRingBuffer, LODColumnRingBuffer
+
+
+def setup(npts):
+    figure = Figure()
+    canvas = FigureCanvasAgg(figure)
+    subplot = figure.add_subplot(1, 1, 1)
+    rb = LODColumnRingBuffer(npts, 2, np.float64)
+    x = np.arange(npts, dtype=np.float64)
+    y = np.cumsum(np.random.randn(npts))
+    for i in range(0, npts, 100000):
+        rb.put_list((x[i:i + 100000], y[i:i + 100000]))
+    line, = subplot.plot(x, y)
+    canvas.draw()
+    return subplot, line, rb
+
+
+def bench(npts, mode, number=5):
+    subplot, line, rb = setup(npts)
+    width = subplot.bbox.width
+
+    def frame():
+        if mode == 'full':
+            line.set_data(*rb.get())
+        elif mode == 'decimated':
+            line.set_data(*minmax_decimate(*rb.get(), width))
+        else:
+            line.set_data(*minmax_decimate(*rb.envelope(width), width))
+        subplot.draw_artist(line)
+
+    return min(timeit.repeat(frame, number=number, repeat=3)) / number
+
+
+def bench_put(kls, npts, batch=1000, number=200):
+    rb = kls(npts, 2, np.float64)
+    cols = np.random.randn(2, batch)
+    for _ in range(npts // batch):
+        rb.put_list(cols)
+    return min(timeit.repeat(lambda: rb.put_list(cols), number=number, repeat=5)) / number
+
+
+def main():
+    print("%-10s %12s %16s %12s" % ("max_pts", "full (ms)", "decimated (ms)", "lod (ms)"))
+    for npts in (10000, 100000, 300000, 1000000, 3000000, 10000000):
+        full = bench(npts, 'full') if npts <= 3000000 else float('nan')
+        dec = bench(npts, 'decimated')
+        lod = bench(npts, 'lod')
+        print("%-10d %12.2f %16.2f %12.2f" % (npts, full * 1e3, dec * 1e3, lod * 1e3))
+    print()
+    npts = 1000000
+    print("put_list of 1k rows, max_pts=%d: ColumnRingBuffer %.1fus, LODColumnRingBuffer %.1fus" %
+          (npts, bench_put(ColumnRingBuffer, npts) * 1e6, bench_put(LODColumnRingBuffer, npts) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
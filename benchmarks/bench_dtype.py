@@ -0,0 +1,70 @@
+"""
+What a plot's dtype costs and buys: binary frame bytes per point,
+the producer's time to put and serialize a batch of int16 ADC
+counts, ring buffer memory, OP_NP_XLYL ingest rate, and the worst
+error of x read back from the ring for 1 kHz Unix epoch timestamps,
+with and without compact (base + offset) time storage. int16 counts
+are sent as is and kept in a float32 ring.
+
+Usage: python bench_dtype.py [batch] [max_pts]
+
+"""
+import queue
+import sys
+import time
+
+import numpy as np
+
+from simplertplot import protocols
+from simplertplot.queues import ColumnRingBuffer
+
+
+def counts(batch):
+    return (np.sin(np.arange(batch)) * 30000).astype(np.int16)
+
+
+def produce(dtype, batch, runs=200):
+    """ (bytes per point, us per batch) """
+    user = protocols.XYUserProtocol(queue.Queue(), 'binary', dtype=dtype)
+    x = np.arange(batch, dtype=np.float64)
+    y = counts(batch)
+    start = time.perf_counter()
+    for _ in range(runs):
+        user.put_np_xlyl(x, y)
+        frame = user.serialize(user._queue.get())
+    return len(frame) / batch, (time.perf_counter() - start) / runs * 1e6
+
+
+def ingest(dtype, compact_x, batch, max_pts, duration=1):
+    """ (Mpts/s, max x error in s) """
+    ring = ColumnRingBuffer(max_pts, 2, np.result_type(dtype, np.float32))
+    proto = protocols.XYPlotterProtocol(ring, queue.Queue(), queue.Queue(), 'binary', compact_x=compact_x)
+    x = 1.7e9 + np.arange(batch) / 1000
+    y = counts(batch).astype(dtype)
+    n = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        proto.ingest(proto.OP_NP_XLYL, (x, y))
+        x += batch / 1000
+        n += batch
+    rate = n / (time.perf_counter() - start)
+    stored = proto.xyq.get()[0] + proto.x_base
+    expected = x[-1] - batch / 1000 - np.arange(len(stored))[::-1] / 1000
+    return rate / 1e6, np.abs(stored - expected).max()
+
+
+def main(batch=10000, max_pts=300000):
+    print("batch=%d points, max_pts=%d" % (batch, max_pts))
+    print("%-8s %-8s %10s %10s %10s %10s %14s" % ("dtype", "compact", "bytes/pt", "put (us)", "ring (MB)",
+                                                  "Mpts/s", "x error (s)"))
+    for dtype in (np.float64, np.float32, np.int16):
+        nbytes, put = produce(dtype, batch)
+        ring = ColumnRingBuffer(max_pts, 2, np.result_type(dtype, np.float32))._mirror.nbytes / 1e6
+        for compact in (False, True):
+            rate, err = ingest(dtype, compact, batch, max_pts)
+            print("%-8s %-8s %10.2f %10.1f %10.1f %10.2f %14.6f" % (np.dtype(dtype).name, compact, nbytes, put, ring,
+                                                                   rate, err))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,56 @@
+"""
+Frame rate of XYPlotter.draw_frame() while streaming a random walk
+into it, rendered off screen with Agg. The axes are either redrawn
+on every frame (as run_plot used to), only when the view limits
+change, or only when the limits, snapped to the nearest ticks,
+change.
+
+Usage: python bench_frame.py [frames] [pts_per_frame] [max_pts]
+
+"""
+import sys
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+
+from simplertplot import plots
+from simplertplot import transport
+
+
+def bench(mode, frames, pts_per_frame, max_pts):
+    plotter = plots.XYPlotter(transport.BaseTransport(), max_pts)
+    plotter.setup_pyplot()
+    plotter.setup_blit()
+    plotter.snap_limits = mode == 'snapped'
+    client = plotter.client
+    rng = np.random.RandomState(0)
+    t = 0
+    y0 = 0
+    elapsed = 0
+    for _ in range(frames):
+        x = np.arange(t, t + pts_per_frame, dtype=np.float64)
+        y = y0 + np.cumsum(rng.randn(pts_per_frame))
+        t += pts_per_frame
+        y0 = y[-1]
+        client.ingest(client.OP_NP_XLYL, (x.tobytes(), y.tobytes()))
+        if mode == 'every frame':
+            plotter._limits = None
+        start = time.perf_counter()
+        plotter.draw_frame()
+        elapsed += time.perf_counter() - start
+    plotter.clear_pyplot()
+    return frames / elapsed, plotter.axes_redraws
+
+
+def main(frames=300, pts_per_frame=1000, max_pts=300000):
+    print("%d frames of %d new points, max_pts=%d" % (frames, pts_per_frame, max_pts))
+    print("%-20s %10s %14s" % ("axes redrawn", "fps", "axes redraws"))
+    for mode in ('every frame', 'limits change', 'snapped'):
+        fps, redraws = bench(mode, frames, pts_per_frame, max_pts)
+        print("%-20s %10.1f %14d" % (mode, fps, redraws))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,97 @@
+"""
+Plotter-side ingest rate for every data opcode. Messages are
+built with XYUserProtocol's put_* methods and fed to
+XYPlotterProtocol.ingest(), with and without deserializing them
+from the pickle and binary wire formats.
+
+Usage: python bench_ingest.py [batch] [max_pts]
+
+"""
+import io
+import queue
+import sys
+import time
+
+import numpy as np
+
+from simplertplot import protocols
+from simplertplot.queues import ColumnRingBuffer
+
+
+def make_messages(batch):
+    q = queue.Queue()
+    user = protocols.XYUserProtocol(q)
+    x = np.linspace(0, 1, batch)
+    y = np.sin(x)
+    xl = x.tolist()
+    yl = y.tolist()
+    xyl = list(zip(xl, yl))
+
+    msgs = {}
+    for name, put, args, npts in (
+            ('OP_XY', user.put_xy, (xl[0], yl[0]), 1),
+            ('OP_XYL', user.put_xyl, (xyl,), batch),
+            ('OP_XLYL', user.put_xlyl, (xl, yl), batch),
+            ('OP_NP_XYL', user.put_np_xyl, (np.column_stack((x, y)),), batch),
+            ('OP_NP_XLYL', user.put_np_xlyl, (x, y), batch)):
+        put(*args)
+        msgs[name] = q.get(), npts
+    return msgs
+
+
+def legacy_xyl(proto, data):
+    """ Per-point ingest, as OP_XYL was handled before """
+    put = proto.xyq.put
+    for xy in data:
+        with proto.dlock:
+            put(xy)
+
+
+def bench(f, npts, duration=0.5):
+    n = 0
+    end = time.perf_counter() + duration
+    start = time.perf_counter()
+    while True:
+        f()
+        n += 1
+        now = time.perf_counter()
+        if now > end:
+            break
+    elapsed = now - start
+    return elapsed / n, npts * n / elapsed
+
+
+def main(batch=10000, max_pts=300000):
+    proto = protocols.XYPlotterProtocol(ColumnRingBuffer(max_pts, 2), queue.Queue(), queue.Queue())
+    msgs = make_messages(batch)
+
+    print("batch=%d points, max_pts=%d" % (batch, max_pts))
+    print("%-22s %14s %14s" % ("op", "us/message", "Mpts/s"))
+
+    def report(name, f, npts):
+        per, rate = bench(f, npts)
+        print("%-22s %14.1f %14.2f" % (name, per * 1e6, rate / 1e6))
+
+    for name, ((code, data), npts) in msgs.items():
+        report(name, lambda: proto.ingest(code, data), npts)
+
+    (code, data), npts = msgs['OP_XYL']
+    report("OP_XYL (per point)", lambda: legacy_xyl(proto, data), npts)
+
+    for serial_method in ('pickle', 'binary'):
+        proto = protocols.XYPlotterProtocol(ColumnRingBuffer(max_pts, 2), queue.Queue(), queue.Queue(),
+                                            serial_method)
+        print()
+        print("including %s deserialization:" % serial_method)
+        for name, (msg, npts) in msgs.items():
+            raw = proto.serialize(msg)
+
+            def load_and_ingest():
+                code, data = proto.deserialize(io.BytesIO(raw))
+                proto.ingest(code, data)
+
+            report(name, load_and_ingest, npts)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,63 @@
+"""
+Ingest and render throughput of a plot under a reproducible load:
+a recorded random walk is replayed at max speed into a headless
+plot, which renders with Agg and writes raw frames to /dev/null,
+and at 1x to show the render cost of a steady live stream.
+
+Usage: python bench_replay.py [rows] [max_pts] [block_rows]
+
+"""
+import os
+import sys
+import tempfile
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+
+from simplertplot import plots
+from simplertplot import transport
+from simplertplot.archive import ColumnArchive
+from simplertplot.replay import Replayer
+
+
+def record(path, rows, rate=10000):
+    a = ColumnArchive(path)
+    rng = np.random.RandomState(0)
+    t = np.arange(rows) / rate
+    a.append([t, np.cumsum(rng.randn(rows))])
+    a.close()
+    return ColumnArchive(path, mode='r')
+
+
+def run(recording, speed, max_pts, block_rows, duration=5):
+    plotter = plots.HeadlessPlotter(transport.BaseTransport(), max_pts, fps=30, output=os.devnull)
+    replayer = Replayer(plotter.client, recording, speed, block_rows)
+    plotter.setup_pyplot()
+    plotter.start_plot()
+    start = time.process_time()
+    replayer.start()
+    frames = 0
+    end = time.perf_counter() + duration
+    while not plotter.is_closed() and time.perf_counter() < end:
+        plotter.pacer.wait(plotter.step_plot())
+        frames += 1
+    replayer.stop()
+    cpu = time.process_time() - start
+    plotter.close_plot()
+    return replayer.rows, replayer.elapsed, frames, cpu
+
+
+def main(rows=10000000, max_pts=300000, block_rows=1 << 16):
+    with tempfile.TemporaryDirectory() as d:
+        recording = record(d, rows)
+        print("%d rows recorded at 10 kHz, max_pts=%d, block_rows=%d" % (rows, max_pts, block_rows))
+        print("%-8s %12s %10s %8s %8s" % ("speed", "Mrows/s", "wall (s)", "frames", "cpu (s)"))
+        for name, speed in (("max", None), ("1x", 1)):
+            n, elapsed, frames, cpu = run(recording, speed, max_pts, block_rows)
+            print("%-8s %12.2f %10.2f %8d %8.2f" % (name, n / elapsed / 1e6, elapsed, frames, cpu))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
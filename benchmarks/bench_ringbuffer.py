@@ -0,0 +1,64 @@
+"""
+Per-frame read cost of RingBuffer vs MirrorRingBuffer once
+the buffer has wrapped, at the default --max-pts size, and
+separate x/y buffers vs one ColumnRingBuffer.
+
+Usage: python bench_ringbuffer.py [max_pts]
+
+"""
+import sys
+import timeit
+
+import numpy as np
+
+from simplertplot import queues
+
+
+def make_wrapped(kls, max_pts, batch):
+    rb = kls(max_pts)
+    data = np.arange(batch, dtype=np.float64)
+    for _ in range(max_pts // batch + 1):
+        rb.put_list(data)
+    return rb, data
+
+
+def bench(kls, max_pts, batch=1000, number=200):
+    rb, data = make_wrapped(kls, max_pts, batch)
+    t_get = min(timeit.repeat(rb.get, number=number, repeat=5)) / number
+    t_put = min(timeit.repeat(lambda: rb.put_list(data), number=number, repeat=5)) / number
+    return t_get, t_put
+
+
+def bench_xy(max_pts, batch=1000, number=200):
+    x = np.arange(batch, dtype=np.float64)
+    y = np.arange(batch, dtype=np.float64)
+    xq = queues.MirrorRingBuffer(max_pts)
+    yq = queues.MirrorRingBuffer(max_pts)
+    xyq = queues.ColumnRingBuffer(max_pts, 2)
+
+    def put_separate():
+        xq.put_list(x)
+        yq.put_list(y)
+
+    def put_paired():
+        xyq.put_list((x, y))
+
+    t_sep = min(timeit.repeat(put_separate, number=number, repeat=5)) / number
+    t_pair = min(timeit.repeat(put_paired, number=number, repeat=5)) / number
+    return t_sep, t_pair
+
+
+def main(max_pts=300000):
+    print("max_pts=%d, 2 buffers (x, y) per frame" % max_pts)
+    print("%-20s %14s %18s" % ("class", "get/frame (us)", "put_list/1k (us)"))
+    for kls in (queues.RingBuffer, queues.MirrorRingBuffer):
+        t_get, t_put = bench(kls, max_pts)
+        print("%-20s %14.1f %18.1f" % (kls.__name__, 2 * t_get * 1e6, t_put * 1e6))
+    t_sep, t_pair = bench_xy(max_pts)
+    print()
+    print("x/y put_list of 1k points: 2 x MirrorRingBuffer %.1fus, ColumnRingBuffer %.1fus" %
+          (t_sep * 1e6, t_pair * 1e6))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
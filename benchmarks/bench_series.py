@@ -0,0 +1,94 @@
+"""
+CPU time and memory of plotting N channels as N separate XYPlotters,
+as N RTPlot instances would, vs one MultiXYPlotter of N series.
+Every frame, each channel gets new points through the binary wire
+format and ingest(), and is drawn with Agg.
+
+Both run in this process, so the N - 1 extra interpreters, sockets
+and windows of separate RTPlots aren't included. The resident size
+of a process that has only imported the plotter is measured
+separately, as a lower bound on that cost.
+
+Usage: python bench_series.py [nseries] [frames] [pts_per_frame] [max_pts]
+
+"""
+import io
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+
+from simplertplot import plots
+from simplertplot import transport
+from simplertplot.protocols import BaseProtocol, BinarySerializer
+
+
+def feed(plotter, cols, serializer):
+    raw = serializer.dumps((BaseProtocol.OP_NP_XLYL, cols))
+    client = plotter.client
+    client.ingest(*client.deserialize(io.BytesIO(raw)))
+
+
+def run(nseries, frames, pts_per_frame, max_pts, multi):
+    tracemalloc.start()
+    if multi:
+        plotters = [plots.MultiXYPlotter(transport.BaseTransport(), max_pts, serial_method='binary',
+                                         nseries=nseries)]
+    else:
+        plotters = [plots.XYPlotter(transport.BaseTransport(), max_pts, serial_method='binary')
+                    for _ in range(nseries)]
+    for p in plotters:
+        p.setup_pyplot()
+        p.setup_blit()
+    serializer = BinarySerializer()
+    rng = np.random.RandomState(0)
+    y0 = np.zeros(nseries)
+    nbytes = 0
+
+    start = time.process_time()
+    for i in range(frames):
+        x = np.arange(i * pts_per_frame, (i + 1) * pts_per_frame, dtype=np.float64)
+        ys = y0[:, None] + np.cumsum(rng.randn(nseries, pts_per_frame), axis=1)
+        y0 = ys[:, -1]
+        if multi:
+            feed(plotters[0], [x] + list(ys), serializer)
+        else:
+            for p, y in zip(plotters, ys):
+                feed(p, [x, y], serializer)
+        for p in plotters:
+            p.draw_frame()
+    cpu = time.process_time() - start
+
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    for p in plotters:
+        nbytes += p.xy_queue.get().nbytes
+        p.clear_pyplot()
+    return cpu / frames, peak, nbytes
+
+
+def process_rss():
+    """ Max resident size, in bytes, of a process that only imports the plotter """
+    subprocess.check_call([sys.executable, "-c", "import matplotlib; matplotlib.use('Agg');"
+                                                 "import simplertplot.plots"])
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+
+
+def main(nseries=20, frames=100, pts_per_frame=100, max_pts=100000):
+    print("%d series, %d frames of %d points each, max_pts=%d" % (nseries, frames, pts_per_frame, max_pts))
+    print("%-22s %16s %16s %14s" % ("", "cpu/frame (ms)", "peak alloc (MB)", "buffers (MB)"))
+    for name, multi in (("%d XYPlotters" % nseries, False), ("1 MultiXYPlotter", True)):
+        cpu, peak, nbytes = run(nseries, frames, pts_per_frame, max_pts, multi)
+        print("%-22s %16.2f %16.1f %14.1f" % (name, cpu * 1e3, peak / 1e6, nbytes / 1e6))
+    rss = process_rss()
+    print()
+    print("each extra plot process: at least %.1f MB resident, %d of them are saved" % (rss / 1e6, nseries - 1))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,84 @@
+"""
+Time to first frame of a new plot: from asking for it until the
+plot has drawn and answered an RPC, which it only does from inside
+its frame loop. Plots are opened
+
+    standalone  as a new process per plot, spawn_standalone()
+    cold        in a new server process, new_plot(shared=False)
+                with no pool
+    warm        in a server process from the pool, started and
+                handshaken beforehand
+    shared      in the already running shared server process
+
+The default 'headless' plot renders with Agg and writes its frames
+to a temporary directory; pass 'xyplotter' to time real windows.
+
+Usage: python bench_startup.py [runs] [plot]
+
+"""
+import os
+import queue
+import socket
+import sys
+import tempfile
+import time
+
+from simplertplot import manager
+from simplertplot import protocols
+
+
+def proto_factory():
+    return protocols.XYUserProtocol(queue.Queue(), 'binary')
+
+
+def free_addr():
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        return s.getsockname()
+
+
+def first_frame(m, open_plot):
+    """ Seconds until a plot opened by open_plot() answers an RPC """
+    start = time.perf_counter()
+    p = open_plot()
+    m.run_protocol(p)
+    p.put_rpc("test_rpc", "").result(60)
+    elapsed = time.perf_counter() - start
+    m.stop_protocol(p)
+    p.transport.sock.shutdown(socket.SHUT_RDWR)
+    p.transport.close()
+    return elapsed
+
+
+def bench(mode, plot):
+    m = manager.UserManager(pool_size=1 if mode == 'warm' else 0)
+    try:
+        if mode == 'standalone':
+            return first_frame(m, lambda: m.spawn_standalone(free_addr(), plot, 'ggplot', 1000, 'tcp',
+                                                             proto_factory, 'binary'))
+        elif mode == 'warm':
+            m._accept_servers(True)  # the pool's server has finished starting
+        elif mode == 'shared':
+            m.get_server()
+        return first_frame(m, lambda: m.new_plot(plot, 'ggplot', 1000, 'tcp', proto_factory, 'binary',
+                                                 shared=mode == 'shared'))
+    finally:
+        m.kill_all()
+        if mode == 'standalone':
+            m.popen.kill()
+            m.popen.wait()
+
+
+def main(runs=5, plot='headless'):
+    runs = int(runs)
+    print("time to first frame of a '%s' plot, best and mean of %d runs" % (plot, runs))
+    print("%-12s %10s %10s" % ("", "best (ms)", "mean (ms)"))
+    with tempfile.TemporaryDirectory() as d:
+        os.chdir(d)  # headless frames are written to the plot process' cwd
+        for mode in ('standalone', 'cold', 'warm', 'shared'):
+            times = [bench(mode, plot) for _ in range(runs)]
+            print("%-12s %10.1f %10.1f" % (mode, min(times) * 1e3, sum(times) / runs * 1e3))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,99 @@
+"""
+Sustained producer -> plotter throughput over loopback tcp, with
+both protocols driven by their own event loops in this process.
+The producer calls put_xy() as fast as it can; the rate is the
+number of points ingested by the plotter protocol per second.
+
+Also reports the CPU time both loops burn while the plot is idle.
+
+Usage: python bench_throughput.py [seconds]
+
+"""
+import queue
+import sys
+import threading
+import time
+
+from simplertplot import eventloop
+from simplertplot import protocols
+from simplertplot import transport
+from simplertplot.queues import ColumnRingBuffer
+
+
+def connect(con_type='tcp'):
+    server = transport.get_server_class(con_type)('localhost', 0)
+    user_tp = transport.get_transport_class(con_type).from_address(server.get_addr())
+    plot_tp = server.accept_connection2()
+    server.close()
+    return user_tp, plot_tp
+
+
+def start_protocols(serial_method, **user_kw):
+    user_tp, plot_tp = connect()
+    q = queue.Queue(10000)
+    user = protocols.XYUserProtocol(q, serial_method, **user_kw)
+    plotter = protocols.XYPlotterProtocol(ColumnRingBuffer(300000, 2), queue.Queue(), queue.Queue(),
+                                          serial_method)
+    user.connection_made(user_tp)
+    plotter.connection_made(plot_tp)
+    user_loop = eventloop.ThreadedEventLoop()
+    plot_loop = eventloop.ThreadedEventLoop()
+    user.attach(user_loop)
+    plotter.attach(plot_loop)
+    return user, plotter, user_loop, plot_loop
+
+
+def bench_idle(seconds):
+    user, plotter, user_loop, plot_loop = start_protocols('binary')
+    time.sleep(0.2)
+    start_cpu = time.process_time()
+    time.sleep(seconds)
+    used = time.process_time() - start_cpu
+    user_loop.stop()
+    plot_loop.stop()
+    return used / seconds
+
+
+def bench(seconds, serial_method, **user_kw):
+    user, plotter, user_loop, plot_loop = start_protocols(serial_method, **user_kw)
+
+    stop = threading.Event()
+    received = 0
+
+    def produce():
+        x = 0
+        put_xy = user.put_xy
+        while not stop.is_set():
+            put_xy(x, x)
+            x += 1
+
+    producer = threading.Thread(None, produce, daemon=True)
+    producer.start()
+    time.sleep(0.5)
+    with plotter.lock_queue():
+        plotter.current_update = 0
+    start = time.perf_counter()
+    time.sleep(seconds)
+    with plotter.lock_queue():
+        received = plotter.current_update
+    elapsed = time.perf_counter() - start
+    stop.set()
+    user_loop.stop()
+    plot_loop.stop()
+    return received / elapsed
+
+
+def main(seconds=3):
+    print("%-52s %12s" % ("configuration", "kpts/s"))
+    for serial_method in ('pickle', 'binary'):
+        for name, kw in (("1 message per step", dict(max_step_msgs=1, max_latency=0)),
+                         ("drain per step, no batching delay", dict(max_latency=0)),
+                         ("drain per step, 10ms batching", dict())):
+            rate = bench(seconds, serial_method, **kw)
+            print("%-52s %12.1f" % ("%s, %s" % (serial_method, name), rate / 1e3))
+    print()
+    print("idle CPU: %.1f%% of a core" % (100 * bench_idle(seconds)))
+
+
+if __name__ == '__main__':
+    main(*map(float, sys.argv[1:]))
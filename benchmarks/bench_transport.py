@@ -0,0 +1,59 @@
+"""
+Round trip latency and CPU cost of the tcp and unix transports,
+using the _UserEchoPlot ping against a spawned echo plot.
+
+Usage: python bench_transport.py [npings] [msg_size]
+
+"""
+import resource
+import sys
+import time
+
+from simplertplot import transport
+from simplertplot import userplot
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def bench(con_type, npings, msg):
+    echo = userplot._UserEchoPlot(con_type)
+    echo.show()
+    for _ in range(100):  # warm up
+        echo.ping(msg)
+
+    times = []
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = time.process_time()
+    for _ in range(npings):
+        start = time.perf_counter()
+        sent, received = echo.ping(msg)
+        times.append(time.perf_counter() - start)
+        assert sent == received
+    cpu = time.process_time() - cpu
+    echo.stop()
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # includes the echo process startup, so only comparable across transports
+    child_cpu = (after.ru_utime + after.ru_stime) - (children.ru_utime + children.ru_stime)
+    return times, cpu, child_cpu
+
+
+def main(npings=20000, msg_size=64):
+    msg = b'x' * msg_size
+    print("%d pings of %d bytes" % (npings, msg_size))
+    print("%-6s %10s %10s %10s %16s %16s" % ("proto", "mean (us)", "p50 (us)", "p99 (us)",
+                                            "user cpu/ping", "echo cpu total"))
+    for con_type in ('tcp', 'unix'):
+        if con_type not in transport._transport_classes:
+            print("%-6s not available on this platform" % con_type)
+            continue
+        times, cpu, child_cpu = bench(con_type, npings, msg)
+        print("%-6s %10.1f %10.1f %10.1f %14.1fus %15.2fs" % (
+            con_type, sum(times) / len(times) * 1e6, percentile(times, 50) * 1e6,
+            percentile(times, 99) * 1e6, cpu / npings * 1e6, child_cpu))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
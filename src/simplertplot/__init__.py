@@ -27,4 +27,7 @@ from . import transport
 from . import manager
 from . import userplot
 from . import plots
+from . import aio
+from . import archive
+from . import replay
 
@@ -0,0 +1,331 @@
+"""
+asyncio backend, an alternative to manager.BaseManager and the
+ThreadedEventLoop driven protocols. Any number of plots and RPCs
+can share one asyncio loop, which can be the application's own.
+
+Only the binary wire format is supported, since frames have to be
+reassembled from whatever chunks data_received() is handed. It is
+the same format XYUserProtocol and XYPlotterProtocol speak with
+serial_method='binary', so either side can talk to the other.
+
+"""
+import asyncio
+import subprocess
+import threading
+import time
+
+import numpy as np
+
+from simplertplot import manager
+from simplertplot import transport
+from simplertplot.protocols import BaseProtocol, BinarySerializer, RPCRequest, XYPlotterProtocol, _XYBatch
+
+import logging
+logger = logging.getLogger(__name__)
+_h = logging.StreamHandler()
+_f = logging.Formatter("%(created)s %(name)s %(levelname)s (%(lineno)s): %(message)s")
+_h.setFormatter(_f)
+logger.addHandler(_h)
+logger.propagate = False
+logger.setLevel(logging.DEBUG)
+del _h, _f
+
+
+class _ViewReader():
+    """ The read() / readinto() subset of a file that
+    BinarySerializer.load() needs, over a memoryview.
+    """
+    def __init__(self, view):
+        self._view = view
+        self._pos = 0
+
+    def read(self, n):
+        data = self._view[self._pos:self._pos + n].tobytes()
+        self._pos += len(data)
+        return data
+
+    def readinto(self, b):
+        n = min(len(b), len(self._view) - self._pos)
+        b[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+
+class FrameBuffer():
+    """ Reassembles binary frames from arbitrarily split chunks """
+    _header = BinarySerializer._header
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._serializer = BinarySerializer()
+
+    def feed(self, data):
+        """ Add received bytes and yield each complete (op, data) message.
+        As with BinarySerializer.load(), each message is only valid
+        until the next one is yielded.
+        """
+        buf = self._buf
+        buf += data
+        pos = 0
+        hsize = self._header.size
+        try:
+            while len(buf) - pos >= hsize:
+                nbytes, op, ncols, count = self._header.unpack_from(buf, pos)
+                end = pos + hsize + ncols + nbytes
+                if len(buf) < end:
+                    break
+                with memoryview(buf) as view:
+                    msg = self._serializer.load(_ViewReader(view[pos:end]))
+                pos = end
+                yield msg
+        finally:
+            del buf[:pos]
+
+
+class AioXYUserProtocol(asyncio.Protocol):
+    """ User side protocol. put_* must be called from the loop's
+    thread; points are coalesced into OP_NP_XLYL frames as with
+    XYUserProtocol, and put_rpc() returns an awaitable future.
+    """
+    _dtype = BaseProtocol._NP_DTYPE
+
+    def __init__(self, max_batch=65536, max_latency=0.01, nseries=1, dtype=BaseProtocol._NP_DTYPE):
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.transport = None
+        self.loop = None
+        self._serializer = BinarySerializer()
+        self._frames = FrameBuffer()
+        self.nseries = nseries
+        self.dtype = np.dtype(dtype)
+        self._batch = _XYBatch(nseries + 1, self.dtype)
+        self._flush_handle = None
+        self._pending_futures = {}
+        self._paused = False
+        self._drain_waiters = []
+        self.closed = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.loop = asyncio.get_running_loop()
+        self.closed = self.loop.create_future()
+
+    def connection_lost(self, exc):
+        for fut in self._pending_futures.values():
+            if not fut.done():
+                fut.set_exception(ConnectionError("Connection lost"))
+        self._pending_futures.clear()
+        self._wake_drain_waiters()
+        if not self.closed.done():
+            self.closed.set_result(exc)
+
+    def pause_writing(self):
+        self._paused = True
+
+    def resume_writing(self):
+        self._paused = False
+        self._wake_drain_waiters()
+
+    def _wake_drain_waiters(self):
+        waiters, self._drain_waiters = self._drain_waiters, []
+        for w in waiters:
+            if not w.done():
+                w.set_result(None)
+
+    async def drain(self):
+        """ Wait until the transport's write buffer is below its
+        high-water mark. Producers that can outrun the plot should
+        await this now and then.
+        """
+        if self._paused and not self.transport.is_closing():
+            w = self.loop.create_future()
+            self._drain_waiters.append(w)
+            await w
+
+    def data_received(self, data):
+        for op, msg in self._frames.feed(data):
+            if op == BaseProtocol.OP_RPC:
+                fut = self._pending_futures.pop(msg.id, None)
+                if fut is None or fut.done():
+                    continue
+                if msg.exc:
+                    fut.set_exception(msg.exc)
+                else:
+                    fut.set_result(msg.value)
+            else:
+                logger.error("Unsupported op: %d", op)
+
+    def _write(self, msg):
+        self.transport.write(self._serializer.dumps(msg))
+
+    def _add(self, op, data):
+        self._batch.add(op, data)
+        if self._batch.n >= self.max_batch:
+            self.flush()
+        elif self._flush_handle is None:
+            self._flush_handle = self.loop.call_later(self.max_latency, self.flush)
+
+    def flush(self):
+        """ Send any points held back for batching """
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._batch.n:
+            self._write((BaseProtocol.OP_NP_XLYL, self._batch.take()))
+
+    def put_rpc(self, func_name, *args, **kwargs):
+        req = RPCRequest(func_name, args, kwargs)
+        fut = self.loop.create_future()
+        self._pending_futures[req.id] = fut
+        self.flush()  # keep the request ordered after the data before it
+        self._write((BaseProtocol.OP_RPC, req))
+        return fut
+
+    def _check_single_series(self):
+        if self.nseries != 1:
+            raise ValueError("Plot has %d series, use put_series()" % self.nseries)
+
+    def put_xy(self, x, y):
+        self._check_single_series()
+        self._add(BaseProtocol.OP_XY, (x, y))
+
+    def put_xyl(self, xyl):
+        self._check_single_series()
+        self._add(BaseProtocol.OP_XYL, xyl)
+
+    def put_xlyl(self, xl, yl):
+        self._check_single_series()
+        self._add(BaseProtocol.OP_XLYL, (xl, yl))
+
+    def put_np_xyl(self, np_xyl):
+        self._check_single_series()
+        self._add(BaseProtocol.OP_NP_XYL, np.asarray(np_xyl, self._dtype).tobytes())
+
+    def put_np_xlyl(self, npxl, npyl):
+        self._check_single_series()
+        xd = np.array(npxl, self._dtype)
+        yd = np.array(npyl, self.dtype)
+        self._add(BaseProtocol.OP_NP_XLYL, (xd, yd))
+
+    def put_series(self, x, ys):
+        """ Put points of every series at once, see XYUserProtocol.put_series() """
+        if len(ys) != self.nseries:
+            raise ValueError("Expected %d series, got %d" % (self.nseries, len(ys)))
+        cols = [np.array(x, self._dtype)]
+        cols.extend(np.array(y, self.dtype) for y in ys)
+        self._add(BaseProtocol.OP_NP_XLYL, tuple(cols))
+
+    def close(self):
+        """ Flush and close the connection """
+        self.flush()
+        self.transport.close()
+
+
+class AioXYPlotterProtocol(XYPlotterProtocol, asyncio.Protocol):
+    """ Plotter side protocol, a drop-in for XYPlotterProtocol whose
+    reads are driven by data_received() instead of an event loop
+    thread. respond() may be called from any thread.
+    """
+
+    def __init__(self, xyq, rpc_req, rpc_rsp, compact_x=False):
+        super().__init__(xyq, rpc_req, rpc_rsp, 'binary', compact_x=compact_x)
+        self._frames = FrameBuffer()
+        self._aio_loop = None
+
+    def connection_made(self, transport):
+        super().connection_made(transport)
+        self._aio_loop = asyncio.get_running_loop()
+
+    def data_received(self, data):
+        for code, msg in self._frames.feed(data):
+            if code == self.OP_EXIT:
+                self.transport.close()
+                self._finish()
+                return
+            elif code == self.OP_RPC:
+                self.put_request(msg)
+            else:
+                self.ingest(code, msg)
+
+    def connection_lost(self, exc):
+        self._finish()
+
+    def attach(self, loop):
+        pass  # driven by the asyncio loop the connection belongs to
+
+    def detach(self):
+        pass
+
+    def respond(self, rsp):
+        self._aio_loop.call_soon_threadsafe(self._write_response, rsp)
+
+    def _write_response(self, rsp):
+        if not self.transport.is_closing():
+            self.transport.write(self._dump_response(rsp))
+
+
+class AioManager():
+    """ asyncio counterpart to manager.UserManager / BaseManager.
+
+    Runs its own loop in a daemon thread, unless given the
+    application's loop to share. Coroutines can be awaited on
+    that loop, or run from other threads with run().
+    """
+
+    def __init__(self, loop=None):
+        self.thread = None
+        if loop is None:
+            loop = asyncio.new_event_loop()
+            self.thread = threading.Thread(None, loop.run_forever, "RTPlotAsyncioThread", daemon=True)
+            self.thread.start()
+        self.loop = loop
+        self.popens = []
+
+    def run(self, coro, timeout=None):
+        """ Run coro in the manager's loop from another thread
+        and return its result.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def call(self, f, *args):
+        """ Call f(*args) in the loop thread, eg a protocol's put_* """
+        self.loop.call_soon_threadsafe(f, *args)
+
+    async def connect(self, addr, proto_factory=AioXYUserProtocol, mproto='tcp', timeout=10):
+        """ Connect to a plot server, retrying until it is up.
+        Returns the protocol.
+        """
+        end = time.time() + timeout
+        while True:
+            try:
+                if mproto == 'tcp':
+                    _, proto = await self.loop.create_connection(proto_factory, *addr)
+                elif mproto == 'unix':
+                    _, proto = await self.loop.create_unix_connection(proto_factory,
+                                                                      transport.unix_socket_path(addr))
+                else:
+                    raise ValueError("Unsupported protocol for asyncio: %r" % mproto)
+                return proto
+            except (ConnectionRefusedError, FileNotFoundError):
+                if time.time() > end:
+                    raise
+                await asyncio.sleep(0.01)
+
+    async def create_server(self, addr, proto_factory, mproto='tcp'):
+        """ Serve proto_factory() connections, in place of
+        transport.TCPServer / UnixServer.
+        """
+        if mproto == 'tcp':
+            return await self.loop.create_server(proto_factory, *addr)
+        elif mproto == 'unix':
+            return await self.loop.create_unix_server(proto_factory, transport.unix_socket_path(addr))
+        raise ValueError("Unsupported protocol for asyncio: %r" % mproto)
+
+    async def spawn_standalone(self, addr, plot, style, max_pts, mproto='tcp', proto_factory=AioXYUserProtocol,
+                               fps=30, nseries=1):
+        """ Spawn a standalone plot process, as UserManager.spawn_standalone()
+        does, and connect to it.
+        """
+        cmd = manager._standalone_cmd(addr, plot, style, max_pts, mproto, 'binary', fps, nseries)
+        self.popens.append(subprocess.Popen(cmd))
+        return await self.connect(addr, proto_factory, mproto)
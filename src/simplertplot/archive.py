@@ -0,0 +1,368 @@
+"""
+Append-only on-disk history of a plot's rows, kept behind the ring
+buffer so that rows it overwrites aren't lost.
+
+An archive is a directory of fixed size chunk files, each a .npy
+array of shape (ncols, chunk_rows) that is memory mapped to write
+and read, and a small index of the first and last x and the number
+of rows of each chunk. x (column 0) is taken to be non-decreasing,
+as time is, so any range of it is found by a binary search of the
+index and then of the x column of the chunks it covers, without
+reading the rest of the archive.
+
+"""
+import collections
+import os
+import threading
+import time
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+import logging
+logger = logging.getLogger(__name__)
+_h = logging.StreamHandler()
+_f = logging.Formatter("%(created)s %(name)s %(levelname)s (%(lineno)s): %(message)s")
+_h.setFormatter(_f)
+logger.addHandler(_h)
+logger.propagate = False
+logger.setLevel(logging.DEBUG)
+del _h, _f
+
+
+class ColumnArchive():
+    """ Chunked, memory mapped column store, see the module docstring.
+
+    Opened with mode 'a', the archive is created if needed and rows
+    are appended after any already in it; with mode 'r' it's only
+    read, and the number of columns, dtype and chunk size are those
+    it was written with. One process may append while others read,
+    but readers in other processes only see rows up to the last
+    flush() as of when they opened it. append() flushes every
+    flush_rows rows or flush_interval seconds, whichever comes
+    first, so at most that many rows are lost if the writer dies.
+    """
+    _index_name = "index.npy"
+    _chunk_name = "chunk_%06d.npy"
+    _index_dtype = np.dtype([('start', np.float64), ('stop', np.float64), ('rows', np.int64)])
+
+    def __init__(self, path, ncols=2, dtype=np.float64, chunk_rows=1 << 20, mode='a',
+                 flush_rows=1 << 16, flush_interval=1.0):
+        if mode not in ('a', 'r'):
+            raise ValueError("Unknown mode: %r" % mode)
+        self.path = path
+        self.mode = mode
+        self.ncols = ncols
+        self.dtype = np.dtype(dtype)
+        self.chunk_rows = chunk_rows
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self._unflushed = 0
+        self._flushed_at = time.monotonic()
+        self._lock = threading.RLock()
+        self._index = np.zeros(0, self._index_dtype)
+        self._maps = {}  # chunk number -> memmap
+        self._chunk = None  # memmap of the chunk being written
+
+        index_path = os.path.join(path, self._index_name)
+        if os.path.exists(index_path):
+            self._index = np.load(index_path)
+            if len(self._index):
+                first = self._open_chunk(0)
+                self.ncols, self.chunk_rows = first.shape
+                self.dtype = first.dtype
+        elif mode == 'r':
+            raise FileNotFoundError("No archive at %s" % path)
+        else:
+            os.makedirs(path, exist_ok=True)
+            self._write_index()
+
+        if mode == 'a' and len(self._index) and self._index['rows'][-1] < self.chunk_rows:
+            self._chunk = self._open_chunk(len(self._index) - 1, 'r+')
+
+    def __len__(self):
+        return int(self._index['rows'].sum())
+
+    @property
+    def nchunks(self):
+        return len(self._index)
+
+    def _chunk_path(self, i):
+        return os.path.join(self.path, self._chunk_name % i)
+
+    def _open_chunk(self, i, mode='r'):
+        m = self._maps.get(i)
+        if m is None or (mode == 'r+' and m.mode != 'r+'):
+            m = self._maps[i] = np.load(self._chunk_path(i), mmap_mode=mode)
+        return m
+
+    def _new_chunk(self):
+        if self._chunk is not None:
+            self._chunk.flush()
+        i = len(self._index)
+        self._chunk = self._maps[i] = open_memmap(self._chunk_path(i), 'w+', self.dtype,
+                                                  (self.ncols, self.chunk_rows))
+        self._index = np.append(self._index, np.zeros(1, self._index_dtype))
+        # the index only changes shape when a chunk is added, which is
+        # when readers in other processes need it to find the new file
+        self._write_index()
+
+    def _write_index(self):
+        path = os.path.join(self.path, self._index_name)
+        tmp = path + ".tmp"
+        with open(tmp, 'wb') as f:
+            np.save(f, self._index)
+        os.replace(tmp, path)
+
+    def append(self, cols):
+        """ Append rows given as a sequence of ncols columns """
+        if self.mode != 'a':
+            raise ValueError("Archive opened read only")
+        if len(cols) != self.ncols:
+            raise ValueError("Expected %d columns, got %d" % (self.ncols, len(cols)))
+        n = len(cols[0])
+        pos = 0
+        with self._lock:
+            index = self._index
+            while pos < n:
+                if self._chunk is None or index['rows'][-1] == self.chunk_rows:
+                    self._new_chunk()
+                    index = self._index
+                row = int(index['rows'][-1])
+                k = min(n - pos, self.chunk_rows - row)
+                for dst, src in zip(self._chunk, cols):
+                    dst[row:row + k] = src[pos:pos + k]
+                if row == 0:
+                    index['start'][-1] = cols[0][pos]
+                index['stop'][-1] = cols[0][pos + k - 1]
+                index['rows'][-1] += k
+                pos += k
+            self._unflushed += n
+            if (self._unflushed >= self.flush_rows or
+                    time.monotonic() - self._flushed_at >= self.flush_interval):
+                self.flush()
+
+    def flush(self):
+        """ Write mapped rows and the index out to disk """
+        with self._lock:
+            if self._chunk is not None:
+                self._chunk.flush()
+            if self.mode == 'a':
+                self._write_index()
+            self._unflushed = 0
+            self._flushed_at = time.monotonic()
+
+    def close(self):
+        self.flush()
+        self._chunk = None
+        self._maps.clear()
+
+    def time_range(self):
+        """ (first x, last x), or None if the archive is empty """
+        with self._lock:
+            index = self._index
+            if not len(index) or not index['rows'][-1]:
+                return None
+            return float(index['start'][0]), float(index['stop'][-1])
+
+    def chunk(self, i):
+        """ Read only view of the rows of chunk i, shape (ncols, rows) """
+        with self._lock:
+            rows = int(self._index['rows'][i])
+            return self._open_chunk(i)[:, :rows]
+
+    def iter_chunks(self, start=0):
+        """ Yield a view of each chunk's rows, from chunk start on """
+        for i in range(start, self.nchunks):
+            yield self.chunk(i)
+
+    def read(self, start, stop):
+        """ Copy of rows [start, stop), shape (ncols, stop - start) """
+        stop = min(stop, len(self))
+        start = min(max(start, 0), stop)
+        out = np.empty((self.ncols, stop - start), self.dtype)
+        cr = self.chunk_rows
+        pos = start
+        while pos < stop:
+            i, j = divmod(pos, cr)
+            k = min(stop - pos, cr - j)
+            out[:, pos - start:pos - start + k] = self.chunk(i)[:, j:j + k]
+            pos += k
+        return out
+
+    def find(self, t0, t1):
+        """ Row range [start, stop) with t0 <= x <= t1 """
+        with self._lock:
+            return self._find(t0, t1)
+
+    def _find(self, t0, t1):
+        index = self._index
+        cr = self.chunk_rows
+        # chunks that can hold t0 and t1, then the rows within them
+        i0 = int(np.searchsorted(index['stop'], t0, 'left'))
+        i1 = int(np.searchsorted(index['start'], t1, 'right')) - 1
+        if i0 >= len(index) or i1 < i0:
+            return 0, 0
+        start = i0 * cr + int(np.searchsorted(self.chunk(i0)[0], t0, 'left'))
+        stop = i1 * cr + int(np.searchsorted(self.chunk(i1)[0], t1, 'right'))
+        return start, max(start, stop)
+
+    def read_time(self, t0, t1):
+        """ Copy of the rows with t0 <= x <= t1 """
+        return self.read(*self.find(t0, t1))
+
+
+class ScrollbackLoader():
+    """ Serves ranges of an archive to a plot's history view from a
+    thread, so the render loop never waits on the disk.
+
+    The plot request()s the x range it's showing and take()s results
+    when they're ready; only the newest request is worked on. Ranges
+    are reduced to min/max envelopes like LODColumnRingBuffer's, from
+    a per-chunk pyramid of blocks of `block` rows, `factor` times
+    larger at each level up. The levels of the chunks used last are
+    kept in an LRU cache of cache_size entries; raw rows are read
+    straight from the chunk's memory map.
+    """
+
+    def __init__(self, archive, cache_size=64, block=64, factor=8, wake=None):
+        """
+        :type archive: ColumnArchive
+        :param wake: event set whenever a result is ready
+        :type wake: threading.Event
+        """
+        self.archive = archive
+        self.cache_size = cache_size
+        self.factor = factor
+        self.wake = wake
+        self.sizes = []  # block size of each level from 1 up, dividing chunk_rows
+        size = block
+        while size <= archive.chunk_rows and archive.chunk_rows % size == 0:
+            self.sizes.append(size)
+            size *= factor
+        self.hits = 0
+        self.misses = 0
+        self._cache = collections.OrderedDict()  # (chunk, level) -> (rows, mins, maxs)
+        self._cond = threading.Condition()
+        self._request = None
+        self._result = None
+        self._closed = False
+        self._thread = None
+
+    def request(self, x0, x1, nbins):
+        """ Ask for rows with x0 <= x <= x1, reduced to no less than
+        nbins blocks. Replaces any request not yet started.
+        """
+        with self._cond:
+            self._request = (x0, x1, int(nbins))
+            if self._thread is None:
+                self._thread = threading.Thread(None, self._run, "ScrollbackThread", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def take(self):
+        """ The newest ((x0, x1, nbins), data) result not taken
+        yet, or None.
+        """
+        with self._cond:
+            result, self._result = self._result, None
+        return result
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        cond = self._cond
+        while True:
+            with cond:
+                while self._request is None and not self._closed:
+                    cond.wait()
+                if self._closed:
+                    return
+                req, self._request = self._request, None
+            try:
+                data = self.fetch(*req)
+            except Exception:
+                logger.exception("Error loading scrollback %r", req)
+                continue
+            with cond:
+                self._result = req, data
+            if self.wake is not None:
+                self.wake.set()
+
+    def fetch(self, x0, x1, nbins):
+        """ Rows with x0 <= x <= x1, reduced to the min and max of each
+        block of the coarsest level that still has nbins blocks in
+        the range, as an (ncols, n) array. Each block becomes two
+        rows, (mins) then (maxs), between the raw rows at either end
+        of each chunk.
+        """
+        start, stop = self.archive.find(x0, x1)
+        k = 0
+        for i, size in enumerate(self.sizes):
+            if (stop - start) // size < nbins:
+                break
+            k = i + 1
+        cr = self.archive.chunk_rows
+        parts = []
+        for c in range(start // cr, -(-stop // cr)):
+            lo = max(start - c * cr, 0)
+            hi = min(stop - c * cr, cr)
+            if k:
+                self._reduced_part(c, k, lo, hi, parts)
+            else:
+                parts.append(self.archive.chunk(c)[:, lo:hi])
+        if not parts:
+            return np.empty((self.archive.ncols, 0), self.archive.dtype)
+        return np.concatenate(parts, axis=1)
+
+    def _reduced_part(self, c, k, lo, hi, parts):
+        # rows [lo, hi) of chunk c, as envelope blocks of level k
+        size = self.sizes[k - 1]
+        rows, mins, maxs = self._level(c, k)
+        j0 = -(-lo // size)
+        j1 = min(hi, rows) // size
+        if j1 <= j0:
+            parts.append(self.archive.chunk(c)[:, lo:hi])
+            return
+        body = np.empty((mins.shape[0], 2 * (j1 - j0)), mins.dtype)
+        body[:, 0::2] = mins[:, j0:j1]
+        body[:, 1::2] = maxs[:, j0:j1]
+        chunk = self.archive.chunk(c)
+        parts.append(chunk[:, lo:j0 * size])
+        parts.append(body)
+        parts.append(chunk[:, j1 * size:hi])
+
+    def _level(self, c, k):
+        """ (rows, mins, maxs) of the full blocks of level k of chunk c,
+        as of when it had rows rows.
+        """
+        key = c, k
+        rows = self.archive.chunk(c).shape[1]
+        entry = self._cache.get(key)
+        if entry is not None and entry[0] == rows:
+            self.hits += 1
+            self._cache.move_to_end(key)
+            return entry
+        self.misses += 1
+        size = self.sizes[k - 1]
+        if k == 1:
+            data = self.archive.chunk(c)
+            n = rows // size
+            blocks = data[:, :n * size].reshape(data.shape[0], n, size)
+            mins = np.fmin.reduce(blocks, axis=2)
+            maxs = np.fmax.reduce(blocks, axis=2)
+        else:
+            _, bmins, bmaxs = self._level(c, k - 1)
+            n = rows // size
+            shape = bmins.shape[0], n, self.factor
+            mins = np.fmin.reduce(bmins[:, :n * self.factor].reshape(shape), axis=2)
+            maxs = np.fmax.reduce(bmaxs[:, :n * self.factor].reshape(shape), axis=2)
+        entry = self._cache[key] = rows, mins, maxs
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(False)
+        return entry
@@ -0,0 +1,75 @@
+"""
+Render-side decimation. A line can't show more than one vertical
+span per pixel column, so drawing more points than that only costs
+time. minmax_decimate() keeps the min and max point in each column,
+which draws the same envelope with every spike intact.
+
+"""
+import numpy as np
+
+
+def is_monotonic(x):
+    """ True if x never decreases """
+    return len(x) < 2 or bool(np.all(x[1:] >= x[:-1]))
+
+
+def _first_match(a, targets, starts, counts, default):
+    """ Index of the first element of each segment of a equal to its
+    segment's target, or default where there is none (all NaN).
+    """
+    pos = np.flatnonzero(a == np.repeat(targets, counts))
+    seg = np.searchsorted(starts, pos, 'right') - 1
+    first = np.ones(len(pos), bool)
+    first[1:] = seg[1:] != seg[:-1]
+    out = default.copy()
+    out[seg[first]] = pos[first]
+    return out
+
+
+def minmax_decimate(x, y, nbins):
+    """ Reduce (x, y) to at most 2 * nbins + 2 points: the min and max
+    of y in each of nbins evenly spaced bins of x, in their original
+    order, plus the end points so the data's extent doesn't change.
+
+    x must be monotonic; other data is returned unchanged, as is data
+    already small enough. Returned arrays never alias the inputs'
+    memory unless returned unchanged.
+
+    :param x: x data
+    :type x: np.ndarray
+    :param y: y data
+    :type y: np.ndarray
+    :param nbins: number of bins, ie the plot's width in pixels
+    :type nbins: int
+    :return: x, y
+    :rtype: (np.ndarray, np.ndarray)
+    """
+    n = len(x)
+    nbins = int(nbins)
+    if nbins < 1 or n <= 2 * nbins or not is_monotonic(x):
+        return x, y
+    x0 = x[0]
+    x1 = x[-1]
+    if not x1 > x0:
+        return x, y  # no span to bin over, or nan
+
+    edges = np.searchsorted(x, np.linspace(x0, x1, nbins + 1)[1:-1], 'left')
+    starts = np.concatenate(([0], edges))
+    # drop empty bins
+    keep = np.ones(len(starts), bool)
+    keep[:-1] = starts[1:] != starts[:-1]
+    keep &= starts < n
+    starts = starts[keep]
+    counts = np.diff(np.append(starts, n))
+
+    ymin = np.fmin.reduceat(y, starts)
+    ymax = np.fmax.reduceat(y, starts)
+    imin = _first_match(y, ymin, starts, counts, starts)
+    imax = _first_match(y, ymax, starts, counts, starts)
+
+    idx = np.empty(2 * len(starts) + 2, np.intp)
+    idx[0] = 0
+    idx[1:-1:2] = np.minimum(imin, imax)
+    idx[2:-1:2] = np.maximum(imin, imax)
+    idx[-1] = n - 1
+    return x[idx], y[idx]
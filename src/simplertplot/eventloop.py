@@ -6,8 +6,13 @@ Created in: PyCharm Community Edition
 
 
 """
+import collections
+import heapq
+import itertools
+import selectors
+import socket
 import threading
-from time import sleep
+from time import monotonic
 
 __author__ = 'Nathan Starkweather'
 
@@ -30,6 +35,9 @@ class _ExitThread(Exception):
     pass
 
 
+_notset = object()
+
+
 _event_loop = None
 
 
@@ -41,16 +49,39 @@ def get_event_loop():
 
 
 class ThreadedEventLoop():
+    """ Event loop running in a daemon thread, built on selectors.
+
+    Protocols register file descriptors with add_reader() / add_writer()
+    and the thread sleeps in select() until one is ready, a timer from
+    call_later() is due, or another thread calls call_soon_threadsafe() or
+    wakeup(), which write to a self-pipe to interrupt the select.
+
+    Workers added with add_worker() are still polled on every pass, as
+    before. While there are any, select() doesn't block, so the loop
+    only idles once all protocols have moved to readiness callbacks.
+    """
+
     def __init__(self):
         self.thread = None
         self.workers = set()
         self._idle = False
+        self._running = threading.Event()
         self.idle_sleeptime = .5
+        self._selector = selectors.DefaultSelector()
+        self._ready = collections.deque()
+        self._timers = []
+        self._timer_seq = itertools.count()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._wake_pending = False
+        self._selector.register(self._wake_r, selectors.EVENT_READ, None)
         self.start()
 
     def start(self):
         if self.thread and self.thread.is_alive():
             self._idle = False
+            self._running.set()
         else:
             self.thread = threading.Thread(None, self.mainloop, "RTPlotEventLoopThread", daemon=True)
             self.thread.start()
@@ -58,7 +89,7 @@ class ThreadedEventLoop():
     def stop(self):
         def _stop():
             raise _StopEventLoop
-        self.workers.add(_stop)
+        self.call_soon_threadsafe(_stop)
 
     run_forever = start
 
@@ -70,33 +101,66 @@ class ThreadedEventLoop():
                 self._inner_mainloop()
             except _StopEventLoop:
                 logger.debug("StopEventLoop", exc_info=True)
+                self._running.clear()
                 self._idle = True
             except _ExitThread:
                 logger.debug("Got Exit Thread signal", exc_info=True)
                 return
 
     def _sleep_idle(self):
-        sleep(self.idle_sleeptime)
+        self._running.wait(self.idle_sleeptime)
 
     def _inner_mainloop(self):
         while True:
             self._check_running()
-            if not self.workers:
-                self._sleep_idle()
+            self._run_once()
+
+    def _check_running(self):
+        pass
+
+    def _run_once(self):
+        if self.workers or self._ready:
+            timeout = 0
+        elif self._timers:
+            timeout = max(0, self._timers[0][0] - monotonic())
+        else:
+            timeout = None
+
+        for key, mask in self._selector.select(timeout):
+            if key.data is None:
+                self._drain_wakeup()
                 continue
-            workers = self.workers.copy()
+            reader, writer = key.data
+            if mask & selectors.EVENT_READ and reader is not None:
+                self._run_io(key.fileobj, reader, self._remove_reader)
+            if mask & selectors.EVENT_WRITE and writer is not None:
+                self._run_io(key.fileobj, writer, self._remove_writer)
+
+        if self._timers:
+            now = monotonic()
+            while self._timers and self._timers[0][0] <= now:
+                self._ready.append(heapq.heappop(self._timers)[2])
+
+        # only what's ready now: callbacks scheduling callbacks
+        # mustn't starve the selector
+        for _ in range(len(self._ready)):
+            self._run_worker(self._ready.popleft())
 
-            for w in workers:
+        if self.workers:
+            for w in self.workers.copy():
                 rv = self._run_worker(w)
                 if rv is False:
-                    self.workers.remove(w)
+                    self.workers.discard(w)
 
-    def _check_running(self):
-        pass
+    def _run_io(self, fileobj, cb, remove):
+        if self._run_worker(cb) is False:
+            remove(fileobj)
 
     def _run_worker(self, w):
         try:
             return w()
+        except (_StopEventLoop, _ExitThread):
+            raise
         except StopIteration:
             logger.debug("Worker raised StopIteration: %s", w)
             return False
@@ -104,12 +168,118 @@ class ThreadedEventLoop():
             logger.exception("Exception in event loop")
             return False
 
+    def _in_loop(self):
+        return threading.current_thread() is self.thread
+
+    def wakeup(self):
+        """ Interrupt the select() call, if the loop is waiting in one.
+        Wakeups already in flight are coalesced, so this is cheap to
+        call often.
+        """
+        if self._wake_pending:
+            return
+        self._wake_pending = True
+        try:
+            self._wake_w.send(b'\0')
+        except (BlockingIOError, InterruptedError):
+            pass  # pipe full, the loop is awake anyway
+
+    def _drain_wakeup(self):
+        # clear the flag only once drained, or the byte of a wakeup()
+        # racing with this could be swallowed with the flag left set.
+        # A wakeup() that sees the flag still set has already queued
+        # its callback, which this pass of the loop runs.
+        try:
+            while self._wake_r.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+        self._wake_pending = False
+
+    def call_soon(self, cb):
+        """ Run cb on the next pass of the loop """
+        self._ready.append(cb)
+
+    def call_soon_threadsafe(self, cb):
+        """ Like call_soon(), from any thread """
+        self._ready.append(cb)
+        if not self._in_loop():
+            self.wakeup()
+
+    def call_later(self, delay, cb):
+        """ Run cb in the loop thread after delay seconds """
+        if self._in_loop():
+            heapq.heappush(self._timers, (monotonic() + delay, next(self._timer_seq), cb))
+        else:
+            when = monotonic() + delay
+            self.call_soon_threadsafe(
+                lambda: heapq.heappush(self._timers, (when, next(self._timer_seq), cb)))
+
+    def _modify(self, fileobj, reader=_notset, writer=_notset):
+        try:
+            key = self._selector.get_key(fileobj)
+        except KeyError:
+            old_reader = old_writer = None
+        else:
+            old_reader, old_writer = key.data
+        if reader is _notset:
+            reader = old_reader
+        if writer is _notset:
+            writer = old_writer
+        events = (selectors.EVENT_READ if reader is not None else 0) | \
+                 (selectors.EVENT_WRITE if writer is not None else 0)
+        if old_reader is None and old_writer is None:
+            if events:
+                self._selector.register(fileobj, events, (reader, writer))
+        elif events:
+            self._selector.modify(fileobj, events, (reader, writer))
+        else:
+            self._selector.unregister(fileobj)
+
+    def _threadsafe(self, f, *args):
+        # the selector may only be touched from the loop thread
+        if self._in_loop():
+            f(*args)
+        else:
+            self.call_soon_threadsafe(lambda: f(*args))
+
+    def _add_reader(self, fileobj, cb):
+        self._modify(fileobj, reader=cb)
+
+    def _remove_reader(self, fileobj):
+        self._modify(fileobj, reader=None)
+
+    def _add_writer(self, fileobj, cb):
+        self._modify(fileobj, writer=cb)
+
+    def _remove_writer(self, fileobj):
+        self._modify(fileobj, writer=None)
+
+    def add_reader(self, fileobj, cb):
+        """ Call cb whenever fileobj is readable. The reader
+        is removed if cb returns False or raises.
+        """
+        self._threadsafe(self._add_reader, fileobj, cb)
+
+    def remove_reader(self, fileobj):
+        self._threadsafe(self._remove_reader, fileobj)
+
+    def add_writer(self, fileobj, cb):
+        """ Call cb whenever fileobj is writable. The writer
+        is removed if cb returns False or raises.
+        """
+        self._threadsafe(self._add_writer, fileobj, cb)
+
+    def remove_writer(self, fileobj):
+        self._threadsafe(self._remove_writer, fileobj)
+
     def add_worker(self, w):
+        """ Poll w on every pass of the loop until it returns False """
         self.workers.add(w)
+        self.wakeup()
 
     def remove_worker(self, w):
         try:
             self.workers.remove(w)
         except KeyError:
             logger.warning("Attempted to remove non-existent worker: %s", w)
-
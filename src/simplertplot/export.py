@@ -0,0 +1,79 @@
+"""
+Frame writers for plots rendered headless. Each is handed the same
+RGBA buffer, an (height, width, 4) uint8 array, every frame.
+
+"""
+import os
+import shutil
+import sys
+
+from matplotlib import image
+
+
+class PNGSequenceWriter():
+    """ Write each frame to its own PNG, named by formatting
+    pattern with the frame number, eg 'frame_%05d.png'.
+    """
+
+    def __init__(self, pattern):
+        if '%' not in pattern:
+            root, ext = os.path.splitext(pattern)
+            pattern = root + '_%05d' + ext
+        self.pattern = pattern
+        self.count = 0
+
+    def write(self, frame, repeat=1):
+        """ Write frame repeat times, so the numbering keeps the
+        video's timing. Repeats are hard links to the first file,
+        or copies where the filesystem has none.
+        """
+        first = self.pattern % self.count
+        image.imsave(first, frame, format='png')
+        for i in range(1, repeat):
+            path = self.pattern % (self.count + i)
+            try:
+                os.link(first, path)
+            except OSError:
+                shutil.copyfile(first, path)
+        self.count += repeat
+
+    def close(self):
+        pass
+
+
+class RawVideoWriter():
+    """ Write frames back to back as raw RGBA to a file, FIFO or, for
+    '-', stdout. Read it with eg
+    ffmpeg -f rawvideo -pix_fmt rgba -s WxH -r FPS -i <output> out.mp4
+    """
+
+    def __init__(self, output):
+        if output == '-':
+            self.file = sys.stdout.buffer
+            self._owned = False
+        else:
+            self.file = open(output, 'wb')
+            self._owned = True
+        self.count = 0
+
+    def write(self, frame, repeat=1):
+        """ Write frame repeat times, so frames dropped
+        by a slow plot keep the video's timing.
+        """
+        for _ in range(repeat):
+            self.file.write(frame)
+        self.file.flush()
+        self.count += repeat
+
+    def close(self):
+        if self._owned:
+            self.file.close()
+        else:
+            self.file.flush()
+
+
+def open_frame_writer(output):
+    """ PNGSequenceWriter for a '.png' output, else RawVideoWriter """
+    if output.lower().endswith('.png'):
+        return PNGSequenceWriter(output)
+    return RawVideoWriter(output)
@@ -9,7 +9,10 @@ Created in: PyCharm Community Edition
 import os
 import sys
 import argparse
+import queue
+import shlex
 import subprocess
+import threading
 
 import itertools
 
@@ -17,7 +20,6 @@ import time
 
 from simplertplot import transport
 from simplertplot import eventloop
-from simplertplot import util
 
 
 __author__ = 'Nathan Starkweather'
@@ -30,17 +32,22 @@ _f = logging.Formatter("%(created)s %(name)s %(levelname)s (%(lineno)s): %(messa
 _h.setFormatter(_f)
 logger.addHandler(_h)
 pth = os.path.join("C:/.replcache/", os.path.basename(__file__).replace(".py", ".log"))
-_h2 = logging.FileHandler(pth, 'w')
-_h2.setFormatter(_f)
+if os.path.isdir(os.path.dirname(pth)):
+    _h2 = logging.FileHandler(pth, 'w')
+    _h2.setFormatter(_f)
+    del _h2
 logger.propagate = False
 logger.setLevel(logging.DEBUG)
-del _h, _f, _h2
+del _h, _f
 
 
 _spawn_server_src = """
-from simplertplot import manager
-m = manager.StartupManager(\\"%s\\", %d, \\"%s\\")
+# import everything a plot needs before the handshake, so
+# the process is warm by the time it's handed a plot
+from simplertplot import manager, plots
+m = manager.StartupManager("%s", %d, "%s")
 manager._process_manager = m
+m.run()
 """
 
 _spawn_standalone_src = """
@@ -51,6 +58,91 @@ m.run_plot()
 """
 
 
+def _standalone_cmd(addr, plot, style, max_pts, mproto, serial, fps=30, nseries=1):
+    host, port = addr
+    # pass an argument list rather than a command string, which
+    # only works on windows
+    return [sys.executable, "-c", _spawn_standalone_src, host, str(port)] + \
+        _plot_args(plot, style, max_pts, mproto, serial, fps, nseries)
+
+
+def _plot_args(plot, style, max_pts, mproto, serial, fps=30, nseries=1, output=None, archive=None, dtype=None,
+               scales=None, offsets=None):
+    """ Command line options for a plot, as parsed by _add_plot_args().
+    dtype is the name of the dtype the plot is sent, eg 'int16'.
+    scales and offsets are a sequence of one float per series.
+    """
+    args = ["--plot=%s" % plot, "--mproto=%s" % mproto, "--style=%s" % style, "--max-pts=%d" % max_pts,
+            "--serial=%s" % serial, "--fps=%g" % fps, "--nseries=%d" % nseries]
+    if output is not None:
+        args.append("--output=%s" % output)
+    if archive is not None:
+        args.append("--archive=%s" % os.path.abspath(archive))
+    if dtype is not None:
+        args.append("--dtype=%s" % dtype)
+    if scales is not None:
+        args.append("--scale")
+        args.extend(map(repr, map(float, scales)))
+    if offsets is not None:
+        args.append("--offset")
+        args.extend(map(repr, map(float, offsets)))
+    return args
+
+
+def _add_plot_args(p):
+    p.add_argument("--plot", default="XYPlotter", type=str.lower)
+    p.add_argument("--max-pts", default=300000, type=int)
+    p.add_argument("--style", default='ggplot', type=str.lower)
+    p.add_argument("--mproto", default="tcp", help="Message protocol",
+                   choices=tuple(transport._transport_classes), type=str.lower)
+    p.add_argument("--serial", default="pickle", help="Serialization method",
+                   choices=("pickle", "binary"), type=str.lower)
+    p.add_argument("--fps", default=30, type=float, help="Maximum frame rate")
+    p.add_argument("--output", default=None, help="Frame output of a headless plot: "
+                   "a PNG sequence like frame_%%05d.png, or a raw RGBA video file, FIFO or '-'")
+    p.add_argument("--nseries", default=1, type=int, help="Number of series of a multixy plot")
+    p.add_argument("--archive", default=None, help="Directory to keep the plot's full history in")
+    p.add_argument("--dtype", default=None, help="dtype the plot's data is sent as, float32 by default")
+    p.add_argument("--scale", default=None, type=float, nargs='+', help="Factor y is drawn multiplied by, per series")
+    p.add_argument("--offset", default=None, type=float, nargs='+', help="Value added to y after scaling, per series")
+
+
+def _make_plot(t, ns):
+    """ Create the plot described by parsed plot options, on transport t """
+    from simplertplot import plots
+    plot_klass = plots.get_plot_class(ns.plot)
+    # options only some plots take
+    kwargs = {}
+    if ns.output is not None:
+        kwargs['output'] = ns.output
+    if ns.nseries != 1:
+        kwargs['nseries'] = ns.nseries
+    if ns.archive is not None:
+        kwargs['archive'] = ns.archive
+    if ns.dtype is not None:
+        kwargs['dtype'] = ns.dtype
+    if ns.scale is not None:
+        kwargs['scales'] = ns.scale
+    if ns.offset is not None:
+        kwargs['offsets'] = ns.offset
+    return plot_klass(t, ns.max_pts, ns.style, ns.serial, ns.fps, **kwargs)
+
+
+def _format_addr(addr):
+    # (host, port), or the path of a unix socket
+    if isinstance(addr, str):
+        return shlex.quote(addr)
+    host, port = addr
+    return "%s %d" % (shlex.quote(host), port)
+
+
+def _parse_addr(words):
+    if len(words) == 1:
+        return words[0]
+    host, port = words
+    return host, int(port)
+
+
 class ManagerError(Exception):
     pass
 
@@ -61,13 +153,38 @@ class MngrHandshakeFailure(ManagerError):
 
 class _SMProxy():
     """ Proxy class representing the StartupManager from user side """
-    def __init__(self, sock, name, popen):
+    def __init__(self, tp, name, popen):
         self.popen = popen
         self.name = name
-        self.tp = transport.TCPTransport(sock)
+        self.tp = tp
         self.write = self.tp.write
         self.read = self.tp.read
         self.readline = self.tp.readline
+        self.lock = threading.Lock()
+
+    def new_plot(self, plot, style, max_pts, mproto, serial='pickle', fps=30, nseries=1, output=None,
+                 archive=None, dtype=None, scales=None, offsets=None):
+        """ Have the server open a new plot.
+        Returns the address to connect to it at.
+        """
+        args = _plot_args(plot, style, max_pts, mproto, serial, fps, nseries, output, archive, dtype, scales,
+                          offsets)
+        with self.lock:
+            self.write(("NEWPLOT %s\n" % " ".join(map(shlex.quote, args))).encode('utf-8'))
+            line = self.readline()
+        words = shlex.split(line.decode('utf-8'))
+        if not words:
+            raise ManagerError("Server %s closed the connection" % self.name)
+        elif words[0] != 'PLOT':
+            raise ManagerError(line.decode('utf-8').strip())
+        return _parse_addr(words[1:])
+
+    def detach(self):
+        """ Stop asking for plots. The server exits once
+        the last of its plots is closed.
+        """
+        with self.lock:
+            self.write(b"DETACH\n")
 
 
 _user_manager = None
@@ -91,30 +208,152 @@ class BaseManager():
         self.proto_event_loop = eventloop.ThreadedEventLoop()
 
     def run_protocol(self, p):
-        self.proto_event_loop.add_worker(p.step_work)
+        p.attach(self.proto_event_loop)
 
     def stop_protocol(self, p):
-        self.proto_event_loop.remove_worker(p.step_work)
+        p.detach()
 
 
 class UserManager(BaseManager):
 
     _spawn_id_counter = itertools.count(1)
+    # seconds a server process has to connect and handshake
+    startup_timeout = 10
 
-    def __init__(self, host='localhost', port=0):
+    def __init__(self, host='localhost', port=0, pool_size=0):
+        """
+        :param pool_size: number of server processes to keep started
+                          and waiting, so new plots don't wait for an
+                          interpreter to start and import matplotlib
+        :type pool_size: int
+        """
         super().__init__()
-        self.manager_server = transport.TCPServer(host, port)
+        self.manager_server = transport.TCPServer(host, port, backlog=16)
         self.server_procs = []
+        self.pool_size = 0
+        self._pool = []  # handshaken servers, not hosting anything yet
+        self._starting = {}  # name -> popen, not handshaken yet
+        self._deadlines = {}  # name -> time its handshake is due by
+        self._shared = None
+        self._lock = threading.Lock()
+        self.set_pool_size(pool_size)
+
+    def set_pool_size(self, n):
+        """ Keep n idle server processes started, spawning any missing now """
+        with self._lock:
+            self.pool_size = n
+            self._fill_pool()
+
+    def spawn_standalone(self, addr, plot, style, max_pts, mproto, proto_factory, serial='pickle', fps=30,
+                         nseries=1):
+        self._popen_standalone(addr, plot, style, max_pts, mproto, serial, fps, nseries)
+        return self._make_protocol(addr, mproto, proto_factory)
 
-    def spawn_standalone(self, addr, plot, style, max_pts, mproto, proto_factory):
-        python = sys.executable
-        host, port = addr
-        cmd = "%s -c %s %s %d --plot=%s --mproto=%s --style=%s --max-pts=%d" % (util.quote(python),
-                                                        util.quote(_spawn_standalone_src),
-                                                        host, port, plot, mproto, style, max_pts)
-        self.popen = subprocess.Popen(cmd)
+    def new_plot(self, plot, style, max_pts, mproto, proto_factory, serial='pickle', fps=30, nseries=1,
+                 shared=True, archive=None, dtype=None, scales=None, offsets=None):
+        """ Open a plot in a server process from the pool, instead of
+        starting a new standalone process. Shared plots all go to the
+        same server, otherwise the server hosts only this plot and
+        exits once it's closed.
+        """
+        if shared:
+            server = self.get_server()
+        else:
+            server = self.take_server()
+        addr = server.new_plot(plot, style, max_pts, mproto, serial, fps, nseries, archive=archive, dtype=dtype,
+                               scales=scales, offsets=offsets)
+        if not shared:
+            server.detach()
         return self._make_protocol(addr, mproto, proto_factory)
 
+    def get_server(self):
+        """ The server process shared plots are opened in """
+        with self._lock:
+            if self._shared is None or self._shared.popen.poll() is not None:
+                self._shared = self._take_server()
+            return self._shared
+
+    def take_server(self):
+        """ A server process to use exclusively, taken from the pool
+        if it has one ready. The pool is topped up again.
+        """
+        with self._lock:
+            return self._take_server()
+
+    def _take_server(self):
+        self._accept_servers(False)
+        self._reap()
+        if not self._pool and not self._starting:
+            self._start_server()
+        while not self._pool:
+            if not self._starting:
+                raise MngrHandshakeFailure("Server process failed to start")
+            self._accept_servers(True)
+            self._reap()
+        remote = self._pool.pop(0)
+        self._fill_pool()
+        return remote
+
+    def _reap(self):
+        """ Forget servers that exited before being used, and
+        stop those that haven't handshaken in time.
+        """
+        self._pool = [r for r in self._pool if r.popen.poll() is None]
+        now = time.time()
+        for name, popen in list(self._starting.items()):
+            if popen.poll() is not None:
+                logger.debug("Server %s exited during startup", name)
+                self._drop_starting(name)
+            elif now > self._deadlines[name]:
+                logger.debug("Server %s didn't handshake within %gs", name, self.startup_timeout)
+                self._drop_starting(name).terminate()
+
+    def _drop_starting(self, name):
+        del self._deadlines[name]
+        return self._starting.pop(name)
+
+    def _fill_pool(self):
+        self._reap()
+        while len(self._pool) + len(self._starting) < self.pool_size:
+            self._start_server()
+
+    def _start_server(self):
+        host, port = self.manager_server.get_addr()
+        proc_name = "Serv%03d" % next(self._spawn_id_counter)
+        self._starting[proc_name] = self._spawn_process(host, port, proc_name)
+        self._deadlines[proc_name] = time.time() + self.startup_timeout
+
+    def _accept_servers(self, block):
+        """ Handshake servers that have connected, or with block,
+        wait for at least one. They join the pool.
+        """
+        while self._starting:
+            sock = self.manager_server.accept_connection(False)
+            if sock is None:
+                if not block:
+                    return
+                # poll, so a server that dies before connecting isn't waited on forever
+                self._reap()
+                time.sleep(0.01)
+                continue
+            block = False
+            remote = self._handshake(sock)
+            if remote is not None:
+                self.server_procs.append(remote)
+                self._pool.append(remote)
+
+    def spawn_standalone_transport(self, addr, plot, style, max_pts, mproto, serial='pickle', fps=30,
+                                   nseries=1):
+        """ Spawn a standalone plot and return the connected transport,
+        without wrapping it in a protocol.
+        """
+        self._popen_standalone(addr, plot, style, max_pts, mproto, serial, fps, nseries)
+        return self._connect_to_standalone_server(addr, mproto)
+
+    def _popen_standalone(self, addr, plot, style, max_pts, mproto, serial, fps=30, nseries=1):
+        cmd = _standalone_cmd(addr, plot, style, max_pts, mproto, serial, fps, nseries)
+        self.popen = subprocess.Popen(cmd)
+
     def _make_protocol(self, addr, mproto, proto_factory):
         t = self._connect_to_standalone_server(addr, mproto)
         f = proto_factory()
@@ -133,26 +372,18 @@ class UserManager(BaseManager):
         while time.time() < tot:
             try:
                 con = kls.from_address(addr)
-            except ConnectionRefusedError:
+            except (ConnectionRefusedError, FileNotFoundError):
+                # FileNotFoundError: unix socket file not created yet
                 pass
             else:
                 break
         return con
 
     def spawn_server(self):
-        host, port = self.manager_server.get_addr()
-        proc_name = "Serv%03d" % next(self._spawn_id_counter)
-        popen = self._spawn_process(host, port, proc_name)
-        sock = self.manager_server.accept_connection()
-        remote = _SMProxy(sock, proc_name, popen)
-
-        try:
-            self._handshake(remote)
-        except Exception as e:
-            logger.debug("Error in client handshake: %s", e)
-        else:
-            logger.debug("Successful Handshake")
-            self.server_procs.append(remote)
+        """ Spawn a server process and wait for it to be ready """
+        with self._lock:
+            self._start_server()
+            return self._take_server()
 
     def wait(self):
         for c in self.server_procs:
@@ -161,29 +392,61 @@ class UserManager(BaseManager):
     def kill_all(self):
         for c in self.server_procs:
             c.popen.terminate()
+        for popen in self._starting.values():
+            popen.terminate()
 
     def _spawn_process(self, host, port, proc_name):
-        python = sys.executable
         src = _spawn_server_src % (host, port, proc_name)
-        cmd = "%s -c %s" % (util.quote(python), util.quote(src))
-        return subprocess.Popen(cmd)
+        return subprocess.Popen([sys.executable, "-c", src])
 
-    def _handshake(self, client):
-        line = client.tp.readline()
-        sm, name, hs = line.strip().split()
-        if sm != b'StartupMngr':
-            raise MngrHandshakeFailure(sm)
-        elif name.decode() != client.name:
-            raise MngrHandshakeFailure("%s != %s" % (name, client.name))
-        elif hs != b'HANDSHAKE':
-            raise MngrHandshakeFailure(hs)
-        client.tp.write(b"ACK STARTUP\n")
+    def _handshake(self, sock):
+        """ Handshake a server process that has connected.
+        Returns its proxy, or None on failure, in which case the
+        server is stopped if it's known which one it was.
+        """
+        tp = transport.TCPTransport(sock)
+        name = None
+        try:
+            # a server that connects but never handshakes mustn't hang us
+            sock.settimeout(self.startup_timeout)
+            line = tp.readline()
+            sock.settimeout(None)
+            sm, name, hs = line.strip().split()
+            name = name.decode('ascii', 'replace')
+            if name not in self._starting:
+                name = None
+                raise MngrHandshakeFailure("Unknown server")
+            elif sm != b'StartupMngr':
+                raise MngrHandshakeFailure(sm)
+            elif hs != b'HANDSHAKE':
+                raise MngrHandshakeFailure(hs)
+            tp.write(b"ACK STARTUP\n")
+        except Exception as e:
+            logger.debug("Error in client handshake: %s", e)
+            tp.close()
+            if name is not None:
+                self._drop_starting(name).terminate()
+            return None
+        logger.debug("Successful Handshake")
+        return _SMProxy(tp, name, self._drop_starting(name))
 
 
 class StartupManager(BaseManager):
+    """ Long-lived server process, hosting any number of plots
+    opened on request of the UserManager that spawned it.
+
+    Requests are lines on the control connection:
+    "NEWPLOT <options>" with the standalone server's plot options,
+    answered with "PLOT <address>" or "ERR <message>", and "DETACH".
+    All plots are drawn by run() in the main thread.
+    """
+    # seconds to wait for the user to connect to a new plot
+    accept_timeout = 10
+
     def __init__(self, host, port, name="unnamed"):
         super().__init__()
         self.name = name
+        self.host = host
         self.tp = transport.TCPTransport.from_address((host, port))
         try:
             self.handshake()
@@ -191,13 +454,154 @@ class StartupManager(BaseManager):
             logger.debug("Error in server handshake: %s", e)
         else:
             logger.debug("Successful Handshake")
-        self.proto_event_loop = eventloop.ThreadedEventLoop()
+        self.plots = []
+        self.pacer = None
+        self.detached = False
+        # set by any plot's client or a control request
+        self.wake = threading.Event()
+        self._requests = queue.Queue()
+        self._pending = []  # (server, options, deadline) of plots not yet connected to
+        # requests sent right after the handshake may have been read with it
+        while self.tp.buffered():
+            self._requests.put(self.tp.readline())
+        self.proto_event_loop.add_reader(self.tp, self._on_control)
+
+    def _on_control(self):
+        # in the event loop thread. Hand requests to run().
+        while True:
+            line = self.tp.readline()
+            if not line:
+                self._requests.put(None)
+                self.wake.set()
+                return False
+            self._requests.put(line)
+            self.wake.set()
+            if not self.tp.buffered():
+                return True
+
+    def run(self):
+        """ Host plots until detached and the last one is closed """
+        self._update_pacer()
+        while not (self.detached and not self.plots and not self._pending):
+            self._handle_requests()
+            self._accept_plots()
+            busy = False
+            for plot in list(self.plots):
+                try:
+                    busy = plot.step_plot() or busy
+                except Exception:  # often throws when the window is closed
+                    logger.debug("Exception in hosted plot", exc_info=True)
+                    self._close_plot(plot)
+                    continue
+                if plot.is_closed():
+                    self._close_plot(plot)
+            self.pacer.wait(busy)
+
+    def _update_pacer(self):
+        from simplertplot import plots
+        fps = max([p.fps for p in self.plots], default=30)
+        idle = min(fps, 5) if all(p.can_idle for p in self.plots) else fps
+        self.pacer = plots.FramePacer(fps, idle, self.wake)
+
+    def _handle_requests(self):
+        while True:
+            try:
+                line = self._requests.get(False)
+            except queue.Empty:
+                return
+            if line is None:
+                self.detach()
+                continue
+            cmd, _, args = line.decode('utf-8').strip().partition(' ')
+            if cmd == 'NEWPLOT':
+                try:
+                    addr = self.new_plot(shlex.split(args))
+                except (Exception, SystemExit) as e:  # argparse exits on bad options
+                    logger.debug("Error opening plot", exc_info=True)
+                    self._reply("ERR %s: %s" % (type(e).__name__, e))
+                else:
+                    self._reply("PLOT %s" % _format_addr(addr))
+            elif cmd == 'DETACH':
+                self.detach()
+            else:
+                self._reply("ERR Unknown request: %s" % cmd)
 
-    def new_plot(self):
-        pass
+    def _reply(self, msg):
+        if not self.detached:
+            self.tp.write((msg + "\n").encode('utf-8'))
+
+    def new_plot(self, args):
+        """ Listen for the user's connection to a new plot, described
+        by the standalone server's plot options. The plot is opened
+        once the user connects. Returns the address to connect to.
+        """
+        from simplertplot import plots
+        p = argparse.ArgumentParser(prog="NEWPLOT")
+        _add_plot_args(p)
+        ns = p.parse_args(args)
+        plots.get_plot_class(ns.plot)  # fail now rather than once connected
+        server = transport.get_server_class(ns.mproto)(self.host, 0)
+        self._pending.append((server, ns, time.time() + self.accept_timeout))
+        self.proto_event_loop.add_reader(server.sock, self._on_accept)
+        return server.get_addr()
+
+    def _on_accept(self):
+        self.wake.set()
+        return False
+
+    def _accept_plots(self):
+        for item in list(self._pending):
+            server, ns, deadline = item
+            t = server.accept_connection2(False)
+            if t is not None:
+                try:
+                    self._open_plot(t, ns)
+                except Exception:
+                    logger.exception("Error opening plot")
+                    t.close()
+            elif time.time() < deadline:
+                continue
+            else:
+                logger.debug("Gave up waiting for a connection to %s", server.get_addr())
+            self._pending.remove(item)
+            # the selector may still hold the listening socket
+            self.proto_event_loop.call_soon_threadsafe(lambda server=server: self._drop_server(server))
+
+    def _drop_server(self, server):
+        self.proto_event_loop.remove_reader(server.sock)
+        server.close()
+
+    def _open_plot(self, t, ns):
+        plot = _make_plot(t, ns)
+        plot.set_wake(self.wake)
+        plot.setup_pyplot()
+        plot.start_client()
+        self.plots.append(plot)
+        try:
+            plot.start_plot()
+        except Exception:
+            self._close_plot(plot)
+            raise
+        self._update_pacer()
+
+    def _close_plot(self, plot):
+        self.plots.remove(plot)
+        if plot.client is not None:
+            self.stop_protocol(plot.client)
+        try:
+            plot.close_plot()
+        except Exception:
+            logger.debug("Exception closing plot", exc_info=True)
+        self._update_pacer()
 
     def detach(self):
-        pass
+        """ Stop taking requests. The process exits
+        once the last plot is closed.
+        """
+        if not self.detached:
+            self.detached = True
+            self.proto_event_loop.remove_reader(self.tp)
+            self.proto_event_loop.call_soon_threadsafe(self.tp.close)
 
     def handshake(self):
         self.tp.write(("StartupMngr %s HANDSHAKE\n" % self.name).encode('ascii'))
@@ -215,34 +619,22 @@ class StandaloneStartupManager(BaseManager):
         self.plotter = plotter
 
     def run_plot(self):
-        self.plotter.client.blocking_io = True
-        self.plotter.run_forever()
+        try:
+            self.plotter.run_forever()
+        finally:
+            self.server.close()
 
     def parse_cmd_line(self, args):
         p = argparse.ArgumentParser(description="Launch Real-Time Matplotlib Plot Server")
         p.add_argument("host", type=str.lower)
         p.add_argument("port", type=int)
-        p.add_argument("--plot", default="XYPlotter", type=str.lower)
-        p.add_argument("--max-pts", default=300000, type=int)
-        p.add_argument("--style", default='ggplot', type=str.lower)
-        p.add_argument("--mproto", default="tcp", help="Message protocol", choices=("tcp",), type=str.lower)
+        _add_plot_args(p)
         rv = p.parse_args(args)
         return rv
 
     def startup_plot(self, ns):
-        from simplertplot import plots
-        host = ns.host
-        port = ns.port
-        plot = ns.plot
-        style = ns.style
-        max_pts = ns.max_pts
-        mproto = ns.mproto
-
-        server_klass = transport.get_server_class(mproto)
-        plot_klass = plots.get_plot_class(plot)
-
-        server = server_klass(host, port)
+        server_klass = transport.get_server_class(ns.mproto)
+        server = server_klass(ns.host, ns.port)
+        self.server = server
         t = server.accept_connection2()
-        plot = plot_klass(t, max_pts, style)
-
-        return plot
+        return _make_plot(t, ns)
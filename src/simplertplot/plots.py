@@ -11,13 +11,19 @@ import threading
 import time
 import tkinter as tk
 
+import numpy as np
 from matplotlib import pyplot
 import matplotlib.transforms
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 from matplotlib.ticker import NullFormatter, NullLocator
 
-from simplertplot.queues import RingBuffer
+from simplertplot.queues import LODColumnRingBuffer, RingBuffer
+from simplertplot.archive import ColumnArchive, ScrollbackLoader
+from simplertplot.decimate import minmax_decimate
 from simplertplot.protocols import XYPlotterProtocol, RPCRequest, RPCResponse
 from simplertplot import manager
+from simplertplot.export import open_frame_writer
 
 __author__ = 'Nathan Starkweather'
 
@@ -32,12 +38,56 @@ logger.setLevel(logging.DEBUG)
 del _h, _f
 
 
+class FramePacer():
+    """ Paces run_plot()'s frames: the next frame is drawn as soon as
+    wake is set, but no more than max_fps times a second. While frames
+    find no new data, waits up to 1 / idle_fps for wake instead.
+    A frame that overruns its period isn't made up for later, the
+    frames it missed are counted in dropped.
+    """
+
+    def __init__(self, max_fps=30, idle_fps=5, wake=None):
+        if max_fps <= 0 or idle_fps <= 0:
+            raise ValueError("fps must be > 0: %r, %r" % (max_fps, idle_fps))
+        self.period = 1 / max_fps
+        self.idle_period = max(1 / idle_fps, self.period)
+        self.wake = wake
+        self.dropped = 0
+        self._frame_start = time.perf_counter()
+
+    def wait(self, busy):
+        """ Wait until the next frame is due.
+        :param busy: True if the frame just drawn had new data
+        """
+        _clock = time.perf_counter
+        start = self._frame_start
+        now = _clock()
+        due = start + self.period
+        if now > due:
+            self.dropped += int((now - due) / self.period) + 1
+        elif due - now > 0.001:
+            time.sleep(due - now)
+        if not busy:
+            timeout = start + self.idle_period - _clock()
+            if timeout > 0:
+                if self.wake is None:
+                    time.sleep(timeout)
+                else:
+                    self.wake.wait(timeout)
+        if self.wake is not None:
+            self.wake.clear()
+        self._frame_start = _clock()
+
+
 class BasePlotter():
+    client = None
 
-    def __init__(self, transport, max_pts, style):
+    def __init__(self, transport, max_pts, style, serial_method='pickle', fps=30):
         self.max_pts = max_pts
         self.style = style
         self.transport = transport
+        self.serial_method = serial_method
+        self.fps = fps
 
     def setup_pyplot(self):
         raise NotImplementedError
@@ -54,22 +104,74 @@ class BasePlotter():
     def update_data(self):
         raise NotImplementedError
 
+    def set_wake(self, wake):
+        """ Make wake the event set when there's something to draw,
+        eg the one a host process shares between its plots.
+        """
+        self.client.wake = wake
+
+
+def _union_limits(a, b):
+    # (xmin, xmax, ymin, ymax) covering both, either may be None
+    if a is None or b is None:
+        return a if b is None else b
+    return min(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), max(a[3], b[3])
+
 
 class XYPlotter(BasePlotter):
     """ Actual plotter process, running in spawned thread
     :ivar client: consumer protocol
     :type client: worker.ConsumerClientWorker
     """
-
-    def __init__(self, transport, max_pts=1000, style='ggplot'):
-        super().__init__(transport, max_pts, style)
+    nseries = 1
+
+    def __init__(self, transport, max_pts=1000, style='ggplot', serial_method='pickle', fps=30, archive=None,
+                 dtype=RingBuffer._default_dtype, compact_time=True, scales=None, offsets=None):
+        """
+        :param archive: directory of a ColumnArchive to keep the full
+                        history in, as the ring buffer only holds the
+                        last max_pts rows
+        :param dtype: dtype of the data sent. The ring buffer holds the
+                      smallest float type that can hold it exactly, eg
+                      float32 for int16 ADC counts.
+        :param compact_time: keep x in the ring buffer as offsets from
+                             a float64 base, see XYPlotterProtocol, so
+                             eg float32 can hold epoch timestamps. A
+                             shared memory ring is written as is by the
+                             producer, so it's made float64 instead.
+        :param scales: per series factor y is multiplied by to draw it,
+                       a scalar for all series or None for 1. Applied
+                       after decimation, so raw counts can be sent as is.
+        :param offsets: per series value added to y after scaling
+        """
+        super().__init__(transport, max_pts, style, serial_method, fps)
         assert max_pts > 0, "max_pts < 0: %s" % max_pts
-        self.x_queue = RingBuffer(max_pts)
-        self.y_queue = RingBuffer(max_pts)
+        self.dtype = np.result_type(dtype, np.float32)
+        # y is drawn as y * scales + offsets, None to draw it as is
+        self.scales = None
+        self.offsets = None
+        if scales is not None or offsets is not None:
+            self.scales = self._per_series(1.0 if scales is None else scales)
+            self.offsets = self._per_series(0.0 if offsets is None else offsets)
+        # x, then a y column per series
+        self.xy_queue = transport.create_ring(max_pts, self.nseries + 1,
+                                              np.float64 if compact_time else self.dtype)
+        if self.xy_queue is None:
+            self.xy_queue = LODColumnRingBuffer(max_pts, self.nseries + 1, self.dtype)
         self.rpc_req = queue.Queue()
         self.rpc_rsp = queue.Queue()
         self.x_data = []
         self.y_data = []
+        # (x, y) of each series, as last read by update_data()
+        self.series = []
+        # (xmin, xmax, ymin, ymax) of the buffered data, None if empty
+        self.data_limits = None
+        # widen the view to the nearest ticks, so the axes are only
+        # redrawn when the data crosses one
+        self.snap_limits = True
+        self.axes_redraws = 0
+        self.line = None
+        self.lines = []
         self.max_pts = max_pts
         self.style = style
         self.figure = None
@@ -78,8 +180,50 @@ class XYPlotter(BasePlotter):
         self.npts_text = None
         self.debug_text = None
         self.debug_lines = ["", "", ""]
-        self.client = XYPlotterProtocol(self.x_queue, self.y_queue, self.rpc_req, self.rpc_rsp)
+        # reduce data to a min/max envelope of the axes' pixel width before drawing
+        self.decimate = True
+        # x range the user has scrolled to, None to follow the newest data
+        self.view = None
+        self._view_changed = False
+        # (x, y) of each series from the archive, older than the ring's
+        self.history = []
+        # data_limits of the ring's rows and of the history in view
+        self._live_limits = None
+        self._history_limits = None
+        self.history_lines = []
+        # the last scrollback request, older results are stale
+        self._history_request = None
+        self.archive = None
+        self.scrollback = None
+        if archive is not None:
+            self.archive = ColumnArchive(archive, self.nseries + 1)
+        self.client = XYPlotterProtocol(self.xy_queue, self.rpc_req, self.rpc_rsp, serial_method, self.archive,
+                                        compact_time)
         self.client.connection_made(transport)
+        if self.archive is not None:
+            self.scrollback = ScrollbackLoader(self.archive, wake=self.client.wake)
+        self.pacer = FramePacer(fps, min(fps, 5) if self.can_idle else fps, self.client.wake)
+        self._frames = 0
+        self._start = None
+
+    def _per_series(self, v):
+        return np.broadcast_to(np.asarray(v, np.float64), (self.nseries,)).copy()
+
+    def set_wake(self, wake):
+        super().set_wake(wake)
+        if self.scrollback is not None:
+            self.scrollback.wake = wake
+        if self.pacer.wake is not None:
+            self.pacer.wake = wake
+
+    @property
+    def can_idle(self):
+        """ False if frames must be drawn at the full rate even
+        without new data, as the client's wake event can't be
+        relied on to say when there is some.
+        """
+        # rows written straight to a shared memory ring don't set it
+        return self.client._ring is None
 
     def clear_pyplot(self):
         if self.figure:
@@ -103,6 +247,7 @@ class XYPlotter(BasePlotter):
         self.subplot = self.figure.add_subplot(1, 1, 1)
         self.debug_text = self.subplot.text(0.01, 0.95, "", transform=self.subplot.transAxes,
                                             multialignment='left', va='top')
+        self._xlim_cid = None
 
     def create_figure(self):
         # listed here in case they needed to get changed
@@ -112,7 +257,8 @@ class XYPlotter(BasePlotter):
         facecolor = None
         edgecolor = None
         frameon = True
-        figure = pyplot.figure(num, figsize, dpi, facecolor, edgecolor, frameon)
+        figure = pyplot.figure(num=num, figsize=figsize, dpi=dpi, facecolor=facecolor, edgecolor=edgecolor,
+                               frameon=frameon)
         return figure
 
     def start_client(self):
@@ -128,32 +274,15 @@ class XYPlotter(BasePlotter):
         except Exception:  # often throws on shutdown
             logger.exception("Exception in run-plot mainloop")
             raise
+        finally:
+            self.transport.close()
 
-    def vsync(self, target_fps):
-        _time = time.time
-        _sleep = time.sleep
-        last_call = _time()
-        per_frame = 1 / target_fps
-        min_sleep_thres = 0.01
-        yield
-        while True:
-            nxt = last_call + per_frame
-            while True:
-                now = _time()
-                if now > nxt:
-                    break
-                wait = nxt - now
-                if wait < min_sleep_thres:
-                    break
-                _sleep(wait)
-            last_call = _time()
-
-
-    def run_plot(self):
-
+    def setup_blit(self):
+        """ Draw the figure once and cache the backgrounds
+        draw_frame() blits onto.
+        """
         figure = self.figure
-        figure.show()
-        r = figure.canvas.renderer
+        r = figure.canvas.get_renderer()
         subplot = self.subplot
 
         xaxis = subplot.xaxis
@@ -189,71 +318,306 @@ class XYPlotter(BasePlotter):
         # initial draw
         figure.draw(r)
 
-        frames = 0
-        update_data = self.update_data
-
-        line, = subplot.plot(self.x_data, self.y_data)
-        line.background = background
-        debug_text = self.debug_text
-        debug_lines = self.debug_lines
-        process_rpc = self.process_rpc
-
-        blit = self.figure.canvas.blit
-        flush_events = figure.canvas.flush_events
-
-        _len = len
-        _time = time.time
-        start = _time()
-        # avoid ZeroDivisionError on floating point arithmetic for fps calc
-        while not (_time() - start):
-            pass
-
-        throttle_fps = self.vsync(30).__next__
+        self.lines = [subplot.plot([], [])[0] for _ in range(self.nseries)]
+        self.history_lines = [subplot.plot([], [], color=line.get_color())[0] for line in self.lines]
+        self.line = self.lines[0]
+        self.line.background = background
 
         # final initial draw
         figure.draw(r)
-        blit(all_bbox)
+        figure.canvas.blit(all_bbox)
+
+        self._renderer = r
+        self._all_bbox = all_bbox
+        self._background = background
+        # background including the tick labels for the current
+        # limits, so the axes are only redrawn when those change
+        self._axes_background = figure.canvas.copy_from_bbox(all_bbox)
+        self._limits = None
+        # render_frame() sets limits without emitting, so from here on
+        # this is only called when the user pans or zooms
+        if self._xlim_cid is None:
+            self._xlim_cid = subplot.callbacks.connect('xlim_changed', self._on_xlim_changed)
+
+    def draw_frame(self):
+        """ Draw and blit one frame.
+        :return: True if there was new data to draw
+        """
+        canvas = self.figure.canvas
+        debug_text = self.debug_text
+        if self.update_data():
+            self.render_frame()
+            canvas.blit(self._all_bbox)
+            return True
+        else:
+            canvas.restore_region(self._axes_background)
+            debug_text.draw(self._renderer)
+            canvas.blit(debug_text.get_window_extent())  # don't cache bbox here, in case text size changes
+            return False
+
+    def render_frame(self):
+        """ Render the data from the last update_data() into
+        the canvas' buffer, without blitting it.
+        """
+        figure = self.figure
+        canvas = figure.canvas
+        subplot = self.subplot
+        limits = self.view_limits(self.data_limits)
+        if limits is not None and self.snap_limits:
+            limits = self.snap_to_ticks(limits)
+        if self.view is not None:
+            limits = self.view + (subplot.get_ylim() if limits is None else limits[2:])
+        if limits is not None and limits != self._limits:
+            self._limits = limits
+            subplot.set_xlim(limits[0], limits[1], emit=False)
+            subplot.set_ylim(limits[2], limits[3], emit=False)
+            canvas.restore_region(self._background)
+            figure.draw_artist(subplot.xaxis)
+            figure.draw_artist(subplot.yaxis)
+            self._axes_background = canvas.copy_from_bbox(self._all_bbox)
+            self.axes_redraws += 1
+        else:
+            canvas.restore_region(self._axes_background)
+        self.debug_lines[1] = "Data Points:%d" % len(self.xy_queue)
+        for line, (x, y) in zip(self.history_lines, self.history):
+            line.set_data(x, y)
+            figure.draw_artist(line)
+        for line, (x, y) in zip(self.lines, self.series):
+            line.set_data(x, y)
+            figure.draw_artist(line)
+        figure.draw_artist(self.debug_text)
+
+    def run_plot(self):
+        self.start_plot()
+        step_plot = self.step_plot
+        wait = self.pacer.wait
 
         # mainloop
         while True:
-            process_rpc()
-            fps = frames / (_time() - start)
-            debug_lines[0] = ("FPS:%.1f" % fps)
-            dbg_txt = '\n'.join(debug_lines)
-            debug_text.set_text(dbg_txt)
-            if update_data():
-                line.set_data(self.x_data, self.y_data)
-                subplot.relim()
-                subplot.autoscale_view(True, True, True)
-                lower, upper = subplot.get_ybound()
-                subplot.set_ylim(lower, upper + (upper - lower) * 0.02, True, None)
-                figure.canvas.restore_region(background)
-                debug_lines[1] = "Data Points:%d" % _len(self.x_queue)
-                figure.draw_artist(xaxis)
-                figure.draw_artist(yaxis)
-                figure.draw_artist(line)
-                figure.draw_artist(debug_text)
-                blit(all_bbox)
-
-            else:
-                figure.canvas.restore_region(background)
-                debug_text.draw(r)
-                blit(debug_text.get_window_extent())  # don't cache bbox here, in case text size changes
+            wait(step_plot())
+
+    def start_plot(self):
+        """ Show the figure, ready for step_plot() """
+        self.figure.show()
+        self.setup_blit()
+        self._frames = 0
+        self._start = time.time()
+        # avoid ZeroDivisionError on floating point arithmetic for fps calc
+        while not (time.time() - self._start):
+            pass
 
-            throttle_fps()
-            flush_events()
-            frames += 1
+    def step_plot(self):
+        """ Answer RPC requests, then draw one frame and handle the
+        window's events. Pacing is up to the caller.
+
+        :return: True if there was new data to draw
+        """
+        self.process_rpc()
+        fps = self._frames / (time.time() - self._start)
+        self.debug_lines[0] = ("FPS:%.1f" % fps)
+        self.debug_text.set_text('\n'.join(self.debug_lines))
+        busy = self.draw_frame()
+        self.figure.canvas.flush_events()
+        self._frames += 1
+        return busy
+
+    def is_closed(self):
+        """ True once the window has been closed """
+        return self.figure is None or not pyplot.fignum_exists(self.figure.number)
+
+    def close_plot(self):
+        """ Close the window and the connection """
+        self.clear_pyplot()
+        self.transport.close()
+        if self.scrollback is not None:
+            self.scrollback.close()
+        if self.archive is not None:
+            self.archive.close()
 
     def update_data(self):
+        changed = False
+        scrolled = self.scrollback is not None and self.view is not None
         with self.client.lock_queue():
-            if self.client.current_update:
-                self.x_data = self.x_queue.get()
-                self.y_data = self.y_queue.get()
+            if self.client.current_update or self._view_changed:
+                self.series = self._read_series()
+                self.x_data, self.y_data = self.series[0]
+                self._live_limits = self._data_limits()
                 txt1 = "Current Queue Read: %d" % self.client.current_update
                 self.debug_lines[2] = txt1
                 self.client.current_update = 0
-                return True
-        return False
+                changed = True
+            if scrolled:
+                live_start = self.xy_queue.get()[0, 0] + self.client.x_base if len(self.xy_queue) else np.inf
+        if scrolled:
+            changed |= self._update_history(live_start)
+        elif self._view_changed:
+            self.history = []
+            self._history_limits = None
+            self._history_request = None
+        self._view_changed = False
+        if changed:
+            self.data_limits = _union_limits(self._live_limits, self._history_limits)
+        return changed
+
+    def _update_history(self, live_start):
+        """ Ask for the part of the view older than the ring's data and
+        pick up whatever the loader has finished, without waiting.
+        :return: True if there is new history to draw
+        """
+        x0, x1 = self.view
+        if self._view_changed:
+            if x0 < live_start:
+                self._history_request = (x0, min(x1, live_start), int(self.subplot.bbox.width))
+                self.scrollback.request(*self._history_request)
+            else:
+                self.history = []
+                self._history_limits = None
+                self._history_request = None
+        result = self.scrollback.take()
+        if result is None:
+            return False
+        req, data = result
+        if req != self._history_request:
+            # for a view since left
+            return False
+        width = self.subplot.bbox.width
+        ys = data[1:]
+        if self.scales is not None:
+            ys = ys * self.scales[:, None] + self.offsets[:, None]
+        self.history = [minmax_decimate(data[0], y, width) for y in ys]
+        self._history_limits = None
+        if data.shape[1]:
+            limits = (float(data[0, 0]), float(data[0, -1]),
+                      float(np.nanmin(ys)), float(np.nanmax(ys)))
+            if np.all(np.isfinite(limits)):
+                self._history_limits = limits
+        return True
+
+    def _view_rows(self):
+        # rows [start, stop) of the ring within the view,
+        # called with the queue locked
+        if self.view is None:
+            return 0, len(self.xy_queue)
+        x = self.xy_queue.get()[0]
+        x0, x1 = np.subtract(self.view, self.client.x_base)
+        return int(np.searchsorted(x, x0, 'left')), int(np.searchsorted(x, x1, 'right'))
+
+    def _read_series(self):
+        # called with the queue locked. x is stored relative to
+        # x_base and y unscaled, both are converted once decimated
+        start, stop = self._view_rows()
+        base = self.client.x_base
+        if self.decimate and self.subplot is not None:
+            width = self.subplot.bbox.width
+            if hasattr(self.xy_queue, 'envelope'):
+                # pre-reduced from the pyramid, O(pixels)
+                data = self.xy_queue.envelope(width, start, stop)
+            else:
+                data = self.xy_queue.get()[:, start:stop]
+            x = data[0]
+            series = [minmax_decimate(x, y, width) for y in data[1:]]
+        else:
+            data = self.xy_queue.get()[:, start:stop]
+            series = [(data[0], y) for y in data[1:]]
+        if base:
+            series = [(x + base, y) for x, y in series]
+        if self.scales is not None:
+            series = [(x, y * s + o) for (x, y), s, o in zip(series, self.scales, self.offsets)]
+        # undecimated data may still be views of the ring, which would
+        # be drawn after the lock is released. Only then is it copied,
+        # and it's small or decimate is off.
+        ring = self.xy_queue.get()
+        return [tuple(a.copy() if np.may_share_memory(a, ring) else a for a in xy) for xy in series]
+
+    def _data_limits(self):
+        # called with the queue locked
+        start, stop = self._view_rows()
+        if stop <= start:
+            return None
+        if hasattr(self.xy_queue, 'extrema'):
+            mins, maxs = self.xy_queue.extrema(start, stop)
+        else:
+            data = self.xy_queue.get()[:, start:stop]
+            mins = np.nanmin(data, axis=1)
+            maxs = np.nanmax(data, axis=1)
+        # y limits over every series
+        base = self.client.x_base
+        ymins = mins[1:]
+        ymaxs = maxs[1:]
+        if self.scales is not None:
+            # a negative scale swaps them
+            lo = ymins * self.scales + self.offsets
+            hi = ymaxs * self.scales + self.offsets
+            ymins = np.fmin(lo, hi)
+            ymaxs = np.fmax(lo, hi)
+        limits = (float(mins[0]) + base, float(maxs[0]) + base,
+                  float(np.fmin.reduce(ymins)), float(np.fmax.reduce(ymaxs)))
+        if not np.all(np.isfinite(limits)):
+            return None
+        return limits
+
+    def scroll_to(self, x0, x1):
+        """ Show x0 <= x <= x1 instead of following the newest data.
+        Parts of it older than the plot holds are loaded from the
+        archive, if it has one, in the background.
+        """
+        self.view = (float(x0), float(x1))
+        self._view_changed = True
+        self.client.wake.set()
+
+    def follow(self):
+        """ Go back to showing the newest data """
+        self.view = None
+        self._view_changed = True
+        self.client.wake.set()
+
+    def _on_xlim_changed(self, axes):
+        self.scroll_to(*axes.get_xlim())
+
+    def view_limits(self, data_limits):
+        """ Axis limits to show data_limits with, as autoscale_view()
+        would choose them with the axes' margins, plus 2% headroom on
+        top of the y axis.
+
+        :return: (xmin, xmax, ymin, ymax) or None
+        """
+        if data_limits is None:
+            return None
+        x0, x1, y0, y1 = data_limits
+        xmargin, ymargin = self.subplot.margins()
+        x0, x1 = self.subplot.xaxis.get_major_locator().nonsingular(x0, x1)
+        y0, y1 = self.subplot.yaxis.get_major_locator().nonsingular(y0, y1)
+        dx = (x1 - x0) * xmargin
+        dy = (y1 - y0) * ymargin
+        x0 -= dx
+        x1 += dx
+        y0 -= dy
+        y1 += dy
+        return x0, x1, y0, y1 + (y1 - y0) * 0.02
+
+    def snap_to_ticks(self, limits):
+        """ Widen (xmin, xmax, ymin, ymax) outward to the
+        nearest major ticks of each axis.
+        """
+        x0, x1, y0, y1 = limits
+        x0, x1 = self._snap_axis(self.subplot.xaxis, x0, x1)
+        y0, y1 = self._snap_axis(self.subplot.yaxis, y0, y1)
+        return x0, x1, y0, y1
+
+    def _snap_axis(self, axis, v0, v1):
+        locator = axis.get_major_locator()
+        # widening the range may change the tick spacing,
+        # repeat until the ends are ticks of their own range
+        for _ in range(4):
+            ticks = locator.tick_values(v0, v1)
+            lo = ticks[ticks <= v0]
+            hi = ticks[ticks >= v1]
+            s0 = float(lo[-1]) if len(lo) else v0
+            s1 = float(hi[0]) if len(hi) else v1
+            if (s0, s1) == (v0, v1):
+                break
+            v0, v1 = s0, s1
+        return v0, v1
 
     def process_rpc(self):
         try:
@@ -268,27 +632,141 @@ class XYPlotter(BasePlotter):
                 rsp = req.respond(exc=e)
             else:
                 rsp = req.respond(value=rv)
-            self.rpc_rsp.put(rsp)
+            self.client.respond(rsp)
 
     def test_rpc(self, msg):
         print("GOT RPC MSG:", msg)
         return len(msg)
 
 
+class MultiXYPlotter(XYPlotter):
+    """ XYPlotter of nseries lines sharing one x column, fed over one
+    connection. Rows are (x, y0 ... yn-1), as sent by put_series(),
+    and are kept in a single ring buffer. Every line is drawn before
+    the frame is blitted once.
+    """
+
+    def __init__(self, transport, max_pts=1000, style='ggplot', serial_method='pickle', fps=30, nseries=2,
+                 archive=None, dtype=RingBuffer._default_dtype, compact_time=True, scales=None, offsets=None):
+        assert nseries > 0, "nseries < 1: %s" % nseries
+        self.nseries = nseries
+        super().__init__(transport, max_pts, style, serial_method, fps, archive, dtype, compact_time, scales,
+                         offsets)
+
+
+class HeadlessPlotter(XYPlotter):
+    """ XYPlotter that renders with Agg instead of a window, for
+    machines without a display. Frames are rendered into the canvas'
+    own RGBA buffer and written from it at a fixed fps, to a PNG
+    sequence or raw video, see export.open_frame_writer().
+    """
+
+    def __init__(self, transport, max_pts=1000, style='ggplot', serial_method='pickle', fps=30,
+                 output='frame_%05d.png', archive=None, dtype=RingBuffer._default_dtype, compact_time=True,
+                 scales=None, offsets=None):
+        super().__init__(transport, max_pts, style, serial_method, fps, archive, dtype, compact_time, scales,
+                         offsets)
+        self.output = output
+        self.writer = None
+        self.frame = None
+        # fixed rate, frames are written whether or not there's new data
+        self.pacer = FramePacer(fps, fps)
+
+    @property
+    def can_idle(self):
+        return False
+
+    def create_figure(self):
+        figure = Figure()
+        FigureCanvasAgg(figure)
+        return figure
+
+    def setup_pyplot(self):
+        super().setup_pyplot()
+        self.debug_text.set_visible(False)
+
+    def clear_pyplot(self):
+        super().clear_pyplot()
+        self.frame = None
+
+    def setup_blit(self):
+        super().setup_blit()
+        # the renderer's buffer, the same memory every frame
+        self.frame = np.asarray(self.figure.canvas.buffer_rgba())
+
+    def draw_frame(self):
+        """ Render a frame if there's new data. Otherwise the
+        buffer still holds the last one, so it's left alone.
+        :return: True if there was new data to draw
+        """
+        if self.update_data():
+            self.render_frame()
+            return True
+        return False
+
+    def run_forever(self):
+        self.setup_pyplot()
+        self.start_client()
+        try:
+            self.run_plot()
+        except BrokenPipeError:
+            logger.debug("Frame output closed")
+        finally:
+            self.close_plot()
+
+    def run_plot(self):
+        self.start_plot()
+        step_plot = self.step_plot
+        pacer = self.pacer
+        is_closed = self.is_closed
+
+        while not is_closed():
+            step_plot()
+            dropped = pacer.dropped
+            pacer.wait(True)
+            if pacer.dropped > dropped:
+                self.writer.write(self.frame, pacer.dropped - dropped)
+
+    def start_plot(self):
+        """ Open the output, ready for step_plot() """
+        self.setup_blit()
+        if self.writer is None:
+            self.writer = open_frame_writer(self.output)
+
+    def step_plot(self):
+        """ Answer RPC requests, then draw and write one frame.
+        :return: True if there was new data to draw
+        """
+        self.process_rpc()
+        busy = self.draw_frame()
+        self.writer.write(self.frame)
+        return busy
+
+    def is_closed(self):
+        """ True once the user has closed the connection
+        and everything they sent has been drawn
+        """
+        return self.client.finished.is_set() and not self.client.current_update
+
+    def close_plot(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        super().close_plot()
+
+
 class _EchoPlot(BasePlotter):
     """ Plot that echos received data instead of
     plotting it. Used for internal debugging. """
 
-    def __init__(self, transport, max_pts, style):
-        from . import transport
-        super().__init__(transport, max_pts, style)
-        self.transport = transport.SocketTransport.from_address(transport)
+    def __init__(self, transport, max_pts, style, serial_method='pickle', fps=30):
+        super().__init__(transport, max_pts, style, serial_method, fps)
         self.reader = self.writer = self.transport
 
     def pong(self):
-        if not self.transport.read_ready():
-            return
         mlen = self.reader.read(3)
+        if not mlen:
+            raise SystemExit(0)  # connection closed
         mlen = int(mlen)
         msg = self.reader.read(mlen)
         if msg.lower() == b'SYS_EXIT'.lower():
@@ -315,6 +793,8 @@ class _EchoPlot(BasePlotter):
 def get_plot_mapping():
     plots = {
         'xyplotter': XYPlotter,
+        'multixy': MultiXYPlotter,
+        'headless': HeadlessPlotter,
         'echo': _EchoPlot
     }
     return plots
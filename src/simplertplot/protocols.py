@@ -7,14 +7,17 @@ Created in: PyCharm Community Edition
 
 """
 import contextlib
+import itertools
+import json
 import pickle
 import queue
+import struct
 import threading
 import time
 from concurrent.futures import Future
 
 import numpy as np
-from simplertplot.queues import RingBuffer
+from simplertplot.queues import SharedColumnRingBuffer
 
 __author__ = 'Nathan Starkweather'
 
@@ -51,6 +54,12 @@ class RPCResponse():
         self.exc = exc
 
 
+class RPCError(Exception):
+    """ Exception raised in the remote process, re-raised locally
+    when the exception itself can't be sent over the wire """
+    pass
+
+
 class BaseProtocol():
     OP_XY = 0
     OP_XYL = 1
@@ -61,79 +70,513 @@ class BaseProtocol():
     OP_RPC = 6
     _NP_DTYPE = np.float64
 
-    def __init__(self, serial_method='pickle', blocking_io=False):
+    def __init__(self, serial_method='pickle'):
         self.dlock = threading.Lock()
         self.transport = None
         if serial_method == 'pickle':
             self.deserialize = pickle.load
             self.serialize = pickle.dumps
+        elif serial_method == 'binary':
+            serializer = BinarySerializer()
+            self.deserialize = serializer.load
+            self.serialize = serializer.dumps
         else:
             raise ValueError(serial_method)
+        self.serial_method = serial_method
         self._pending_futures = {}
-        self.blocking_io = blocking_io
+        self.loop = None
 
     def connection_made(self, transport):
         self.transport = transport
 
+    def attach(self, loop):
+        """ Start running in the event loop, driven by
+        readiness callbacks registered with it.
+        """
+        raise NotImplementedError
+
+    def detach(self):
+        raise NotImplementedError
+
     @contextlib.contextmanager
     def lock_queue(self):
         with self.dlock:
             yield
 
-    def step_work(self):
-        raise NotImplementedError
+
+class BinarySerializer():
+    """ Length-prefixed binary frames, used instead of pickle on the wire.
+
+    Each frame is a header of (payload nbytes, op, ncols, count),
+    followed by one dtype code per column and the raw little-endian
+    payload. Row ops (OP_XY, OP_XYL, OP_NP_XYL) carry count interleaved
+    rows of ncols values; column ops (OP_XLYL, OP_NP_XLYL) carry ncols
+    contiguous blocks of count values each. RPC messages are sent as
+    JSON, so nothing received from the socket is ever unpickled.
+
+    load() reads the payload with readinto() into a reusable buffer
+    and returns numpy views of it, which are only valid until the
+    next call to load().
+    """
+    _header = struct.Struct('<IBBI')
+    _DT_JSON = 0
+    _dtypes = (None, '<f8', '<f4', '<i8', '<i4', '<i2', '<i1', '<u8', '<u4', '<u2', '<u1')
+    _dtypes = tuple(np.dtype(d) if d else None for d in _dtypes)
+    _dtype_codes = {dt: i for i, dt in enumerate(_dtypes) if dt is not None}
+    _row_ops = {BaseProtocol.OP_XY, BaseProtocol.OP_XYL, BaseProtocol.OP_NP_XYL}
+    _col_ops = {BaseProtocol.OP_XLYL, BaseProtocol.OP_NP_XLYL}
+
+    def __init__(self):
+        self._rbuf = np.empty(0, np.uint8)
+
+    def dumps(self, msg):
+        op, data = msg
+        if op in self._row_ops:
+            return self._dumps_rows(op, data)
+        elif op in self._col_ops:
+            return self._dumps_cols(op, data)
+        elif op == BaseProtocol.OP_RPC:
+            payload = json.dumps(self._rpc_to_dict(data), default=self._json_default).encode('utf-8')
+            return self._header.pack(len(payload), op, 1, 1) + bytes((self._DT_JSON,)) + payload
+        elif op == BaseProtocol.OP_EXIT:
+            return self._header.pack(0, op, 0, 0)
+        raise ValueError(op)
+
+    def _dtype_code(self, dt):
+        try:
+            return self._dtype_codes[np.dtype(dt).newbyteorder('<')]
+        except KeyError:
+            raise TypeError("Unsupported dtype for binary serialization: %s" % dt) from None
+
+    def _dumps_rows(self, op, data):
+        if op == BaseProtocol.OP_NP_XYL:
+            # already float64 bytes, see XYUserProtocol.put_np_xyl
+            arr = np.frombuffer(data, BaseProtocol._NP_DTYPE)
+        elif op == BaseProtocol.OP_XYL and not isinstance(data, np.ndarray):
+            arr = np.fromiter(itertools.chain.from_iterable(data), BaseProtocol._NP_DTYPE, 2 * len(data))
+        else:
+            arr = np.asarray(data, BaseProtocol._NP_DTYPE)
+        arr = np.ascontiguousarray(arr, arr.dtype.newbyteorder('<'))
+        code = self._dtype_code(arr.dtype)
+        count = arr.size // 2
+        return b''.join((self._header.pack(arr.nbytes, op, 2, count), bytes((code, code)), arr.tobytes()))
+
+    def _dumps_cols(self, op, data):
+        cols = []
+        for c in data:
+            if isinstance(c, bytes):
+                c = np.frombuffer(c, BaseProtocol._NP_DTYPE)
+            elif not isinstance(c, np.ndarray):
+                c = np.fromiter(c, BaseProtocol._NP_DTYPE, len(c))
+            cols.append(np.ascontiguousarray(c, c.dtype.newbyteorder('<')))
+        count = len(cols[0])
+        if any(len(c) != count for c in cols):
+            raise ValueError("Column lengths differ")
+        nbytes = sum(c.nbytes for c in cols)
+        codes = bytes(self._dtype_code(c.dtype) for c in cols)
+        parts = [self._header.pack(nbytes, op, len(cols), count), codes]
+        parts.extend(c.tobytes() for c in cols)
+        return b''.join(parts)
+
+    def load(self, fp):
+        hdr = fp.read(self._header.size)
+        if len(hdr) < self._header.size:
+            raise EOFError("Connection closed while reading frame header")
+        nbytes, op, ncols, count = self._header.unpack(hdr)
+        codes = fp.read(ncols) if ncols else b''
+        if len(codes) < ncols:
+            raise EOFError("Connection closed while reading frame header")
+        payload = self._read_payload(fp, nbytes)
+
+        if op == BaseProtocol.OP_EXIT:
+            return op, None
+        elif op == BaseProtocol.OP_RPC:
+            return op, self._rpc_from_dict(json.loads(payload.tobytes().decode('utf-8')))
+
+        dtypes = [self._dtypes[c] for c in codes]
+        if op in self._row_ops:
+            rows = payload.view(dtypes[0]).reshape(count, ncols)
+            if op == BaseProtocol.OP_XY:
+                return op, rows[0]
+            return op, rows
+        elif op in self._col_ops:
+            cols = []
+            offset = 0
+            for dt in dtypes:
+                end = offset + count * dt.itemsize
+                cols.append(payload[offset:end].view(dt))
+                offset = end
+            return op, tuple(cols)
+        raise ValueError(op)
+
+    def _read_payload(self, fp, nbytes):
+        if nbytes > len(self._rbuf):
+            # don't resize in place: views handed out by the
+            # previous load() may still reference the old buffer
+            self._rbuf = np.empty(max(nbytes, 2 * len(self._rbuf)), np.uint8)
+        payload = self._rbuf[:nbytes]
+        view = memoryview(payload)
+        while view:
+            n = fp.readinto(view)
+            if not n:
+                raise EOFError("Connection closed while reading frame payload")
+            view = view[n:]
+        return payload
+
+    def _rpc_to_dict(self, msg):
+        if isinstance(msg, RPCRequest):
+            return {'type': 'req', 'id': msg.id, 'func': msg.func,
+                    'args': list(msg.args), 'kwargs': msg.kwargs}
+        elif isinstance(msg, RPCResponse):
+            exc = msg.exc
+            if exc is not None and exc is not RPCResponse.notset:
+                exc = "%s: %s" % (type(exc).__name__, exc)
+            else:
+                exc = None
+            return {'type': 'rsp', 'id': msg.id, 'value': msg.value, 'exc': exc}
+        raise TypeError(msg)
+
+    @staticmethod
+    def _json_default(v):
+        # numpy values, which pickle used to carry as is
+        if isinstance(v, np.generic):
+            return v.item()
+        elif isinstance(v, np.ndarray):
+            return v.tolist()
+        raise TypeError("Object of type %s is not JSON serializable" % type(v).__name__)
+
+    def _rpc_from_dict(self, d):
+        if d['type'] == 'req':
+            req = RPCRequest(d['func'], tuple(d['args']), d['kwargs'])
+            req.id = d['id']
+            return req
+        elif d['type'] == 'rsp':
+            exc = RPCError(d['exc']) if d['exc'] else None
+            return RPCResponse(d['id'], d['value'], exc)
+        raise ValueError(d['type'])
+
+
+class _XYBatch():
+    """ Coalesces queued data messages of any op into
+    a single set of columns, x and y by default. x is
+    kept as float64, the other columns as dtype.
+    """
+    _dtype = BaseProtocol._NP_DTYPE
+
+    def __init__(self, ncols=2, dtype=_dtype):
+        self.ncols = ncols
+        self.dtypes = [np.dtype(self._dtype)] + [np.dtype(dtype)] * (ncols - 1)
+        self._chunks = [[] for _ in range(ncols)]
+        self._rows = []
+        self.n = 0
+        self.started = None
+
+    def add(self, op, data):
+        if self.started is None:
+            self.started = time.time()
+        ncols = self.ncols
+        if op == BaseProtocol.OP_XY:
+            self._rows.append(data)
+            self.n += 1
+            return
+        elif op == BaseProtocol.OP_XYL:
+            rows = np.fromiter(itertools.chain.from_iterable(data), self._dtype, ncols * len(data))
+            cols = rows.reshape(-1, ncols).T
+        elif op == BaseProtocol.OP_XLYL:
+            cols = [np.fromiter(c, self._dtype, len(c)) for c in data]
+        elif op == BaseProtocol.OP_NP_XYL:
+            cols = np.frombuffer(data, self._dtype).reshape(-1, ncols).T
+        elif op == BaseProtocol.OP_NP_XLYL:
+            cols = [np.frombuffer(c, self._dtype) if isinstance(c, bytes) else c for c in data]
+        else:
+            raise ValueError(op)
+        if len(cols) != ncols:
+            raise ValueError("Expected %d columns, got %d" % (ncols, len(cols)))
+        self._flush_scalars()
+        for chunks, c in zip(self._chunks, cols):
+            chunks.append(c)
+        self.n += len(cols[0])
+
+    def _flush_scalars(self):
+        # keep single points in order relative to array chunks
+        if self._rows:
+            rows = np.array(self._rows, self._dtype).reshape(-1, self.ncols)
+            for chunks, c in zip(self._chunks, rows.T):
+                chunks.append(c)
+            self._rows.clear()
+
+    def take(self):
+        """ Return all data added so far as a tuple
+        of column arrays, and reset """
+        self._flush_scalars()
+        cols = tuple(np.concatenate(chunks, dtype=dt, casting='unsafe')
+                     for chunks, dt in zip(self._chunks, self.dtypes))
+        for chunks in self._chunks:
+            chunks.clear()
+        self.n = 0
+        self.started = None
+        return cols
+
+
+def _data_npts(op, data):
+    """ Number of points carried by a queued data message """
+    if op == BaseProtocol.OP_XY:
+        return 1
+    elif op == BaseProtocol.OP_XYL:
+        return len(data)
+    elif op == BaseProtocol.OP_NP_XYL:
+        return len(data) // (2 * np.dtype(BaseProtocol._NP_DTYPE).itemsize)
+    elif op == BaseProtocol.OP_NP_XLYL and isinstance(data[0], bytes):
+        return len(data[0]) // np.dtype(BaseProtocol._NP_DTYPE).itemsize
+    return len(data[0])
+
+
+# what put_* does when the outgoing queue is full
+OVERFLOW_BLOCK = 'block'                # wait for room
+OVERFLOW_DROP_NEWEST = 'drop-newest'    # discard the new data
+OVERFLOW_DROP_OLDEST = 'drop-oldest'    # discard the oldest queued data
+OVERFLOW_DECIMATE = 'decimate'          # merge the newest queued data and keep every other point
+overflow_policies = (OVERFLOW_BLOCK, OVERFLOW_DROP_NEWEST, OVERFLOW_DROP_OLDEST, OVERFLOW_DECIMATE)
 
 
 class XYUserProtocol(BaseProtocol):
+    _data_ops = {BaseProtocol.OP_XY, BaseProtocol.OP_XYL, BaseProtocol.OP_XLYL,
+                 BaseProtocol.OP_NP_XYL, BaseProtocol.OP_NP_XLYL}
 
-    def __init__(self, q):
+    def __init__(self, q, serial_method='pickle', max_batch=65536, max_latency=0.01,
+                 max_step_msgs=10000, max_step_bytes=1 << 22, overflow=OVERFLOW_BLOCK, nseries=1,
+                 dtype=BaseProtocol._NP_DTYPE):
         """
+        Data messages waiting in the queue are coalesced and sent as a
+        single OP_NP_XLYL frame once max_batch points are pending, or the
+        oldest pending point is max_latency seconds old.
+
+        Each event loop step drains up to max_step_msgs queued messages
+        or max_step_bytes bytes of frames, whichever comes first, and
+        sends them with a single flush of the transport's write buffer.
+
         :param q: queue.Queue
         :type q: queue.Queue
+        :param max_batch: max points per frame
+        :type max_batch: int
+        :param max_latency: max seconds to hold points back for batching
+        :type max_latency: float
+        :param max_step_msgs: max queued messages drained per step
+        :type max_step_msgs: int
+        :param max_step_bytes: max bytes sent per step
+        :type max_step_bytes: int
+        :param overflow: one of overflow_policies, what put_* does when
+                         the queue is full. Only 'block' ever stalls the
+                         caller; dropped and decimated points are counted.
+        :type overflow: str
+        :param nseries: number of y columns sharing each x, for
+                        put_series(). The other put_* send a single y
+                        column, so raise ValueError unless it's 1.
+        :type nseries: int
+        :param dtype: dtype y is sent as, normally the plot's. x is
+                      always sent as float64, see XYPlotterProtocol.
         """
+        if overflow not in overflow_policies:
+            raise ValueError("Unknown overflow policy: %r" % overflow)
 
-        super().__init__()
+        super().__init__(serial_method)
         self._queue = q
-        self.step_work = self._step_work().__next__
+        self._ring = None
+        self.nseries = nseries
+        self.dtype = np.dtype(dtype)
+        self._batch = _XYBatch(nseries + 1, self.dtype)
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.max_step_msgs = max_step_msgs
+        self.max_step_bytes = max_step_bytes
+        self._step_bytes = 0
+        self.overflow = overflow
+        self.dropped = 0
+        self.decimated = 0
+        self._scheduled = False
+        self._flush_scheduled = False
 
-    def _step_work(self):
-        while self.transport is None:
-            yield
+    def connection_made(self, transport):
+        super().connection_made(transport)
+        self._ring = transport.ring
+
+    def attach(self, loop):
+        """ Send whenever put_* wakes the loop, and read
+        RPC responses when the transport is readable.
+        """
+        self.loop = loop
+        loop.add_reader(self.transport, self._on_readable)
+        self._notify()  # anything queued before now
+
+    def detach(self):
+        loop = self.loop
+        if loop is not None:
+            self.loop = None
+            loop.remove_reader(self.transport)
+
+    def _notify(self):
+        # called after every put, wakes the loop at most once per drain
+        loop = self.loop
+        if loop is not None and not self._scheduled:
+            self._scheduled = True
+            loop.call_soon_threadsafe(self._on_ready)
+
+    def _on_ready(self):
+        # clear the flag before draining, so a put racing
+        # with the drain schedules another one
+        self._scheduled = False
+        if self.loop is None:
+            return
+        self._send_pending()
+        if self._queue.qsize():
+            # stopped at the per step limits, let other work run first
+            self._notify()
+        elif self._batch.n and not self._flush_scheduled:
+            self._flush_scheduled = True
+            delay = self._batch.started + self.max_latency - time.time()
+            self.loop.call_later(max(delay, 0), self._on_flush)
+
+    def _on_flush(self):
+        self._flush_scheduled = False
+        self._on_ready()
+
+    def _on_readable(self):
         while True:
-            r, w, x = self.transport.select(None if self.blocking_io else 0)
-            if w:
-                try:
-                    op, data = self._queue.get(False, None)
-                except queue.Empty:
-                    pass
-                else:
-                    msg = self.serialize((op, data))
-                    self.transport.write(msg)
-            if r:
-                op, data = self.deserialize(self.transport)
-                if op == self.OP_RPC:
-                    rsp = data
-                    fut = self._pending_futures.pop(rsp.id)
-                    if rsp.exc:
-                        fut.set_exception(rsp.exc)
-                    else:
-                        fut.set_result(rsp.value)
-                else:
-                    logger.error("Unsupported op: %d", op)
-            yield
+            try:
+                self._read_message()
+            except EOFError:
+                logger.debug("EOFError loading message: Connection Lost")
+                return False
+            if not self.transport.buffered():
+                return True
+
+    def _put_ring(self, cols):
+        with self.dlock:
+            self._ring.put_tail(cols)
+
+    def _read_message(self):
+        op, data = self.deserialize(self.transport)
+        if op == self.OP_RPC:
+            rsp = data
+            fut = self._pending_futures.pop(rsp.id)
+            if rsp.exc:
+                fut.set_exception(rsp.exc)
+            else:
+                fut.set_result(rsp.value)
+        else:
+            logger.error("Unsupported op: %d", op)
 
-    def step_work(self):
-        pass
+    def _send_pending(self):
+        """ Drain the queue, up to the per step limits, coalescing data
+        messages. Other messages flush the batch first, so the
+        order of messages is preserved.
+        """
+        batch = self._batch
+        self._step_bytes = 0
+        for _ in range(self.max_step_msgs):
+            try:
+                op, data = self._queue.get(False, None)
+            except queue.Empty:
+                break
+            if op in self._data_ops:
+                batch.add(op, data)
+                if batch.n >= self.max_batch:
+                    self._send_batch()
+            else:
+                if batch.n:
+                    self._send_batch()
+                self._write(self.serialize((op, data)))
+            if self._step_bytes >= self.max_step_bytes:
+                break
+        if batch.n and time.time() - batch.started >= self.max_latency:
+            self._send_batch()
+        if self._step_bytes:
+            self.transport.flush()
+
+    def _send_batch(self):
+        self._write(self.serialize((self.OP_NP_XLYL, self._batch.take())))
+
+    def _write(self, msg):
+        self.transport.write_buffered(msg)
+        self._step_bytes += len(msg)
 
     def put_rpc(self, func_name, *args, **kwargs):
         req = RPCRequest(func_name, args, kwargs)
         fut = Future()
-        self._queue.put((self.OP_RPC, req))
+        # register before queueing, the response may arrive at any time after
         self._pending_futures[req.id] = fut
+        self._queue.put((self.OP_RPC, req))
+        self._notify()
         return fut
 
+    def _put_data(self, item):
+        if self.overflow == OVERFLOW_BLOCK:
+            self._queue.put(item)
+        else:
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                self._handle_overflow(item)
+        self._notify()
+
+    def _handle_overflow(self, item):
+        q = self._queue
+        with q.mutex:
+            if self.overflow == OVERFLOW_DROP_OLDEST:
+                put = self._drop_oldest(item)
+            elif self.overflow == OVERFLOW_DECIMATE:
+                put = self._decimate(item)
+            else:
+                put = False
+            if put:
+                q.not_empty.notify()
+            else:
+                # no queued data to make room with (eg all RPC
+                # requests), or drop-newest
+                self.dropped += _data_npts(*item)
+
+    def _drop_oldest(self, item):
+        # called with the queue's mutex held
+        pending = self._queue.queue
+        for i, (op, data) in enumerate(pending):
+            if op in self._data_ops:
+                del pending[i]
+                self.dropped += _data_npts(op, data)
+                pending.append(item)
+                return True
+        return False
+
+    def _decimate(self, item):
+        # called with the queue's mutex held. Merge the trailing run
+        # of data messages with the new one and keep every other point.
+        pending = self._queue.queue
+        run = [item]
+        while pending and pending[-1][0] in self._data_ops:
+            run.append(pending.pop())
+        if len(run) == 1:
+            return False
+        batch = _XYBatch(self.nseries + 1, self.dtype)
+        for op, data in reversed(run):
+            batch.add(op, data)
+        n = batch.n
+        cols = tuple(c[::2] for c in batch.take())
+        self.decimated += n - len(cols[0])
+        pending.append((self.OP_NP_XLYL, cols))
+        self._queue.unfinished_tasks -= len(run) - 2
+        return True
+
+    def _check_single_series(self):
+        # a single y column would be taken for the first of nseries
+        if self.nseries != 1:
+            raise ValueError("Plot has %d series, use put_series()" % self.nseries)
+
     def put_xy(self, x, y):
-        self._queue.put((self.OP_XY, (x, y)))
+        self._check_single_series()
+        if self._ring is not None:
+            with self.dlock:
+                self._ring.put((x, y))
+            return
+        self._put_data((self.OP_XY, (x, y)))
 
     def put_xyl(self, xyl):
         """
@@ -142,118 +585,283 @@ class XYUserProtocol(BaseProtocol):
         make a copy to ensure that data isn't modified before
         the producer thread has a chance to serialize it.
         """
+        self._check_single_series()
+        if self._ring is not None:
+            xyl = np.fromiter(itertools.chain.from_iterable(xyl), self._NP_DTYPE, 2 * len(xyl))
+            self._put_ring(xyl.reshape(-1, 2).T)
+            return
         if isinstance(xyl, list):
             xyl = tuple(xyl)
-        self._queue.put((self.OP_XYL, xyl))
+        self._put_data((self.OP_XYL, xyl))
 
     def put_xlyl(self, xl, yl):
+        self._check_single_series()
+        if self._ring is not None:
+            self._put_ring((np.asarray(xl, self._NP_DTYPE), np.asarray(yl, self._NP_DTYPE)))
+            return
         if isinstance(xl, list):
             xl = tuple(xl)
         if isinstance(yl, list):
             yl = tuple(yl)
-        self._queue.put((self.OP_XLYL, xl, yl))
+        self._put_data((self.OP_XLYL, (xl, yl)))
 
     def put_np_xyl(self, np_xyl):
         """
         :param np_xyl: np.ndarray
         :type np_xyl: np.ndarray
         """
-        data = np_xyl.tobytes()
-        self._queue.put((self.OP_NP_XYL, data))
+        self._check_single_series()
+        if self._ring is not None:
+            self._put_ring(np.asarray(np_xyl).reshape(-1, 2).T)
+            return
+        data = np.asarray(np_xyl, self._NP_DTYPE).tobytes()
+        self._put_data((self.OP_NP_XYL, data))
 
     def put_np_xlyl(self, npxl, npyl):
         """
         :param npxl: np.ndarray
         :type npyl: np.ndarray
         """
-        xd = np.asarray(npxl, self._NP_DTYPE).tobytes()
-        yd = np.asarray(npyl, self._NP_DTYPE).tobytes()
-        self._queue.put((self.OP_NP_XLYL, (xd, yd)))
+        self._check_single_series()
+        if self._ring is not None:
+            self._put_ring((npxl, npyl))
+            return
+        # copies, so the caller may reuse its arrays. y of the
+        # plot's dtype, eg int16 ADC counts, isn't converted
+        xd = np.array(npxl, self._NP_DTYPE)
+        yd = np.array(npyl, self.dtype)
+        self._put_data((self.OP_NP_XLYL, (xd, yd)))
+
+    def put_series(self, x, ys):
+        """ Put points of every series at once, sent as one
+        OP_NP_XLYL frame of x followed by a column per series.
+        The series id is the column's index in ys.
+
+        :param x: x of each point
+        :type x: np.ndarray
+        :param ys: y of each point, one row per series
+        :type ys: np.ndarray | list[np.ndarray]
+        """
+        if len(ys) != self.nseries:
+            raise ValueError("Expected %d series, got %d" % (self.nseries, len(ys)))
+        if self._ring is not None:
+            self._put_ring([np.asarray(x)] + [np.asarray(y) for y in ys])
+            return
+        cols = [np.array(x, self._NP_DTYPE)]
+        cols.extend(np.array(y, self.dtype) for y in ys)
+        self._put_data((self.OP_NP_XLYL, tuple(cols)))
 
 
 class XYPlotterProtocol(BaseProtocol):
+    # max messages handled per readiness callback
+    max_step_msgs = 10000
 
-    def __init__(self, xq, yq, rpc_req, rpc_rsp):
+    def __init__(self, xyq, rpc_req, rpc_rsp, serial_method='pickle', archive=None, compact_x=False):
         """
-        :param xq: x data queue
-        :type xq: RingBuffer
-        :param yq: y data queue
-        :type yq: RingBuffer
+        :param xyq: (x, y) data queue
+        :type xyq: ColumnRingBuffer
+        :param archive: where every row is also appended, if given
+        :type archive: simplertplot.archive.ColumnArchive
+        :param compact_x: store x in xyq as offsets from x_base, so a
+                          float32 buffer keeps the resolution of the
+                          span it holds instead of that of eg epoch
+                          timestamps. Not done for shared memory rings,
+                          which the producer writes as is.
         """
 
-        super().__init__()
+        super().__init__(serial_method)
         self.rpc_req = rpc_req
         self.rpc_rsp = rpc_rsp
         self.dlock = threading.Lock()
-        self.xq = xq
-        self.yq = yq
+        self.xyq = xyq
+        self.archive = archive
         self.current_update = 0
-        self.step_work = self.pump_data().__next__
+        # with a shared memory transport the producer writes straight
+        # into the ring buffer, only RPC messages use the socket
+        self._ring = xyq if isinstance(xyq, SharedColumnRingBuffer) else None
+        self._ring_written = 0
+        self.compact_x = compact_x and self._ring is None
+        # origin of the x column, x = stored x + x_base. An np.float64
+        # so adding it to a float32 column gives float64
+        self.x_base = np.float64(0)
+        # trailing rows of xyq that arrived in non-decreasing x order
+        self._x_sorted_rows = 0
+        # set whenever data or an RPC request arrives, for the frame pacer.
+        # Rows written straight to a shared memory ring don't set it.
+        self.wake = threading.Event()
+        # set once the user is done with the connection
+        self.finished = threading.Event()
 
-    def step_work(self):
-        pass  # set in __init___
-
-    def pump_data(self):
-        put_x = self.xq.put
-        ex_x = self.xq.extend
-        put_y = self.yq.put
-        ex_y = self.yq.extend
-        lock = self.dlock
-        tp = self.transport
-        self.current_update = 0
-        deserialize = self.deserialize
-        serialize = self.serialize
-
-        while True:
+    @contextlib.contextmanager
+    def lock_queue(self):
+        with self.dlock:
+            if self._ring is not None:
+                written = self._ring.written
+                new = written - self._ring_written
+                self.current_update += new
+                self._ring_written = written
+                if self.archive is not None and new:
+                    # rows the ring has already overwritten are lost
+                    self.archive.append(self._ring.get()[:, -min(new, len(self._ring)):])
             yield
-            r, w, _ = tp.select(None if self.blocking_io else 0)
-            if r:
-                try:
-                    code, data = deserialize(tp)
-                except EOFError:
-                    logger.debug("EOFError loading pickle: Connection Lost")
-                    tp.reconnect()
-                    continue
-                if code == self.OP_XY:
-                    x, y = data
-                    with lock:
-                        put_x(x)
-                        put_y(y)
-                    self.current_update += 1
-                elif code == self.OP_XYL:
-                    for x, y in data:
-                        with lock:
-                            put_x(x)
-                            put_y(y)
-                    self.current_update += len(data)
-                elif code == self.OP_XLYL:
-                    x_data, y_data = data
-                    with lock:
-                        ex_x(x_data)
-                        ex_y(y_data)
-                    self.current_update += len(x_data)
-                elif code == self.OP_EXIT:
-                    break
-                elif code == self.OP_NP_XLYL:
-                    xl, yl = data
-                    xl = np.frombuffer(xl, self._NP_DTYPE)
-                    yl = np.frombuffer(yl, self._NP_DTYPE)
-                    with lock:
-                        ex_x(xl)
-                        ex_y(yl)
-                    self.current_update += len(xl)
-                elif code == self.OP_RPC:
-                    self.rpc_req.put(data)
-                else:
-                    raise ValueError(code)
-
-            if w:
-                try:
-                    rsp = self.rpc_rsp.get(False)
-                except queue.Empty:
-                    pass
-                else:
-                    msg = serialize((self.OP_RPC, rsp))
-                    tp.write(msg)
 
+    def attach(self, loop):
+        """ Read whenever the transport is readable """
+        self.loop = loop
+        loop.add_reader(self.transport, self._on_readable)
 
+    def detach(self):
+        loop = self.loop
+        if loop is not None:
+            self.loop = None
+            loop.remove_reader(self.transport)
+
+    def _on_readable(self):
+        tp = self.transport
+        for _ in range(self.max_step_msgs):
+            if not self._receive():
+                self.detach()
+                self._finish()
+                return
+            if not tp.buffered():
+                return
+        # come back for the rest after other work has had a turn
+        self.loop.call_soon(self._on_buffered)
+
+    def _on_buffered(self):
+        # the socket may have been drained by a reader callback since
+        if self.loop is not None and self.transport.buffered():
+            self._on_readable()
+
+    def _receive(self):
+        """ Read and handle one message. Returns False
+        once the connection is finished with.
+        """
+        try:
+            code, data = self.deserialize(self.transport)
+        except EOFError:
+            logger.debug("EOFError loading message: Connection Lost")
+            return False
+        if code == self.OP_EXIT:
+            return False
+        elif code == self.OP_RPC:
+            self.put_request(data)
+        else:
+            self.ingest(code, data)
+        return True
+
+    def _finish(self):
+        self.finished.set()
+        self.wake.set()
+
+    def put_request(self, req):
+        """ Hand an RPC request over to the plot """
+        self.rpc_req.put(req)
+        self.wake.set()
+
+    def respond(self, rsp):
+        """ Queue an RPC response to be sent back to the user """
+        self.rpc_rsp.put(rsp)
+        loop = self.loop
+        if loop is not None:
+            loop.call_soon_threadsafe(self._send_responses)
+
+    def _send_responses(self):
+        while True:
+            try:
+                rsp = self.rpc_rsp.get(False)
+            except queue.Empty:
+                return
+            self.transport.write(self._dump_response(rsp))
+
+    def _dump_response(self, rsp):
+        """ Serialize an RPC response. A result the wire format can't
+        encode is answered with an RPCError instead, so the caller's
+        future still resolves.
+        """
+        try:
+            return self.serialize((self.OP_RPC, rsp))
+        except (TypeError, ValueError, AttributeError, pickle.PicklingError) as e:
+            logger.debug("Can't serialize RPC response %s", rsp.id, exc_info=True)
+            exc = RPCError("Can't send RPC result: %s: %s" % (type(e).__name__, e))
+            return self.serialize((self.OP_RPC, RPCResponse(rsp.id, None, exc)))
+
+    def ingest(self, code, data):
+        """ Push the payload of one data message into the ring buffer.
+        Every list op is converted to arrays once and pushed with a single
+        put_list() under one hold of the lock.
+        """
+        if code == self.OP_XY and self.compact_x:
+            cols = [(v,) for v in data]
+        elif code == self.OP_XY:
+            with self.dlock:
+                self.xyq.put(data)
+                self.current_update += 1
+            if self.archive is not None:
+                self.archive.append([(v,) for v in data])
+            self.wake.set()
+            return
+        elif code == self.OP_XYL:
+            if isinstance(data, np.ndarray):
+                xyl = data
+            else:
+                # fromiter over the flattened pairs is ~3x faster than
+                # np.asarray() on a sequence of tuples
+                xyl = np.fromiter(itertools.chain.from_iterable(data), self._NP_DTYPE, 2 * len(data))
+            cols = xyl.reshape(-1, 2).T
+        elif code == self.OP_XLYL:
+            cols = [c if isinstance(c, np.ndarray) else np.fromiter(c, self._NP_DTYPE, len(c))
+                    for c in data]
+        elif code == self.OP_NP_XYL:
+            cols = self._np_column(data).reshape(-1, 2).T
+        elif code == self.OP_NP_XLYL:
+            cols = [self._np_column(c) for c in data]
+        else:
+            raise ValueError(code)
+        self._put_cols(cols)
+
+    def _compact_x(self, cols):
+        """ cols with x as offsets from x_base. Called with the queue
+        locked. The base moves up to the oldest buffered x only when
+        every buffered row arrived in non-decreasing x order, as for a
+        time series, and the newest offset has grown so large that the
+        buffer's dtype holds it coarser than twice the span buffered.
+        That shifts the whole buffer, about once per maxsize rows for a
+        time series and never for scatter data.
+        """
+        x = np.asarray(cols[0], np.float64)
+        ring = self.xyq
+        in_order = bool(np.all(x[1:] >= x[:-1]))
+        if not len(ring):
+            self.x_base = x[0]
+            self._x_sorted_rows = 0
+        else:
+            stored = ring.get()[0]
+            if in_order and x[0] - self.x_base >= stored[-1]:
+                if self._x_sorted_rows >= len(ring):
+                    oldest = float(stored[0])
+                    offset = x[-1] - self.x_base
+                    dtype = stored.dtype.type
+                    if np.spacing(dtype(offset)) > np.spacing(dtype(2 * (offset - oldest))):
+                        ring.shift(0, oldest)
+                        self.x_base += oldest
+            else:
+                self._x_sorted_rows = 0
+        if in_order:
+            self._x_sorted_rows += len(x)
+        return [x - self.x_base] + list(cols[1:])
+
+    def _np_column(self, data):
+        # pickled messages carry raw bytes, binary frames are already arrays
+        if isinstance(data, np.ndarray):
+            return data
+        return np.frombuffer(data, self._NP_DTYPE)
+
+    def _put_cols(self, cols):
+        with self.dlock:
+            self.xyq.put_tail(self._compact_x(cols) if self.compact_x else cols)
+            self.current_update += len(cols[0])
+        if self.archive is not None:
+            # the whole batch at once, outside the lock the plot reads under
+            self.archive.append(cols)
+        self.wake.set()
@@ -20,6 +20,9 @@ logger.setLevel(logging.DEBUG)
 del _h, _f
 
 
+import os
+from multiprocessing import resource_tracker, shared_memory
+
 import numpy as np
 
 
@@ -30,11 +33,18 @@ class RingBuffer():
     def __init__(self, maxsize, dtype=_default_dtype):
         if not maxsize or maxsize < 0:
             raise ValueError("%s requires max size argument" % self.__class__.__name__)
-        self._queue = np.zeros(maxsize, dtype)
         self._dtype = dtype
         self._maxsize = maxsize
         self._end = 0
         self._sz = 0
+        self._alloc()
+
+    def _alloc(self):
+        self._queue = np.zeros(self._maxsize, self._dtype)
+
+    @property
+    def maxsize(self):
+        return self._maxsize
 
     def put(self, d):
         self._queue[self._end] = d
@@ -49,27 +59,37 @@ class RingBuffer():
         :param lst: list to extend data from
         :type lst: list | tuple | np.ndarray
         """
-        slen = len(lst)
+        slen = self._len(lst)
         if slen > self._maxsize:
             raise ValueError("Can't add more than maxsize elements (%d > %d)" % (slen, self._maxsize))
         if slen + self._end <= self._maxsize:
             start = self._end
             end = slen + self._end
-            self._queue[start:end] = lst
+            self._set_slice(start, end, lst)
             self._end = end
         else:
             # add slice in two steps
             first_step = self._maxsize - self._end
-            self._queue[self._end: self._maxsize] = lst[:first_step]
+            head, tail = self._split(lst, first_step)
+            self._set_slice(self._end, self._maxsize, head)
             second_step = slen - first_step
-            self._queue[:second_step] = lst[first_step:]
+            self._set_slice(0, second_step, tail)
             self._end = second_step
 
         if self._sz < self._maxsize:
-            self._sz += slen
+            self._sz = min(self._sz + slen, self._maxsize)
         if self._end == self._maxsize:
             self._end = 0
 
+    def _len(self, lst):
+        return len(lst)
+
+    def _split(self, lst, n):
+        return lst[:n], lst[n:]
+
+    def _set_slice(self, start, end, lst):
+        self._queue[start:end] = lst
+
     def extend(self, it):
         try:
             it.__len__
@@ -90,3 +110,415 @@ class RingBuffer():
 
     def __len__(self):
         return self._sz
+
+
+class MirrorRingBuffer(RingBuffer):
+    """ Ring buffer backed by a mirrored ("double-mapped") array.
+
+    Every element is stored twice, at i and at i + maxsize, so the
+    last maxsize elements are always contiguous in memory and get()
+    can return a view instead of an np.roll copy once the buffer has
+    wrapped. Writes cost twice as much, but a frame only reads the
+    buffer once while it may be written to many times, and writes
+    are a fraction of maxsize.
+
+    The view returned by get() aliases the buffer, so it is only
+    valid until the next put.
+    """
+
+    def _alloc(self):
+        maxsize = self._maxsize
+        self._mirror = np.zeros(self._shape(maxsize * 2), self._dtype)
+        self._queue = self._mirror[..., :maxsize]
+        self._shadow = self._mirror[..., maxsize:]
+
+    def _shape(self, n):
+        return n
+
+    def put(self, d):
+        self._queue[..., self._end] = d
+        self._shadow[..., self._end] = d
+        self._end += 1
+        if self._end == self._maxsize:
+            self._end = 0
+        if self._sz < self._maxsize:
+            self._sz += 1
+
+    def _set_slice(self, start, end, lst):
+        self._queue[start:end] = lst
+        self._shadow[start:end] = self._queue[start:end]
+
+    def get(self):
+        """
+        Get method. Returns a view of the entire queue,
+        oldest element first, without copying.
+        """
+        if self._sz < self._maxsize:
+            return self._queue[..., : self._end]
+        else:
+            return self._mirror[..., self._end: self._end + self._maxsize]
+
+
+class ColumnRingBuffer(MirrorRingBuffer):
+    """ Mirrored ring buffer holding ncols columns (eg x and y)
+    in a single 2-D array of shape (ncols, maxsize).
+
+    All columns share one write index, so a put() or put_list() is
+    a single index update and get() always returns a consistent
+    (ncols, n) snapshot view.
+    """
+
+    def __init__(self, maxsize, ncols=2, dtype=RingBuffer._default_dtype):
+        self._ncols = ncols
+        super().__init__(maxsize, dtype)
+
+    def _shape(self, n):
+        return self._ncols, n
+
+    def put_list(self, cols):
+        """
+        :param cols: one equal-length sequence per column
+        :type cols: list | tuple | np.ndarray
+        """
+        if len(cols) != self._ncols:
+            raise ValueError("Expected %d columns, got %d" % (self._ncols, len(cols)))
+        super().put_list(cols)
+
+    def put_tail(self, cols):
+        """ put_list(), keeping only the newest maxsize values
+        of each column when cols holds more than fit.
+        """
+        if self._len(cols) > self._maxsize:
+            cols = [c[-self._maxsize:] for c in cols]
+        self.put_list(cols)
+
+    def _len(self, cols):
+        return len(cols[0])
+
+    def _split(self, cols, n):
+        return [c[:n] for c in cols], [c[n:] for c in cols]
+
+    def _set_slice(self, start, end, cols):
+        queue = self._queue
+        for i, c in enumerate(cols):
+            queue[i, start:end] = c
+        self._shadow[:, start:end] = queue[:, start:end]
+
+    def extend(self, it):
+        self.put_list([c if hasattr(c, '__len__') else tuple(c) for c in it])
+
+    def shift(self, col, delta):
+        """ Subtract delta from every stored value of column col,
+        eg to move the origin of an x column.
+        """
+        self._mirror[col] -= delta
+
+
+class _LODLevel():
+    """ Aggregates of fixed size blocks of rows, in a ring of
+    blocks indexed by absolute block number.
+    """
+
+    def __init__(self, size, ncols, nblocks, dtype):
+        self.size = size
+        self.mins = np.zeros((ncols, nblocks), dtype)
+        self.maxs = np.zeros((ncols, nblocks), dtype)
+        self.sums = np.zeros((ncols, nblocks), np.float64)
+
+    def _index(self, j0, j1):
+        # slice unless the range wraps around the ring
+        nblocks = self.mins.shape[1]
+        i0 = j0 % nblocks
+        if i0 + j1 - j0 <= nblocks:
+            return slice(i0, i0 + j1 - j0)
+        return np.arange(j0, j1) % nblocks
+
+    def set_blocks(self, j0, mins, maxs, sums):
+        idx = self._index(j0, j0 + mins.shape[1])
+        self.mins[:, idx] = mins
+        self.maxs[:, idx] = maxs
+        self.sums[:, idx] = sums
+
+    def take(self, arr, j0, j1):
+        return arr[:, self._index(j0, j1)]
+
+
+class LODColumnRingBuffer(ColumnRingBuffer):
+    """ ColumnRingBuffer that maintains a level-of-detail pyramid as
+    rows are put: the min, max and mean of every column over blocks of
+    `block` rows, then of blocks `factor` times larger at each level up.
+
+    Only completed blocks are aggregated, each exactly once, from the
+    rows or the level below, so upkeep is O(rows put). envelope() reads
+    the coarsest level that still resolves the requested width, so
+    drawing a long history costs O(pixels) rather than O(maxsize).
+    """
+
+    def __init__(self, maxsize, ncols=2, dtype=RingBuffer._default_dtype, block=64, factor=8):
+        super().__init__(maxsize, ncols, dtype)
+        self._total = 0  # rows stored since creation
+        self.block = block
+        self.factor = factor
+        self.levels = []
+        size = block
+        while maxsize // size >= factor:
+            self.levels.append(_LODLevel(size, ncols, maxsize // size + 1, dtype))
+            size *= factor
+
+    def put(self, row):
+        super().put(row)
+        self._update(1)
+
+    def put_list(self, cols):
+        super().put_list(cols)
+        self._update(self._len(cols))
+
+    def _update(self, n):
+        start = self._total
+        total = self._total = start + n
+        if not self.levels:
+            return
+
+        # blocks of the first level completed by this put, from the rows
+        level = self.levels[0]
+        size = level.size
+        j0 = start // size
+        j1 = total // size
+        if j1 == j0:
+            return
+        data = self.get()
+        first = total - self._sz  # oldest row still stored
+        j0 = max(j0, first // size)
+        lo = max(j0 * size, first)
+        rows = data[:, lo - first: j1 * size - first]
+        if lo == j0 * size:
+            blocks = rows.reshape(self._ncols, j1 - j0, size)
+            level.set_blocks(j0, np.fmin.reduce(blocks, axis=2), np.fmax.reduce(blocks, axis=2),
+                             blocks.sum(axis=2, dtype=np.float64))
+        else:
+            # rare: put of nearly maxsize rows, the oldest block is
+            # partly overwritten already
+            starts = np.concatenate(([0], np.arange(j0 + 1, j1) * size - lo))
+            level.set_blocks(j0, np.fmin.reduceat(rows, starts, axis=1),
+                             np.fmax.reduceat(rows, starts, axis=1),
+                             np.add.reduceat(rows, starts, axis=1, dtype=np.float64))
+
+        # then each level from the one below
+        factor = self.factor
+        for below, level in zip(self.levels, self.levels[1:]):
+            size = level.size
+            j0 = start // size
+            j1 = total // size
+            if j1 == j0:
+                break
+            shape = self._ncols, j1 - j0, factor
+            k0 = j0 * factor
+            k1 = j1 * factor
+            level.set_blocks(j0, np.fmin.reduce(below.take(below.mins, k0, k1).reshape(shape), axis=2),
+                             np.fmax.reduce(below.take(below.maxs, k0, k1).reshape(shape), axis=2),
+                             below.take(below.sums, k0, k1).reshape(shape).sum(axis=2))
+
+    def shift(self, col, delta):
+        super().shift(col, delta)
+        for level in self.levels:
+            level.mins[col] -= delta
+            level.maxs[col] -= delta
+            level.sums[col] -= delta * level.size
+
+    def _pick_level(self, nrows, nbins):
+        # coarsest level with at least nbins blocks in nrows
+        best = None
+        for level in self.levels:
+            if nrows // level.size < nbins:
+                break
+            best = level
+        return best
+
+    def _block_range(self, level, start, stop):
+        # full blocks within rows [start, stop) of get()
+        first = self._total - self._sz
+        size = level.size
+        j0 = -(-(first + start) // size)
+        j1 = (first + stop) // size
+        return first, j0, max(j0, j1)
+
+    def envelope(self, nbins, start=0, stop=None):
+        """ Rows [start, stop) of get() (default: all), reduced to the min
+        and max of each block of the coarsest level that still has nbins
+        blocks in the range. Each block becomes two rows, (mins) then
+        (maxs), between the unaggregated rows at either end. For a
+        monotonic x column, that is the block's first and last x.
+
+        Small ranges are returned as is, as a view.
+
+        :param nbins: minimum resolution, ie the plot's width in pixels
+        :type nbins: int
+        :rtype: np.ndarray
+        """
+        data = self.get()
+        stop = self._sz if stop is None else min(stop, self._sz)
+        start = max(start, 0)
+        level = self._pick_level(stop - start, int(nbins))
+        if level is None:
+            return data[:, start:stop]
+        first, j0, j1 = self._block_range(level, start, stop)
+        body = np.empty((self._ncols, 2 * (j1 - j0)), data.dtype)
+        body[:, 0::2] = level.take(level.mins, j0, j1)
+        body[:, 1::2] = level.take(level.maxs, j0, j1)
+        head = data[:, start: j0 * level.size - first]
+        tail = data[:, j1 * level.size - first: stop]
+        return np.concatenate((head, body, tail), axis=1)
+
+    def extrema(self, start=0, stop=None):
+        """ (mins, maxs) of each column over rows [start, stop) of get()
+        (default: all), ignoring nan. The range is covered by the largest
+        blocks that fit, so this is O(block + factor * levels) instead
+        of a scan of the rows.
+
+        :rtype: (np.ndarray, np.ndarray)
+        """
+        stop = self._sz if stop is None else min(stop, self._sz)
+        start = max(start, 0)
+        if stop <= start:
+            raise ValueError("extrema of an empty range")
+        first = self._total - self._sz
+        mins = []
+        maxs = []
+        self._cover(first + start, first + stop, len(self.levels) - 1, mins, maxs)
+        return np.fmin.reduce(mins), np.fmax.reduce(maxs)
+
+    def _cover(self, a0, a1, k, mins, maxs):
+        # append the extrema of absolute rows [a0, a1) using
+        # levels k and below
+        if a1 <= a0:
+            return
+        if k < 0:
+            rows = self.get()[:, a0 - (self._total - self._sz): a1 - (self._total - self._sz)]
+            mins.append(np.fmin.reduce(rows, axis=1))
+            maxs.append(np.fmax.reduce(rows, axis=1))
+            return
+        level = self.levels[k]
+        size = level.size
+        j0 = -(-a0 // size)
+        j1 = a1 // size
+        if j1 <= j0:
+            self._cover(a0, a1, k - 1, mins, maxs)
+            return
+        mins.append(np.fmin.reduce(level.take(level.mins, j0, j1), axis=1))
+        maxs.append(np.fmax.reduce(level.take(level.maxs, j0, j1), axis=1))
+        self._cover(a0, j0 * size, k - 1, mins, maxs)
+        self._cover(j1 * size, a1, k - 1, mins, maxs)
+
+    def stats(self, level, start=0, stop=None):
+        """ (mins, maxs, means) of the full blocks of self.levels[level]
+        within rows [start, stop) of get(), each of shape (ncols, nblocks).
+        """
+        level = self.levels[level]
+        stop = self._sz if stop is None else min(stop, self._sz)
+        _, j0, j1 = self._block_range(level, max(start, 0), stop)
+        return (level.take(level.mins, j0, j1), level.take(level.maxs, j0, j1),
+                level.take(level.sums, j0, j1) / level.size)
+
+
+class SharedColumnRingBuffer(ColumnRingBuffer):
+    """ ColumnRingBuffer stored in a multiprocessing.shared_memory block,
+    so a producer process can write into the buffer that the plotter
+    process reads from directly.
+
+    The write index, size and a running count of written rows live in a
+    small header at the start of the block. Created with name=None, a
+    new block is allocated (and unlinked again by close()); otherwise
+    the named block is attached. Only one process may write. The reader
+    does not take part in the writer's locking, so a get() that races a
+    put() may show a partially written frame.
+    """
+    _header_size = 64
+
+    def __init__(self, maxsize, ncols=2, dtype=RingBuffer._default_dtype, name=None):
+        self._owner = name is None
+        nbytes = self._header_size + 2 * maxsize * ncols * np.dtype(dtype).itemsize
+        if self._owner:
+            self._shm = shared_memory.SharedMemory(create=True, size=nbytes)
+            self._header = np.ndarray(3, np.int64, self._shm.buf)
+            super().__init__(maxsize, ncols, dtype)
+        else:
+            self._shm = _attach_shared_memory(name)
+            # RingBuffer.__init__ resets the write index and size,
+            # which mustn't reach the header of the owner's ring
+            self._header = np.zeros(3, np.int64)
+            super().__init__(maxsize, ncols, dtype)
+            self._header = np.ndarray(3, np.int64, self._shm.buf)
+
+    def _alloc(self):
+        maxsize = self._maxsize
+        self._mirror = np.ndarray(self._shape(maxsize * 2), self._dtype, self._shm.buf, self._header_size)
+        self._queue = self._mirror[..., :maxsize]
+        self._shadow = self._mirror[..., maxsize:]
+
+    @property
+    def _end(self):
+        return int(self._header[0])
+
+    @_end.setter
+    def _end(self, v):
+        self._header[0] = v
+
+    @property
+    def _sz(self):
+        return int(self._header[1])
+
+    @_sz.setter
+    def _sz(self, v):
+        self._header[1] = v
+
+    @property
+    def written(self):
+        """ Total number of rows ever written, by any process """
+        return int(self._header[2])
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    @property
+    def dtype(self):
+        return np.dtype(self._dtype)
+
+    @property
+    def ncols(self):
+        return self._ncols
+
+    def put(self, row):
+        super().put(row)
+        self._header[2] += 1
+
+    def put_list(self, cols):
+        super().put_list(cols)
+        self._header[2] += self._len(cols)
+
+    def close(self):
+        self._mirror = self._queue = self._shadow = self._header = None
+        try:
+            self._shm.close()
+        except BufferError:
+            # views returned by get() are still alive somewhere
+            logger.debug("Shared ring buffer %s still in use, leaving it mapped", self._shm.name)
+        if self._owner:
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                logger.debug("Shared ring buffer %s was already unlinked", self._shm.name)
+
+
+def _attach_shared_memory(name):
+    # Only the creating process should unlink the block. Before python 3.13
+    # attaching also registers it with this process' resource tracker,
+    # which would unlink it when this process exits.
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        pass
+    shm = shared_memory.SharedMemory(name)
+    if os.name == 'posix':
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
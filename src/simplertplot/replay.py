@@ -0,0 +1,175 @@
+"""
+Replay a recorded stream into a plot, at its recorded speed, N
+times that, or as fast as the plot can ingest it.
+
+A recording is a ColumnArchive directory or an .npy file of rows,
+shape (n, ncols) as np.column_stack((x, y0, ...)) makes. Either is
+memory mapped and read in large blocks, which are fed to the plot
+client's ingest() exactly as OP_NP_XLYL messages off the wire are.
+x is taken to be time in seconds when pacing the replay.
+
+Usage: python -m simplertplot.replay recording [--speed N|max] [plot options]
+
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+from simplertplot import manager
+from simplertplot import plots
+from simplertplot import transport
+from simplertplot.archive import ColumnArchive
+
+import logging
+logger = logging.getLogger(__name__)
+_h = logging.StreamHandler()
+_f = logging.Formatter("%(created)s %(name)s %(levelname)s (%(lineno)s): %(message)s")
+_h.setFormatter(_f)
+logger.addHandler(_h)
+logger.propagate = False
+logger.setLevel(logging.DEBUG)
+del _h, _f
+
+
+def open_recording(path):
+    """ A recording as a ColumnArchive, or an (ncols, n)
+    view of an .npy file's rows.
+    """
+    if os.path.isdir(path):
+        return ColumnArchive(path, mode='r')
+    rows = np.load(path, mmap_mode='r')
+    if rows.ndim != 2:
+        raise ValueError("Expected an array of rows, shape (n, ncols), got %r" % (rows.shape,))
+    return rows.T
+
+
+def iter_blocks(recording, block_rows=1 << 16):
+    """ Yield the recording as (ncols, <= block_rows) blocks """
+    if isinstance(recording, ColumnArchive):
+        chunks = recording.iter_chunks()
+    else:
+        chunks = (recording,)
+    for chunk in chunks:
+        for i in range(0, chunk.shape[1], block_rows):
+            yield chunk[:, i:i + block_rows]
+
+
+class Replayer():
+    """ Feeds a recording to a plot's client from a thread.
+
+    speed is a multiple of the recorded rate, or None to feed blocks
+    as fast as ingest() takes them. When paced, rows are fed every
+    interval seconds, or at the next row's time after a gap. The
+    client is finished once the whole recording has been fed, which
+    is what ends a headless plot.
+    """
+
+    def __init__(self, client, recording, speed=1.0, block_rows=1 << 16, interval=0.01):
+        self.client = client
+        self.recording = recording
+        self.speed = speed
+        self.block_rows = block_rows
+        self.interval = interval
+        self.rows = 0
+        self.elapsed = None
+        self._t0 = None  # x of the first row
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(None, self.run, "ReplayThread", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def run(self):
+        start = time.perf_counter()
+        try:
+            for cols in iter_blocks(self.recording, self.block_rows):
+                if self.speed is None:
+                    self._feed(cols)
+                elif not self._pace(cols, start):
+                    return
+                if self._stop.is_set():
+                    return
+        finally:
+            self.elapsed = time.perf_counter() - start
+            self.client._finish()
+
+    def _feed(self, cols):
+        self.client.ingest(self.client.OP_NP_XLYL, cols)
+        self.rows += cols.shape[1]
+
+    def _pace(self, cols, start):
+        x = cols[0]
+        if self._t0 is None:
+            self._t0 = x[0]
+        t0 = self._t0
+        speed = self.speed
+        pos = 0
+        while pos < len(x):
+            now = t0 + (time.perf_counter() - start) * speed
+            end = int(np.searchsorted(x, now, 'right'))
+            if end > pos:
+                self._feed(cols[:, pos:end])
+                pos = end
+            if pos < len(x):
+                due = (x[pos] - t0) / speed - (time.perf_counter() - start)
+                if self._stop.wait(max(due, self.interval)):
+                    return False
+        return True
+
+
+def parse_args(args):
+    p = argparse.ArgumentParser(description="Replay a recorded stream into a plot")
+    p.add_argument("recording", help="ColumnArchive directory or .npy file of rows")
+    p.add_argument("--speed", default="1", help="Multiple of the recorded rate, or 'max'")
+    p.add_argument("--block-rows", default=1 << 16, type=int, help="Rows read and fed at a time")
+    manager._add_plot_args(p)
+    ns = p.parse_args(args)
+    ns.speed = None if ns.speed.lower() == 'max' else float(ns.speed)
+    return ns
+
+
+def replay(ns):
+    """ Replay into the plot described by parsed options,
+    until its window is closed or, headless, the recording ends.
+    Returns the Replayer.
+    """
+    recording = open_recording(ns.recording)
+    ncols = recording.ncols if isinstance(recording, ColumnArchive) else recording.shape[0]
+    ns.nseries = ncols - 1
+    if ns.nseries > 1 and ns.plot == 'xyplotter':
+        ns.plot = 'multixy'
+    if ns.nseries > 1 and not issubclass(plots.get_plot_class(ns.plot), plots.MultiXYPlotter):
+        raise ValueError("%s plots one series, the recording has %d" % (ns.plot, ns.nseries))
+    plotter = manager._make_plot(transport.BaseTransport(), ns)
+    replayer = Replayer(plotter.client, recording, ns.speed, ns.block_rows)
+    plotter.setup_pyplot()
+    plotter.start_plot()
+    replayer.start()
+    try:
+        while not plotter.is_closed():
+            plotter.pacer.wait(plotter.step_plot())
+    finally:
+        replayer.stop()
+        plotter.close_plot()
+    return replayer
+
+
+def main(args=None):
+    ns = parse_args(sys.argv[1:] if args is None else args)
+    replayer = replay(ns)
+    if replayer.elapsed:
+        logger.info("Replayed %d rows in %.2fs", replayer.rows, replayer.elapsed)
+
+
+if __name__ == '__main__':
+    main()
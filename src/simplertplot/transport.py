@@ -7,15 +7,20 @@ Created in: PyCharm Community Edition
 
 """
 import io
+import itertools
+import os
+import tempfile
 
 __author__ = 'Nathan Starkweather'
 
 import logging
 import socket
-import errno
 from simplertplot import util
+from simplertplot import queues
 from select import select
 
+import numpy as np
+
 logger = logging.getLogger(__name__)
 _h = logging.StreamHandler()
 _f = logging.Formatter("%(created)s %(name)s %(levelname)s (%(lineno)s): %(message)s")
@@ -26,7 +31,81 @@ logger.setLevel(logging.DEBUG)
 del _h, _f
 
 
+class SocketReader():
+    """ Buffered reader for a blocking socket.
+
+    Unlike io.BufferedReader, it reports how many bytes it holds with
+    buffered(). Bytes already pulled off the socket don't make it
+    readable to select(), so an event loop has to check buffered()
+    before going back to sleep or it can strand complete messages.
+    """
+
+    def __init__(self, sock, bufsize=1 << 16):
+        self.sock = sock
+        self.bufsize = bufsize
+        self._buf = bytearray()
+        self._pos = 0
+
+    def buffered(self):
+        return len(self._buf) - self._pos
+
+    def _fill(self):
+        chunk = self.sock.recv(self.bufsize)
+        if not chunk:
+            return False
+        if self._pos:
+            del self._buf[:self._pos]
+            self._pos = 0
+        self._buf += chunk
+        return True
+
+    def _take(self, n):
+        data = self._buf[self._pos:self._pos + n]
+        self._pos += len(data)
+        return data
+
+    def read(self, n=-1):
+        if n is None or n < 0:
+            while self._fill():
+                pass
+            n = self.buffered()
+        while self.buffered() < n:
+            if not self._fill():
+                break
+        return bytes(self._take(n))
+
+    def readinto(self, b):
+        view = memoryview(b).cast('B')
+        n = min(self.buffered(), len(view))
+        view[:n] = self._take(n)
+        while n < len(view):
+            if len(view) - n >= self.bufsize:
+                # big payloads go straight into the caller's buffer
+                got = self.sock.recv_into(view[n:])
+                if not got:
+                    break
+                n += got
+            else:
+                if not self._fill():
+                    break
+                got = self._take(len(view) - n)
+                view[n:n + len(got)] = got
+                n += len(got)
+        return n
+
+    def readline(self):
+        while True:
+            end = self._buf.find(b'\n', self._pos)
+            if end >= 0:
+                return bytes(self._take(end + 1 - self._pos))
+            if not self._fill():
+                return bytes(self._take(self.buffered()))
+
+
 class BaseTransport():
+    # shared memory ring buffer carrying the data path, if any
+    ring = None
+
     def connect(self, arg):
         raise NotImplementedError
 
@@ -36,6 +115,15 @@ class BaseTransport():
     def write(self, msg):
         raise NotImplementedError
 
+    def write_buffered(self, msg):
+        """ Write msg, possibly holding it back until flush().
+        Don't mix with write() without flushing first.
+        """
+        self.write(msg)
+
+    def flush(self):
+        pass
+
     def read(self, n=-1):
         raise NotImplementedError
 
@@ -45,20 +133,42 @@ class BaseTransport():
     def write_ready(self):
         raise NotImplementedError
 
+    def fileno(self):
+        """ File descriptor to wait on for readiness """
+        raise NotImplementedError
+
+    def buffered(self):
+        """ Number of received bytes already read off the file
+        descriptor, which select() can't see.
+        """
+        return 0
+
+    def create_ring(self, maxsize, ncols, dtype=queues.RingBuffer._default_dtype):
+        """ Create the plotter's data buffer, if this transport
+        provides one. Returns None otherwise.
+        """
+        return None
+
+    def close(self):
+        pass
+
 
 class SocketTransport(BaseTransport):
     sock_type = socket.SOCK_STREAM
     sock_family = socket.AF_INET
+    write_bufsize = 1 << 16
 
     def __init__(self, sock=None):
 
         self.sock = sock
         self.addr = None
         self.rfile = None
+        self.wfile = None
 
         if self.sock is not None:
             self.addr = sock.getsockname()
-            self.rfile = self.sock.makefile('rb')
+            self.rfile = SocketReader(self.sock)
+            self.wfile = self.sock.makefile('wb', self.write_bufsize)
             self.export_attrs()
 
     @classmethod
@@ -71,26 +181,50 @@ class SocketTransport(BaseTransport):
     def connect(self, addr):
         self.sock = socket.socket(self.sock_family, self.sock_type)
         self.sock.connect(addr)
-        self.rfile = self.sock.makefile('rb')
+        self.rfile = SocketReader(self.sock)
+        self.wfile = self.sock.makefile('wb', self.write_bufsize)
         self.export_attrs()
 
     def reconnect(self):
         try:
             self.sock.shutdown(socket.SHUT_RDWR)
-            self.sock.close()
-            self.sock = None
         except socket.error as e:
             logger.debug("Error closing socket: %s", str(e))
+        self.close()
+        self.sock = None
         self.connect(self.addr)
 
     def export_attrs(self):
         self.read = self.rfile.read
         self.readline = self.rfile.readline
+        self.readinto = self.rfile.readinto
+        self.buffered = self.rfile.buffered
+        self.write_buffered = self.wfile.write
+        self.flush = self.wfile.flush
 
     def write(self, msg):
         return self.sock.sendall(msg)
 
+    def close(self):
+        if self.wfile is not None:
+            # the writer holds its own reference to the socket, which
+            # stays open, without EOF to the peer, until it's closed too
+            try:
+                self.wfile.close()
+            except OSError as e:
+                logger.debug("Error flushing socket: %s", str(e))
+            self.wfile = None
+        if self.sock is not None:
+            self.sock.close()
+
+    def fileno(self):
+        return self.sock.fileno()
+
     def select(self, timeout=0):
+        if self.buffered():
+            # a message may already be waiting in the read buffer
+            r, w, x = select((), (self.sock,), (), 0)
+            return [self.sock], w, x
         return select((self.sock,), (self.sock,), (), timeout)
 
     def read_ready(self):
@@ -107,10 +241,86 @@ class SocketTransport(BaseTransport):
     def read(self, n=-1):
         pass
 
+    @util.borrow_docstring(io.BufferedReader.readinto)
+    def readinto(self, b):
+        pass
+
+    @util.borrow_docstring(BaseTransport.buffered)
+    def buffered(self):
+        pass
+
+    @util.borrow_docstring(io.BufferedWriter.write)
+    def write_buffered(self, msg):
+        pass
+
+    @util.borrow_docstring(io.BufferedWriter.flush)
+    def flush(self):
+        pass
+
 
 TCPTransport = SocketTransport
 
 
+class ShmTransport(SocketTransport):
+    """ TCP transport whose data path is a shared memory ring buffer.
+
+    The plotter side creates the ring with create_ring() and announces
+    it over the socket. The user side attaches to it in connect() and
+    writes data into it directly, so only RPC messages go over TCP.
+    """
+
+    def connect(self, addr):
+        super().connect(addr)
+        line = self.readline()
+        try:
+            tag, name, maxsize, ncols, dtype = line.decode('ascii').split()
+        except ValueError:
+            raise ConnectionError("Bad shared memory announcement: %r" % line) from None
+        if tag != 'SHM':
+            raise ConnectionError("Bad shared memory announcement: %r" % line)
+        self.ring = queues.SharedColumnRingBuffer(int(maxsize), int(ncols), np.dtype(dtype), name)
+
+    def create_ring(self, maxsize, ncols, dtype=queues.RingBuffer._default_dtype):
+        self.ring = queues.SharedColumnRingBuffer(maxsize, ncols, dtype)
+        msg = "SHM %s %d %d %s\n" % (self.ring.name, maxsize, ncols, np.dtype(dtype).str)
+        self.write(msg.encode('ascii'))
+        return self.ring
+
+    def close(self):
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+        super().close()
+
+
+def unix_socket_path(addr):
+    """ Map a (host, port) address onto a socket file path, so
+    AF_UNIX servers can be addressed the same way as TCP ones.
+    Paths are returned unchanged.
+    """
+    if isinstance(addr, str):
+        return addr
+    host, port = addr
+    return os.path.join(tempfile.gettempdir(), "simplertplot-%s-%d.sock" % (host, port))
+
+
+class UnixSocketTransport(SocketTransport):
+    """ Local-only transport over an AF_UNIX stream socket,
+    which skips the TCP/IP stack entirely.
+    """
+    sock_family = getattr(socket, 'AF_UNIX', None)
+
+    @classmethod
+    def from_address(cls, addr):
+        self = cls()
+        self.connect(addr)
+        self.addr = addr
+        return self
+
+    def connect(self, addr):
+        super().connect(unix_socket_path(addr))
+
+
 class ServerBase():
     def get_addr(self):
         raise NotImplementedError
@@ -118,14 +328,17 @@ class ServerBase():
     def accept_connection(self, block=True):
         raise NotImplementedError
 
+    def close(self):
+        pass
+
 
 class TCPServer(ServerBase):
     _transport_factory = TCPTransport
 
-    def __init__(self, host, port=0):
+    def __init__(self, host, port=0, backlog=1):
         sock = socket.socket()
         sock.bind((host, port))
-        sock.listen(1)
+        sock.listen(backlog)
         self.addr = sock.getsockname()
         self.sock = sock
 
@@ -140,13 +353,58 @@ class TCPServer(ServerBase):
         return None
 
     def accept_connection2(self, block=True):
-        return self._transport_factory(self.accept_connection(block))
+        sock = self.accept_connection(block)
+        if sock is None:
+            return None
+        return self._transport_factory(sock)
+
+    def close(self):
+        self.sock.close()
+
+
+class ShmServer(TCPServer):
+    _transport_factory = ShmTransport
+
+
+class UnixServer(TCPServer):
+    """ AF_UNIX server. The socket file path is derived from
+    (host, port) with unix_socket_path(); port 0 picks a new
+    unique path, returned by get_addr().
+    """
+    _transport_factory = UnixSocketTransport
+    _unique = itertools.count(1)
+
+    def __init__(self, host, port=0):
+        if port:
+            path = unix_socket_path((host, port))
+        else:
+            path = unix_socket_path(("%s-%d" % (host, os.getpid()), next(self._unique)))
+        try:
+            os.unlink(path)  # stale socket file from a previous run
+        except FileNotFoundError:
+            pass
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(path)
+        sock.listen(1)
+        self.addr = (host, port) if port else path
+        self.path = path
+        self.sock = sock
+
+    def close(self):
+        super().close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
 
 
 # protocol -> (transport, server)
 _transport_classes = {
-    'tcp': (SocketTransport, TCPServer)
+    'tcp': (SocketTransport, TCPServer),
+    'shm': (ShmTransport, ShmServer)
 }
+if hasattr(socket, 'AF_UNIX'):
+    _transport_classes['unix'] = (UnixSocketTransport, UnixServer)
 
 
 def get_transport_class(name):
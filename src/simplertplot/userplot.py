@@ -12,8 +12,8 @@ __author__ = 'Nathan Starkweather'
 import logging
 
 from simplertplot import protocols
-from simplertplot import transport
 import queue
+import numpy as np
 import simplertplot
 
 logger = logging.getLogger(__name__)
@@ -28,34 +28,107 @@ del _h, _f
 
 class RTPlot():
     plot_type = "xyplotter"
+    nseries = 1
     _DEFAULT_HOST = 'localhost'
     _DEFAULT_PORT = 18043
 
-    def __init__(self, max_pts=10000, style='ggplot', con_type='tcp'):
+    def __init__(self, max_pts=10000, style='ggplot', con_type='tcp', serial_method='binary',
+                 max_batch=65536, max_latency=0.01, overflow='block', fps=30, shared=True, archive=None,
+                 dtype=np.float32, scales=None, offsets=None):
+        """
+        :param fps: maximum frame rate. The plot redraws as soon as data
+                    arrives, up to this rate, and idles when none does.
+        :param shared: open the plot in the server process shared by all
+                       shared plots, rather than a process of its own.
+                       Either comes from the user manager's pool of
+                       warm processes, when it has one; see
+                       UserManager.set_pool_size().
+        :param archive: directory the plot keeps its full history in,
+                        see archive.ColumnArchive. The plot itself only
+                        holds the last max_pts points.
+        :param overflow: what put_* does when the plot can't keep up and
+                         the queue fills: 'block', 'drop-newest', 'drop-oldest'
+                         or 'decimate'. See the dropped and decimated counters.
+        :param dtype: dtype y is sent and kept as. x is always sent as
+                      float64 and kept as offsets from a float64 base,
+                      so float32 is enough for eg epoch timestamps.
+                      With con_type='shm' the shared ring the data is
+                      written to is float64 regardless.
+                      Integer types are sent as is, eg int16 ADC counts,
+                      with scales and offsets to draw them in real units.
+        :param scales: factor y is drawn multiplied by, one per series
+                       or a scalar for all. Applied by the plot process.
+        :param offsets: value added to y after scaling, as scales
+        """
+        if overflow not in protocols.overflow_policies:
+            raise ValueError("Unknown overflow policy: %r" % overflow)
         self.max_pts = max_pts
         self.style = style
         self.con_type = con_type
+        self.serial_method = serial_method
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.overflow = overflow
+        self.fps = fps
+        self.shared = shared
+        self.archive = archive
+        self.dtype = np.dtype(dtype)
+        self.scales = scales
+        self.offsets = offsets
         self.producer = None
         self.queue = queue.Queue(max_pts)
 
     def show(self):
-        proto_factory = lambda: protocols.XYUserProtocol(self.queue)
+        proto_factory = lambda: protocols.XYUserProtocol(self.queue, self.serial_method,
+                                                         self.max_batch, self.max_latency,
+                                                         overflow=self.overflow, nseries=self.nseries,
+                                                         dtype=self.dtype)
 
         self.manager = simplertplot.manager.get_user_manager()
-        self.producer = self.manager.spawn_standalone((self._DEFAULT_HOST, self._DEFAULT_PORT), self.plot_type,
-                                                      self.style, self.max_pts,
-                                                      self.con_type, proto_factory)
+        self.producer = self.manager.new_plot(self.plot_type, self.style, self.max_pts, self.con_type,
+                                              proto_factory, self.serial_method, self.fps, self.nseries,
+                                              self.shared, self.archive, self.dtype.name,
+                                              self._per_series(self.scales), self._per_series(self.offsets))
         self.manager.run_protocol(self.producer)
 
+    def _per_series(self, v):
+        if v is None:
+            return None
+        return np.broadcast_to(v, (self.nseries,)).tolist()
+
     def destroy(self):
         """ Destroy the plot, freeing all references """
         self.manager.stop_protocol(self.producer)
         while self.__dict__:
             self.__dict__.popitem()
 
+    @property
+    def dropped(self):
+        """ Number of points discarded by the overflow policy """
+        if self.producer is None:
+            return 0
+        return self.producer.dropped
+
+    @property
+    def decimated(self):
+        """ Number of points thinned out by the 'decimate' overflow policy """
+        if self.producer is None:
+            return 0
+        return self.producer.decimated
+
     def test_rpc(self, msg):
         return self.producer.put_rpc("test_rpc", msg)
 
+    def scroll_to(self, x0, x1):
+        """ Show x0 <= x <= x1 instead of the newest points. Points the
+        plot no longer holds are loaded from its archive, if it has one.
+        """
+        return self.producer.put_rpc("scroll_to", x0, x1)
+
+    def follow(self):
+        """ Go back to showing the newest points """
+        return self.producer.put_rpc("follow")
+
     def put_xy(self, x, y):
         self.producer.put_xy(x, y)
 
@@ -66,27 +139,45 @@ class RTPlot():
         self.producer.put_xlyl(xl, yl)
 
     def put_np_xyl(self, np_xyl):
-        self.producer.put_np_xlyl(np_xyl)
+        self.producer.put_np_xyl(np_xyl)
 
     def put_np_xlyl(self, npxl, npyl):
         self.producer.put_np_xlyl(npxl, npyl)
 
 
+class MultiRTPlot(RTPlot):
+    """ nseries lines sharing x, in one plot process over one
+    connection. Send points with put_series().
+    """
+    plot_type = "multixy"
+
+    def __init__(self, nseries, max_pts=10000, style='ggplot', con_type='tcp', serial_method='binary',
+                 max_batch=65536, max_latency=0.01, overflow='block', fps=30, shared=True, archive=None,
+                 dtype=np.float32, scales=None, offsets=None):
+        super().__init__(max_pts, style, con_type, serial_method, max_batch, max_latency, overflow, fps,
+                         shared, archive, dtype, scales, offsets)
+        self.nseries = nseries
+
+    def put_series(self, x, ys):
+        """ Put points of every series, one row of ys per series """
+        self.producer.put_series(x, ys)
+
+
 class _UserEchoPlot():
     plot_type = "echo"
+    _DEFAULT_HOST = 'localhost'
+    _DEFAULT_PORT = 18044
 
-    def __init__(self):
-        pass
+    def __init__(self, con_type='tcp'):
+        self.con_type = con_type
 
     def show(self):
-        host = 'localhost'
-        port = 0
-        self.server = transport.TCPServer(host, port)
-        host, port = self.server.get_addr()
-        self.popen = _spawn_process(host, port, "echo")
-        self.client_sock = self.server.accept_connection()
-        self.writer = self.client_sock.makefile('wb')
-        self.reader = self.client_sock.makefile('rb')
+        self.manager = simplertplot.manager.get_user_manager()
+        self.transport = self.manager.spawn_standalone_transport((self._DEFAULT_HOST, self._DEFAULT_PORT),
+                                                                 self.plot_type, 'default', 1,
+                                                                 self.con_type)
+        self.popen = self.manager.popen
+        self.reader = self.transport
 
     def ping(self, msg):
         sent = self.send_msg(msg)
@@ -100,15 +191,13 @@ class _UserEchoPlot():
             sent = msg
         if len(sent) > 999:
             raise ValueError("Max ping size: 999 bytes")
-        self.writer.write(("%03d" % len(sent)).encode('ascii'))
-        self.writer.write(sent)
-        self.writer.flush()
-        logger.debug("SENT: %s", sent)
+        self.transport.write(("%03d" % len(sent)).encode('ascii') + sent)
         return sent
 
     def stop(self):
         self.send_msg(b'SYS_EXIT')
         self.popen.wait(5)
+        self.transport.close()
 
 
 
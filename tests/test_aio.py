@@ -0,0 +1,186 @@
+""" Tests for simplertplot.aio """
+import asyncio
+import queue
+import threading
+import pytest
+from os import makedirs
+import sys
+# noinspection PyUnresolvedReferences
+from os.path import dirname, join, exists, basename
+from shutil import rmtree
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+_h = logging.StreamHandler()
+_f = logging.Formatter("%(created)s %(name)s %(levelname)s (%(lineno)s): %(message)s")
+_h.setFormatter(_f)
+logger.addHandler(_h)
+logger.propagate = False
+del _h, _f
+
+
+curdir = dirname(__file__)
+test_dir = dirname(curdir)
+test_temp_dir = join(test_dir, "temp")
+temp_dir = join(test_temp_dir, "temp_dir_path")
+test_input = join(curdir, "test_input")
+local_test_input = join(test_input, basename(__file__.replace(".py", "_input")))
+
+
+def setup_module():
+    for d in temp_dir, test_input, local_test_input:
+        try:
+            makedirs(d)
+        except FileExistsError:
+            pass
+    set_up_pyfile_logger()
+    sys.path.append(curdir)
+    sys.path.append(local_test_input)
+
+
+def set_up_pyfile_logger():
+    global pyfile_logger
+    pyfile_logger = logging.getLogger("pyfile_" + basename(__file__.replace(".py", "")))
+    pyfile_formatter = logging.Formatter("")
+    pyfile_handler = logging.FileHandler(join(test_input, local_test_input, "dbg_ut.py"), 'w')
+    pyfile_logger.addHandler(pyfile_handler)
+    pyfile_handler.setFormatter(pyfile_formatter)
+
+
+def teardown_module():
+    try:
+        rmtree(temp_dir)
+    except FileNotFoundError:
+        pass
+
+    for p in (curdir, local_test_input):
+        try:
+            sys.path.remove(p)
+        except Exception:
+            pass
+
+
+import numpy as np
+
+from simplertplot import aio
+from simplertplot import eventloop
+from simplertplot import protocols
+from simplertplot import transport
+from simplertplot.queues import ColumnRingBuffer
+
+
+def make_frames():
+    ser = protocols.BinarySerializer()
+    msgs = [(protocols.BaseProtocol.OP_XY, (1.0, 2.0)),
+            (protocols.BaseProtocol.OP_NP_XLYL, (np.arange(5.0).tobytes(), np.arange(5.0).tobytes())),
+            (protocols.BaseProtocol.OP_RPC, protocols.RPCRequest("test_rpc", ("msg",), {}))]
+    return b''.join(ser.dumps(m) for m in msgs)
+
+
+@pytest.mark.parametrize('chunk', [1, 3, 7, 1000])
+def test_frame_buffer(chunk):
+    raw = make_frames()
+    fb = aio.FrameBuffer()
+    ops = []
+    for i in range(0, len(raw), chunk):
+        for op, data in fb.feed(raw[i:i + chunk]):
+            ops.append(op)
+            if op == protocols.BaseProtocol.OP_NP_XLYL:
+                assert data[0].tolist() == [0, 1, 2, 3, 4]
+            elif op == protocols.BaseProtocol.OP_RPC:
+                assert data.func == "test_rpc"
+    assert ops == [protocols.BaseProtocol.OP_XY, protocols.BaseProtocol.OP_NP_XLYL,
+                   protocols.BaseProtocol.OP_RPC]
+    assert not fb._buf
+
+
+def new_plotter_protocol(rpc_req):
+    plotter = aio.AioXYPlotterProtocol(ColumnRingBuffer(100, 2), rpc_req, queue.Queue())
+
+    def answer():
+        # stands in for the plot thread's process_rpc()
+        req = rpc_req.get()
+        plotter.respond(req.respond(value=len(req.args[0])))
+    threading.Thread(target=answer, daemon=True).start()
+    return plotter
+
+
+def test_aio_single_series_puts():
+    user = aio.AioXYUserProtocol(nseries=2)
+    for method, args in (('put_xy', (0, 1)), ('put_xyl', ([(0, 1)],)), ('put_xlyl', ([0], [1])),
+                         ('put_np_xyl', (np.zeros((1, 2)),)), ('put_np_xlyl', (np.zeros(1), np.zeros(1)))):
+        with pytest.raises(ValueError):
+            getattr(user, method)(*args)
+    assert not user._batch.n
+
+
+def test_aio_round_trip():
+    plotters = []
+
+    async def main():
+        mngr = aio.AioManager(asyncio.get_running_loop())
+
+        def factory():
+            plotters.append(new_plotter_protocol(queue.Queue()))
+            return plotters[-1]
+
+        server = await mngr.create_server(('localhost', 0), factory)
+        addr = server.sockets[0].getsockname()[:2]
+        # two plots multiplexed on the same loop
+        users = [await mngr.connect(addr, lambda: aio.AioXYUserProtocol(max_latency=0.001))
+                 for _ in range(2)]
+        for i, user in enumerate(users):
+            for j in range(10 * (i + 1)):
+                user.put_xy(j, j)
+            user.put_np_xlyl(np.arange(3.0), np.arange(3.0))
+        results = await asyncio.gather(*(u.put_rpc("test_rpc", "abc") for u in users))
+        for user in users:
+            user.close()
+        server.close()
+        await server.wait_closed()
+        return results
+
+    assert asyncio.run(main()) == [3, 3]
+    counts = sorted(p.current_update for p in plotters)
+    assert counts == [13, 23]
+
+
+def test_aio_user_threaded_plotter():
+    """ The asyncio user side talks to the threaded plotter protocol """
+    server = transport.TCPServer('localhost', 0)
+    rpc_req = queue.Queue()
+    plotter = protocols.XYPlotterProtocol(ColumnRingBuffer(100, 2), rpc_req, queue.Queue(), 'binary')
+    loop = eventloop.ThreadedEventLoop()
+    mngr = aio.AioManager()
+
+    def accept():
+        plotter.connection_made(server.accept_connection2())
+        plotter.attach(loop)
+    t = threading.Thread(target=accept, daemon=True)
+    t.start()
+    try:
+        user = mngr.run(mngr.connect(server.get_addr()), 5)
+        t.join(5)
+        mngr.call(user.put_xlyl, [1, 2, 3], [4, 5, 6])
+
+        async def rpc():
+            fut = user.put_rpc("test_rpc", "abcd")
+            req = await asyncio.get_running_loop().run_in_executor(None, rpc_req.get)
+            plotter.respond(req.respond(value=4))
+            return await fut
+        assert mngr.run(rpc(), 5) == 4
+        with plotter.lock_queue():
+            assert plotter.current_update == 3
+        x, y = plotter.xyq.get()
+        assert y.tolist() == [4, 5, 6]
+        mngr.call(user.close)
+    finally:
+        plotter.detach()
+        loop.stop()
+        server.close()
+        mngr.loop.call_soon_threadsafe(mngr.loop.stop)
+
+
+if __name__ == '__main__':
+    pytest.main()
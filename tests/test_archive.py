@@ -0,0 +1,227 @@
+""" Tests for simplertplot.archive """
+import pytest
+from os import makedirs
+import sys
+# noinspection PyUnresolvedReferences
+from os.path import dirname, join, exists, basename
+from shutil import rmtree
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+_h = logging.StreamHandler()
+_f = logging.Formatter("%(created)s %(name)s %(levelname)s (%(lineno)s): %(message)s")
+_h.setFormatter(_f)
+logger.addHandler(_h)
+logger.propagate = False
+del _h, _f
+
+
+curdir = dirname(__file__)
+test_dir = dirname(curdir)
+test_temp_dir = join(test_dir, "temp")
+temp_dir = join(test_temp_dir, "temp_dir_path")
+test_input = join(curdir, "test_input")
+local_test_input = join(test_input, basename(__file__.replace(".py", "_input")))
+
+
+def setup_module():
+    for d in temp_dir, test_input, local_test_input:
+        try:
+            makedirs(d)
+        except FileExistsError:
+            pass
+    set_up_pyfile_logger()
+    sys.path.append(curdir)
+    sys.path.append(local_test_input)
+
+
+def set_up_pyfile_logger():
+    global pyfile_logger
+    pyfile_logger = logging.getLogger("pyfile_" + basename(__file__.replace(".py", "")))
+    pyfile_formatter = logging.Formatter("")
+    pyfile_handler = logging.FileHandler(join(test_input, local_test_input, "dbg_ut.py"), 'w')
+    pyfile_logger.addHandler(pyfile_handler)
+    pyfile_handler.setFormatter(pyfile_formatter)
+
+
+def teardown_module():
+    try:
+        rmtree(temp_dir)
+    except FileNotFoundError:
+        pass
+
+    for p in (curdir, local_test_input):
+        try:
+            sys.path.remove(p)
+        except Exception:
+            pass
+
+
+import queue
+import threading
+import time
+
+import numpy as np
+
+from simplertplot import archive
+from simplertplot import protocols
+from simplertplot.queues import ColumnRingBuffer
+
+
+def make_cols(start, n):
+    x = np.arange(start, start + n, dtype=np.float64)
+    return [x, x * 2]
+
+
+@pytest.fixture
+def path(tmpdir):
+    return str(tmpdir.join("archive"))
+
+
+@pytest.mark.parametrize("sizes", [[5], [10], [3, 4, 5, 30], [25]])
+def test_append_read(path, sizes):
+    a = archive.ColumnArchive(path, chunk_rows=10)
+    n = 0
+    for k in sizes:
+        a.append(make_cols(n, k))
+        n += k
+    assert len(a) == n
+    assert a.nchunks == (n + 9) // 10
+    expected = np.array(make_cols(0, n))
+    np.testing.assert_array_equal(a.read(0, n), expected)
+    for start, stop in ((0, 1), (3, 17), (9, 11), (n - 1, n + 5)):
+        np.testing.assert_array_equal(a.read(start, stop), expected[:, start:stop])
+    assert a.time_range() == (0, n - 1)
+
+
+def test_empty(path):
+    a = archive.ColumnArchive(path)
+    assert len(a) == 0
+    assert a.time_range() is None
+    assert a.read_time(0, 10).shape == (2, 0)
+    with pytest.raises(FileNotFoundError):
+        archive.ColumnArchive(path + "x", mode='r')
+
+
+def test_read_time(path):
+    a = archive.ColumnArchive(path, chunk_rows=8)
+    x = np.repeat(np.arange(20.), 2)  # repeated times may straddle chunks
+    a.append([x, np.arange(40.)])
+    for t0, t1 in ((0, 0), (3, 3.5), (3.5, 7), (-5, 100), (19, 30), (3.9, 3.95), (25, 30), (-5, -1)):
+        mask = (x >= t0) & (x <= t1)
+        np.testing.assert_array_equal(a.read_time(t0, t1)[1], np.arange(40.)[mask])
+
+
+def test_reopen(path):
+    a = archive.ColumnArchive(path, ncols=3, dtype=np.float32, chunk_rows=10)
+    a.append(make_cols(0, 15) + [np.zeros(15)])
+    a.close()
+
+    r = archive.ColumnArchive(path, mode='r')
+    assert (r.ncols, r.dtype, r.chunk_rows, len(r)) == (3, np.float32, 10, 15)
+    with pytest.raises(ValueError):
+        r.append(make_cols(0, 1) + [np.zeros(1)])
+
+    a = archive.ColumnArchive(path)
+    a.append(make_cols(15, 10) + [np.ones(10)])
+    a.flush()
+    assert len(archive.ColumnArchive(path, mode='r')) == 25
+    np.testing.assert_array_equal(a.read(0, 25)[0], np.arange(25.))
+    np.testing.assert_array_equal(a.read(0, 25)[2], [0] * 15 + [1] * 10)
+    with pytest.raises(ValueError):
+        a.append(make_cols(0, 1))
+
+
+def test_periodic_flush(path):
+    a = archive.ColumnArchive(path, chunk_rows=100, flush_rows=40, flush_interval=3600)
+    for i in range(0, 150, 25):
+        a.append(make_cols(i, 25))
+    # no close(), as if the writer died. Readers see the rows up
+    # to the last flush, including those of the current chunk
+    r = archive.ColumnArchive(path, mode='r')
+    assert len(r) == 150
+    np.testing.assert_array_equal(r.read(0, 150)[0], np.arange(150.))
+    a.append(make_cols(150, 10))
+
+    # a new writer carries on after the flushed rows
+    a = archive.ColumnArchive(path, flush_interval=0)
+    assert len(a) == 150
+    a.append(make_cols(150, 5))
+    r = archive.ColumnArchive(path, mode='r')
+    assert len(r) == 155
+    np.testing.assert_array_equal(r.read(0, 155)[0], np.arange(155.))
+
+
+def test_protocol_archives_every_row(path):
+    a = archive.ColumnArchive(path, chunk_rows=100)
+    client = protocols.XYPlotterProtocol(ColumnRingBuffer(10), queue.Queue(), queue.Queue(), archive=a)
+    client.ingest(client.OP_XY, (0., 0.))
+    client.ingest(client.OP_XLYL, ([1., 2.], [2., 4.]))
+    x, y = make_cols(3, 50)
+    client.ingest(client.OP_NP_XLYL, (x.tobytes(), y.tobytes()))
+    assert len(client.xyq) == 10
+    np.testing.assert_array_equal(a.read(0, 100), make_cols(0, 53))
+
+
+@pytest.fixture
+def walk(path):
+    a = archive.ColumnArchive(path, chunk_rows=4096)
+    rng = np.random.RandomState(0)
+    a.append([np.arange(20000.), np.cumsum(rng.randn(20000))])
+    return a
+
+
+def test_scrollback_raw(walk):
+    loader = archive.ScrollbackLoader(walk)
+    np.testing.assert_array_equal(loader.fetch(100, 2000, 1000), walk.read_time(100, 2000))
+    assert loader.fetch(-10, -1, 100).shape == (2, 0)
+
+
+@pytest.mark.parametrize("x0, x1", [(0, 19999), (100, 9000), (4000, 4200), (5000.5, 19000.5)])
+def test_scrollback_envelope(walk, x0, x1):
+    loader = archive.ScrollbackLoader(walk)
+    raw = walk.read_time(x0, x1)
+    env = loader.fetch(x0, x1, 20)
+    assert env.shape[1] < raw.shape[1] or raw.shape[1] < 20 * 64
+    assert np.all(np.diff(env[0]) >= 0)
+    assert (env[0, 0], env[0, -1]) == (raw[0, 0], raw[0, -1])
+    assert (env[1].min(), env[1].max()) == (raw[1].min(), raw[1].max())
+
+
+def test_scrollback_cache(walk):
+    loader = archive.ScrollbackLoader(walk, cache_size=3)
+    loader.fetch(15000, 19999, 10)
+    misses = loader.misses
+    loader.fetch(15000, 19999, 10)
+    assert loader.hits and loader.misses == misses
+    loader.fetch(0, 19999, 10)
+    assert len(loader._cache) == 3
+    misses = loader.misses
+    # the last chunk grows, its levels are redone
+    walk.append([np.arange(20000., 21000.), np.zeros(1000)])
+    env = loader.fetch(0, 21000, 10)
+    assert loader.misses > misses
+    assert env[0, -1] == 20999 and env[1].max() == walk.read(0, 21000)[1].max()
+
+
+def test_scrollback_thread(walk):
+    wake = threading.Event()
+    loader = archive.ScrollbackLoader(walk, wake=wake)
+    assert loader.take() is None
+    loader.request(0, 10, 100)
+    loader.request(100, 200, 100)
+    assert wake.wait(5)
+    deadline = time.time() + 5
+    result = loader.take()
+    while result is None or result[0] != (100, 200, 100):
+        assert time.time() < deadline
+        time.sleep(0.01)
+        result = loader.take()
+    np.testing.assert_array_equal(result[1], walk.read_time(100, 200))
+    loader.close()
+    assert not loader._thread.is_alive()
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,130 @@
+""" Tests for simplertplot.decimate """
+import pytest
+from os import makedirs
+import sys
+# noinspection PyUnresolvedReferences
+from os.path import dirname, join, exists, basename
+from shutil import rmtree
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+_h = logging.StreamHandler()
+_f = logging.Formatter("%(created)s %(name)s %(levelname)s (%(lineno)s): %(message)s")
+_h.setFormatter(_f)
+logger.addHandler(_h)
+logger.propagate = False
+del _h, _f
+
+
+curdir = dirname(__file__)
+test_dir = dirname(curdir)
+test_temp_dir = join(test_dir, "temp")
+temp_dir = join(test_temp_dir, "temp_dir_path")
+test_input = join(curdir, "test_input")
+local_test_input = join(test_input, basename(__file__.replace(".py", "_input")))
+
+
+def setup_module():
+    for d in temp_dir, test_input, local_test_input:
+        try:
+            makedirs(d)
+        except FileExistsError:
+            pass
+    set_up_pyfile_logger()
+    sys.path.append(curdir)
+    sys.path.append(local_test_input)
+
+
+def set_up_pyfile_logger():
+    global pyfile_logger
+    pyfile_logger = logging.getLogger("pyfile_" + basename(__file__.replace(".py", "")))
+    pyfile_formatter = logging.Formatter("")
+    pyfile_handler = logging.FileHandler(join(test_input, local_test_input, "dbg_ut.py"), 'w')
+    pyfile_logger.addHandler(pyfile_handler)
+    pyfile_handler.setFormatter(pyfile_formatter)
+
+
+def teardown_module():
+    try:
+        rmtree(temp_dir)
+    except FileNotFoundError:
+        pass
+
+    for p in (curdir, local_test_input):
+        try:
+            sys.path.remove(p)
+        except Exception:
+            pass
+
+
+import numpy as np
+
+from simplertplot.decimate import minmax_decimate, is_monotonic
+
+
+def check_envelope(x, y, xd, yd, nbins):
+    assert len(xd) <= 2 * nbins + 2
+    assert is_monotonic(xd)
+    assert xd[0] == x[0] and xd[-1] == x[-1]
+    assert np.nanmax(yd) == np.nanmax(y)
+    assert np.nanmin(yd) == np.nanmin(y)
+    # every output point is an input point
+    idx = np.searchsorted(x, xd)
+    assert np.array_equal(y[idx], yd, equal_nan=True)
+
+
+@pytest.mark.parametrize('n', [1000, 12345, 300000])
+@pytest.mark.parametrize('nbins', [1, 7, 640])
+def test_minmax_decimate(n, nbins):
+    x = np.arange(n, dtype=np.float64)
+    y = np.random.RandomState(n).randn(n)
+    xd, yd = minmax_decimate(x, y, nbins)
+    check_envelope(x, y, xd, yd, nbins)
+
+
+def test_spikes_kept():
+    n = 100000
+    x = np.linspace(0, 1, n)
+    y = np.zeros(n)
+    spikes = [17, 5000, 30001, 77777, n - 2]
+    y[spikes] = np.arange(1, len(spikes) + 1)
+    y[60000] = -9
+    xd, yd = minmax_decimate(x, y, 100)
+    for i in spikes + [60000]:
+        assert x[i] in xd
+    assert yd.min() == -9
+
+
+def test_uneven_x():
+    # gaps leave empty bins, which are skipped
+    x = np.concatenate((np.arange(1000.), np.arange(1000.) + 1e6))
+    y = np.sin(x)
+    xd, yd = minmax_decimate(x, y, 50)
+    check_envelope(x, y, xd, yd, 50)
+
+
+def test_nan():
+    x = np.arange(10000.)
+    y = np.random.RandomState(0).randn(10000)
+    y[:500] = np.nan
+    y[5000] = np.nan
+    xd, yd = minmax_decimate(x, y, 100)
+    check_envelope(x, y, xd, yd, 100)
+
+
+def test_unchanged():
+    x = np.arange(100.)
+    y = np.arange(100.)
+    # already small enough
+    assert minmax_decimate(x, y, 50)[0] is x
+    # not monotonic
+    xr = x[::-1].copy()
+    assert minmax_decimate(xr, y, 10)[0] is xr
+    # no span
+    xc = np.zeros(100)
+    assert minmax_decimate(xc, y, 10)[0] is xc
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,226 @@
+""" Tests for simplertplot.eventloop """
+import io
+import queue
+import threading
+import pytest
+from os import makedirs
+import sys
+# noinspection PyUnresolvedReferences
+from os.path import dirname, join, exists, basename
+from shutil import rmtree
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+_h = logging.StreamHandler()
+_f = logging.Formatter("%(created)s %(name)s %(levelname)s (%(lineno)s): %(message)s")
+_h.setFormatter(_f)
+logger.addHandler(_h)
+logger.propagate = False
+del _h, _f
+
+
+curdir = dirname(__file__)
+test_dir = dirname(curdir)
+test_temp_dir = join(test_dir, "temp")
+temp_dir = join(test_temp_dir, "temp_dir_path")
+test_input = join(curdir, "test_input")
+local_test_input = join(test_input, basename(__file__.replace(".py", "_input")))
+
+
+def setup_module():
+    for d in temp_dir, test_input, local_test_input:
+        try:
+            makedirs(d)
+        except FileExistsError:
+            pass
+    set_up_pyfile_logger()
+    sys.path.append(curdir)
+    sys.path.append(local_test_input)
+
+
+def set_up_pyfile_logger():
+    global pyfile_logger
+    pyfile_logger = logging.getLogger("pyfile_" + basename(__file__.replace(".py", "")))
+    pyfile_formatter = logging.Formatter("")
+    pyfile_handler = logging.FileHandler(join(test_input, local_test_input, "dbg_ut.py"), 'w')
+    pyfile_logger.addHandler(pyfile_handler)
+    pyfile_handler.setFormatter(pyfile_formatter)
+
+
+def teardown_module():
+    try:
+        rmtree(temp_dir)
+    except FileNotFoundError:
+        pass
+
+    for p in (curdir, local_test_input):
+        try:
+            sys.path.remove(p)
+        except Exception:
+            pass
+
+
+import socket
+import time
+
+from simplertplot import eventloop
+from simplertplot import protocols
+from simplertplot import transport
+from simplertplot.queues import ColumnRingBuffer
+
+
+class CountingEventLoop(eventloop.ThreadedEventLoop):
+    def __init__(self):
+        self.passes = 0
+        super().__init__()
+
+    def _run_once(self):
+        self.passes += 1
+        super()._run_once()
+
+
+@pytest.fixture
+def loop():
+    loop = CountingEventLoop()
+    yield loop
+    loop.stop()
+
+
+def wait_for(cond, timeout=2):
+    end = time.time() + timeout
+    while not cond():
+        if time.time() > end:
+            return False
+        time.sleep(0.001)
+    return True
+
+
+def test_call_soon_threadsafe(loop):
+    ran = threading.Event()
+    loop.call_soon_threadsafe(ran.set)
+    assert ran.wait(1)
+
+
+def test_wakeup_race(loop):
+    # wakeups landing while the loop drains earlier ones
+    # mustn't leave it asleep with callbacks pending
+    for i in range(2000):
+        ran = threading.Semaphore(0)
+        loop.call_soon_threadsafe(ran.release)
+        time.sleep(i % 3 * 1e-5)
+        loop.call_soon_threadsafe(ran.release)
+        assert ran.acquire(timeout=1) and ran.acquire(timeout=1), "lost wakeup at trial %d" % i
+
+
+def test_idle_doesnt_spin(loop):
+    loop.call_soon_threadsafe(lambda: None)
+    assert wait_for(lambda: loop.passes)
+    time.sleep(0.2)
+    passes = loop.passes
+    time.sleep(0.2)
+    assert loop.passes == passes
+
+
+def test_call_later(loop):
+    calls = []
+    loop.call_later(0.05, lambda: calls.append(2))
+    loop.call_later(0.01, lambda: calls.append(1))
+    assert wait_for(lambda: len(calls) == 2)
+    assert calls == [1, 2]
+
+
+def test_reader(loop):
+    a, b = socket.socketpair()
+    got = []
+
+    def on_readable():
+        got.append(a.recv(100))
+        if got[-1] == b'stop':
+            return False
+
+    loop.add_reader(a, on_readable)
+    b.send(b'abc')
+    assert wait_for(lambda: got == [b'abc'])
+    b.send(b'stop')
+    assert wait_for(lambda: len(got) == 2)
+    b.send(b'ignored')
+    time.sleep(0.05)
+    assert got == [b'abc', b'stop']
+    a.close()
+    b.close()
+
+
+def test_stop_start(loop):
+    ran = threading.Event()
+    loop.stop()
+    assert wait_for(lambda: loop._idle)
+    loop.start()
+    loop.call_soon_threadsafe(ran.set)
+    assert ran.wait(1)
+
+
+def test_worker(loop):
+    calls = []
+
+    def worker():
+        calls.append(1)
+        if len(calls) == 3:
+            return False
+
+    loop.add_worker(worker)
+    assert wait_for(lambda: not loop.workers)
+    assert len(calls) == 3
+
+
+def test_socket_reader_buffered():
+    a, b = socket.socketpair()
+    reader = transport.SocketReader(a, 4)
+    b.sendall(b'line1\nline2\n')
+    assert reader.readline() == b'line1\n'
+    assert reader.buffered()
+    assert reader.read(3) == b'lin'
+    buf = bytearray(3)
+    assert reader.readinto(buf) == 3
+    assert buf == b'e2\n'
+    assert not reader.buffered()
+    a.close()
+    b.close()
+
+
+@pytest.mark.parametrize('serial_method', ['pickle', 'binary'])
+def test_attached_protocols(serial_method):
+    a, b = socket.socketpair()
+    user = protocols.XYUserProtocol(queue.Queue(), serial_method, max_latency=0)
+    rpc_req = queue.Queue()
+    plotter = protocols.XYPlotterProtocol(ColumnRingBuffer(100, 2), rpc_req, queue.Queue(), serial_method)
+    user.connection_made(transport.SocketTransport(a))
+    plotter.connection_made(transport.SocketTransport(b))
+    user_loop = eventloop.ThreadedEventLoop()
+    plot_loop = eventloop.ThreadedEventLoop()
+    user.attach(user_loop)
+    plotter.attach(plot_loop)
+    try:
+        for i in range(10):
+            user.put_xy(i, i)
+
+        def received():
+            with plotter.lock_queue():
+                return plotter.current_update == 10
+        assert wait_for(received)
+
+        fut = user.put_rpc("test_rpc", "msg")
+        req = rpc_req.get(timeout=2)
+        plotter.respond(req.respond(value=3))
+        assert fut.result(2) == 3
+    finally:
+        user.detach()
+        plotter.detach()
+        user_loop.stop()
+        plot_loop.stop()
+        a.close()
+        b.close()
+
+
+if __name__ == '__main__':
+    pytest.main()
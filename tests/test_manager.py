@@ -0,0 +1,209 @@
+""" Tests for simplertplot.manager """
+import pytest
+from os import makedirs
+import sys
+# noinspection PyUnresolvedReferences
+from os.path import dirname, join, exists, basename
+from shutil import rmtree
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+_h = logging.StreamHandler()
+_f = logging.Formatter("%(created)s %(name)s %(levelname)s (%(lineno)s): %(message)s")
+_h.setFormatter(_f)
+logger.addHandler(_h)
+logger.propagate = False
+del _h, _f
+
+
+curdir = dirname(__file__)
+test_dir = dirname(curdir)
+test_temp_dir = join(test_dir, "temp")
+temp_dir = join(test_temp_dir, "temp_dir_path")
+test_input = join(curdir, "test_input")
+local_test_input = join(test_input, basename(__file__.replace(".py", "_input")))
+
+
+def setup_module():
+    for d in temp_dir, test_input, local_test_input:
+        try:
+            makedirs(d)
+        except FileExistsError:
+            pass
+    set_up_pyfile_logger()
+    sys.path.append(curdir)
+    sys.path.append(local_test_input)
+
+
+def set_up_pyfile_logger():
+    global pyfile_logger
+    pyfile_logger = logging.getLogger("pyfile_" + basename(__file__.replace(".py", "")))
+    pyfile_formatter = logging.Formatter("")
+    pyfile_handler = logging.FileHandler(join(test_input, local_test_input, "dbg_ut.py"), 'w')
+    pyfile_logger.addHandler(pyfile_handler)
+    pyfile_handler.setFormatter(pyfile_formatter)
+
+
+def teardown_module():
+    try:
+        rmtree(temp_dir)
+    except FileNotFoundError:
+        pass
+
+    for p in (curdir, local_test_input):
+        try:
+            sys.path.remove(p)
+        except Exception:
+            pass
+
+
+import argparse
+import queue
+import socket
+import time
+
+import numpy as np
+
+from simplertplot import manager
+from simplertplot import protocols
+from simplertplot import transport
+
+
+@pytest.fixture
+def server():
+    m = manager.UserManager()
+    remote = m.get_server()
+    yield m, remote
+    if remote.popen.poll() is None:
+        remote.popen.kill()
+        remote.popen.wait()
+
+
+def open_plot(m, remote, mproto, output):
+    addr = remote.new_plot('headless', 'ggplot', 1000, mproto, 'binary', 20, output=output)
+    p = m._make_protocol(addr, mproto, lambda: protocols.XYUserProtocol(queue.Queue(), 'binary'))
+    m.run_protocol(p)
+    return p
+
+
+def close_plot(m, p):
+    m.stop_protocol(p)
+    p.transport.sock.shutdown(socket.SHUT_RDWR)
+    p.transport.close()
+
+
+def test_plot_args():
+    p = argparse.ArgumentParser()
+    manager._add_plot_args(p)
+    args = manager._plot_args('multixy', 'ggplot', 100, 'tcp', 'binary', nseries=2, dtype='int16',
+                              scales=[0.5, -2], offsets=[-1.5, 0])
+    ns = p.parse_args(args)
+    assert ns.dtype == 'int16' and ns.scale == [0.5, -2] and ns.offset == [-1.5, 0]
+    plot = manager._make_plot(transport.BaseTransport(), ns)
+    assert plot.dtype == np.float32
+    assert plot.scales.tolist() == [0.5, -2] and plot.offsets.tolist() == [-1.5, 0]
+
+
+def test_plots_share_process(server, tmpdir):
+    m, remote = server
+    assert m.get_server() is remote
+    outputs = [str(tmpdir.join("p%d_%%03d.png" % i)) for i in range(2)]
+    mprotos = ['tcp', 'unix'] if 'unix' in manager.transport._transport_classes else ['tcp', 'tcp']
+    plots = [open_plot(m, remote, mproto, out) for mproto, out in zip(mprotos, outputs)]
+    for p in plots:
+        p.put_np_xlyl(np.arange(100.), np.arange(100.))
+        assert p.put_rpc("test_rpc", "abc").result(5) == 3
+    time.sleep(0.2)
+    remote.detach()
+    assert remote.popen.poll() is None  # still hosting plots
+    for p in plots:
+        close_plot(m, p)
+    assert remote.popen.wait(10) == 0
+    for i in range(2):
+        assert tmpdir.listdir(lambda f: f.basename.startswith("p%d_" % i))
+
+
+def test_new_plot_error(server):
+    m, remote = server
+    with pytest.raises(manager.ManagerError):
+        remote.new_plot('nosuch', 'ggplot', 1000, 'tcp', 'binary')
+    with pytest.raises(manager.ManagerError):
+        remote.new_plot('headless', 'ggplot', 1000, 'nosuch', 'binary')
+    remote.detach()
+    assert remote.popen.wait(10) == 0
+
+
+def kill_servers(m):
+    for popen in [r.popen for r in m.server_procs] + list(m._starting.values()):
+        if popen.poll() is None:
+            popen.kill()
+            popen.wait()
+
+
+def test_pool_hands_off_warm_server():
+    m = manager.UserManager(pool_size=2)
+    try:
+        assert len(m._starting) == 2
+        remote = m.take_server()
+        assert remote.popen.poll() is None
+        assert remote not in m._pool
+        assert len(m._pool) + len(m._starting) == 2  # topped up
+        m._accept_servers(True)
+        assert m._pool
+        assert m.get_server() is m.get_server()
+        assert m.get_server() is not remote
+    finally:
+        kill_servers(m)
+
+
+def test_exclusive_plot_exits_with_plot(tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)  # headless frames go to the server's cwd
+    m = manager.UserManager(pool_size=1)
+    try:
+        proto = lambda: protocols.XYUserProtocol(queue.Queue(), 'binary')
+        p = m.new_plot('headless', 'ggplot', 1000, 'tcp', proto, 'binary', shared=False)
+        m.run_protocol(p)
+        remote = m.server_procs[0]
+        assert p.put_rpc("test_rpc", "abc").result(5) == 3
+        close_plot(m, p)
+        assert remote.popen.wait(10) == 0
+        assert m._shared is None
+        assert tmpdir.listdir(lambda f: f.basename.startswith("frame_"))
+    finally:
+        kill_servers(m)
+
+
+def test_server_fails_to_start(monkeypatch):
+    m = manager.UserManager()
+    monkeypatch.setattr(manager, '_spawn_server_src', "raise SystemExit(1) # %s %d %s")
+    with pytest.raises(manager.MngrHandshakeFailure):
+        m.take_server()
+    assert not m._starting
+
+
+@pytest.mark.parametrize('src', [
+    # connects, never handshakes
+    "import socket, time; s = socket.create_connection(('%s', %d)); time.sleep(60) # %s",
+    # never connects
+    "import time; time.sleep(60) # %s %d %s",
+    # handshakes wrong
+    "import socket, time; s = socket.create_connection(('%s', %d)); s.sendall(b'Bad %s HANDSHAKE\\n'); "
+    "time.sleep(60)",
+])
+def test_server_never_handshakes(monkeypatch, src):
+    m = manager.UserManager()
+    m.startup_timeout = 1
+    monkeypatch.setattr(manager, '_spawn_server_src', src)
+    m._start_server()
+    popen, = m._starting.values()
+    start = time.time()
+    with pytest.raises(manager.MngrHandshakeFailure):
+        m.take_server()
+    assert time.time() - start < 5
+    assert not m._starting
+    assert popen.wait(5) is not None
+
+
+if __name__ == '__main__':
+    pytest.main()
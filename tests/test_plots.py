@@ -0,0 +1,444 @@
+""" Tests for simplertplot.plots """
+import pytest
+from os import makedirs
+import sys
+# noinspection PyUnresolvedReferences
+from os.path import dirname, join, exists, basename
+from shutil import rmtree
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+_h = logging.StreamHandler()
+_f = logging.Formatter("%(created)s %(name)s %(levelname)s (%(lineno)s): %(message)s")
+_h.setFormatter(_f)
+logger.addHandler(_h)
+logger.propagate = False
+del _h, _f
+
+
+curdir = dirname(__file__)
+test_dir = dirname(curdir)
+test_temp_dir = join(test_dir, "temp")
+temp_dir = join(test_temp_dir, "temp_dir_path")
+test_input = join(curdir, "test_input")
+local_test_input = join(test_input, basename(__file__.replace(".py", "_input")))
+
+
+def setup_module():
+    for d in temp_dir, test_input, local_test_input:
+        try:
+            makedirs(d)
+        except FileExistsError:
+            pass
+    set_up_pyfile_logger()
+    sys.path.append(curdir)
+    sys.path.append(local_test_input)
+
+
+def set_up_pyfile_logger():
+    global pyfile_logger
+    pyfile_logger = logging.getLogger("pyfile_" + basename(__file__.replace(".py", "")))
+    pyfile_formatter = logging.Formatter("")
+    pyfile_handler = logging.FileHandler(join(test_input, local_test_input, "dbg_ut.py"), 'w')
+    pyfile_logger.addHandler(pyfile_handler)
+    pyfile_handler.setFormatter(pyfile_formatter)
+
+
+def teardown_module():
+    try:
+        rmtree(temp_dir)
+    except FileNotFoundError:
+        pass
+
+    for p in (curdir, local_test_input):
+        try:
+            sys.path.remove(p)
+        except Exception:
+            pass
+
+
+import queue
+import threading
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.image
+import numpy as np
+
+from simplertplot import export
+from simplertplot import plots
+from simplertplot import protocols
+from simplertplot import transport
+
+
+@pytest.fixture
+def plotter():
+    p = plots.XYPlotter(transport.BaseTransport(), 100000)
+    p.setup_pyplot()
+    yield p
+    p.clear_pyplot()
+
+
+def put(p, x, y):
+    x = np.asarray(x, np.float64)
+    y = np.asarray(y, np.float64)
+    p.client.ingest(p.client.OP_NP_XLYL, (x.tobytes(), y.tobytes()))
+
+
+def test_update_data(plotter):
+    assert not plotter.update_data()
+    x = np.arange(50000.)
+    put(plotter, x, np.sin(x / 1000))
+    assert plotter.update_data()
+    assert len(plotter.x_data) <= 2 * plotter.subplot.bbox.width + 2
+    assert not plotter.update_data()
+
+
+@pytest.mark.parametrize('decimate', [True, False])
+def test_series_not_views(decimate):
+    # series are drawn without the lock, while the ring is written to
+    p = plots.XYPlotter(transport.BaseTransport(), 100, compact_time=False)
+    p.setup_pyplot()
+    p.decimate = decimate
+    try:
+        put(p, np.arange(50.), np.arange(50.))
+        p.update_data()
+        put(p, np.arange(100.) + 1000, np.arange(100.) + 1000)
+        assert p.x_data.tolist() == p.y_data.tolist() == list(range(50))
+    finally:
+        p.clear_pyplot()
+
+
+def test_view_limits(plotter):
+    x = np.arange(50000.)
+    y = 3 * np.sin(x / 1000)
+    put(plotter, x, y)
+    plotter.update_data()
+    assert plotter.data_limits == (0, 49999, -3, 3)
+
+    # same limits as autoscale_view(), plus the headroom on top
+    plotter.subplot.plot(x, y)
+    plotter.subplot.relim()
+    plotter.subplot.autoscale_view()
+    x0, x1, y0, y1 = plotter.view_limits(plotter.data_limits)
+    assert (x0, x1) == pytest.approx(plotter.subplot.get_xlim())
+    ay0, ay1 = plotter.subplot.get_ylim()
+    assert (y0, y1) == pytest.approx((ay0, ay1 + (ay1 - ay0) * 0.02))
+
+
+def test_view_limits_single_point(plotter):
+    put(plotter, [1], [1])
+    plotter.update_data()
+    x0, x1, y0, y1 = plotter.view_limits(plotter.data_limits)
+    assert x0 < 1 < x1
+    assert y0 < 1 < y1
+
+
+def test_snap_to_ticks(plotter):
+    limits = (0.5, 97.2, -0.013, 0.0171)
+    x0, x1, y0, y1 = plotter.snap_to_ticks(limits)
+    assert (x0, x1) == (0, 100)
+    assert y0 <= limits[2] and y1 >= limits[3]
+    yticks = plotter.subplot.yaxis.get_major_locator().tick_values(limits[2], limits[3])
+    assert y0 in yticks and y1 in yticks
+
+
+def test_draw_frame(plotter):
+    plotter.setup_blit()
+    assert not plotter.draw_frame()
+    put(plotter, [0, 1, 2], [0, 1, 2])
+    assert plotter.draw_frame()
+    assert plotter.axes_redraws == 1
+    limits = plotter.subplot.get_xlim() + plotter.subplot.get_ylim()
+    xticks = plotter.subplot.xaxis.get_major_locator()()
+    assert limits[0] in xticks and limits[1] in xticks
+    # more data within the same ticks doesn't redraw the axes
+    put(plotter, [2.01], [1.99])
+    assert plotter.draw_frame()
+    assert plotter.axes_redraws == 1
+    put(plotter, [30], [30])
+    assert plotter.draw_frame()
+    assert plotter.axes_redraws == 2
+
+
+if __name__ == '__main__':
+    pytest.main()
+
+
+def test_scrollback(tmpdir):
+    p = plots.XYPlotter(transport.BaseTransport(), 1000, archive=str(tmpdir.join("archive")))
+    p.setup_pyplot()
+    p.setup_blit()
+    try:
+        put(p, np.arange(10000.), np.sin(np.arange(10000.)))
+        assert p.draw_frame()
+        assert p.view is None and not p.history
+        assert p.series[0][0][0] == 9000
+
+        p.subplot.set_xlim(2000, 9500)  # as when panned
+        assert p.view == (2000, 9500)
+        assert p.draw_frame()
+        assert p.series[0][0][0] == 9000 and p.series[0][0][-1] == 9500
+        deadline = time.time() + 5
+        while not p.history:
+            assert time.time() < deadline
+            p.client.wake.wait(0.1)
+            p.draw_frame()
+        x, y = p.history[0]
+        assert x[0] == 2000 and x[-1] == 9000
+        assert p.subplot.get_xlim() == (2000, 9500)
+        assert p.data_limits[:2] == (2000, 9500)
+
+        p.follow()
+        assert p.draw_frame()
+        assert not p.history
+        assert p.data_limits[:2] == (9000, 9999)
+    finally:
+        p.close_plot()
+
+
+def test_set_wake(tmpdir):
+    # a hosted plot's scrollback wakes the host's shared pacer
+    p = plots.XYPlotter(transport.BaseTransport(), 1000, archive=str(tmpdir.join("archive")))
+    wake = threading.Event()
+    p.set_wake(wake)
+    p.setup_pyplot()
+    p.setup_blit()
+    try:
+        put(p, np.arange(10000.), np.arange(10000.))
+        assert wake.is_set()
+        p.draw_frame()
+        p.subplot.set_xlim(2000, 9500)
+        # the loader can't post its result before wake is cleared
+        with p.scrollback._cond:
+            p.draw_frame()
+            wake.clear()
+        assert wake.wait(5)
+        assert p.draw_frame() and p.history
+    finally:
+        p.close_plot()
+
+
+def test_scrollback_stale_result(tmpdir):
+    p = plots.XYPlotter(transport.BaseTransport(), 1000, archive=str(tmpdir.join("archive")))
+    p.setup_pyplot()
+    p.setup_blit()
+    try:
+        put(p, np.arange(10000.), np.sin(np.arange(10000.)) * np.arange(10000.))
+        p.draw_frame()
+        p.subplot.set_xlim(2000, 9500)
+        p.draw_frame()
+        # back to the live range before the history has been loaded
+        p.subplot.set_xlim(9100, 9500)
+        deadline = time.time() + 5
+        while p.scrollback._result is None:
+            assert time.time() < deadline
+            time.sleep(0.01)
+        p.draw_frame()
+        assert not p.history
+        assert p.data_limits[:2] == (9100, 9500)
+        assert p.data_limits[3] < 9501
+    finally:
+        p.close_plot()
+
+
+@pytest.mark.parametrize('compact_time', [True, False])
+def test_epoch_time(compact_time):
+    p = plots.XYPlotter(transport.BaseTransport(), 1000, compact_time=compact_time)
+    p.setup_pyplot()
+    p.decimate = False
+    try:
+        assert p.xy_queue.get().dtype == np.float32
+        t = 1.7e9 + np.arange(5000) / 1000
+        put(p, t, np.arange(5000.))
+        assert p.update_data()
+        x, y = p.series[0]
+        if compact_time:
+            assert np.abs(x - t[-1000:]).max() < 1e-3
+            assert p.data_limits[:2] == (t[-1000], t[-1])
+        else:
+            # float32 can't tell 1.7e9 s timestamps 1 ms apart
+            assert len(np.unique(x)) < 10
+    finally:
+        p.clear_pyplot()
+
+
+def test_scaling():
+    p = plots.MultiXYPlotter(transport.BaseTransport(), 1000, nseries=2, dtype=np.int16,
+                             scales=[0.5, -2], offsets=[1, 0])
+    p.setup_pyplot()
+    p.decimate = False
+    try:
+        assert p.xy_queue.get().dtype == np.float32
+        counts = np.array([[-10, 0, 30], [1, 2, 3]], np.int16)
+        p.client.ingest(p.client.OP_NP_XLYL, (np.arange(3.), counts[0], counts[1]))
+        assert p.update_data()
+        assert p.series[0][1].tolist() == [-4, 1, 16]
+        assert p.series[1][1].tolist() == [-2, -4, -6]
+        assert p.data_limits == (0, 2, -6, 16)
+    finally:
+        p.clear_pyplot()
+
+
+def test_epoch_time_shm():
+    # the producer writes x straight into a shared ring, without a base
+    server = transport.ShmServer('localhost')
+    user_tp = transport.ShmTransport()
+    t = threading.Thread(target=user_tp.connect, args=(server.get_addr(),))
+    t.start()
+    p = plots.XYPlotter(server.accept_connection2(), 100, dtype=np.float32)
+    try:
+        t.join(5)
+        p.setup_pyplot()
+        p.decimate = False
+        user = protocols.XYUserProtocol(queue.Queue(), 'binary', dtype=np.float32)
+        user.connection_made(user_tp)
+        t0 = 1.7e9
+        user.put_np_xlyl(t0 + np.arange(10), np.arange(10))
+        assert p.update_data()
+        assert p.x_data.tolist() == (t0 + np.arange(10)).tolist()
+    finally:
+        user_tp.close()
+        p.clear_pyplot()
+        p.close_plot()
+        p.transport.close()
+        server.close()
+
+
+def test_pacer_max_fps():
+    pacer = plots.FramePacer(100, 5, threading.Event())
+    start = time.perf_counter()
+    for _ in range(10):
+        pacer.wait(True)
+    elapsed = time.perf_counter() - start
+    assert 0.09 <= elapsed < 0.5
+    assert pacer.dropped == 0
+
+
+def test_pacer_idle():
+    pacer = plots.FramePacer(100, 10, threading.Event())
+    start = time.perf_counter()
+    pacer.wait(False)
+    assert time.perf_counter() - start >= 0.09
+
+
+def test_pacer_wake():
+    wake = threading.Event()
+    pacer = plots.FramePacer(100, 0.1, wake)
+    threading.Timer(0.05, wake.set).start()
+    start = time.perf_counter()
+    pacer.wait(False)
+    assert time.perf_counter() - start < 1
+    assert not wake.is_set()
+
+
+def test_pacer_drops_late_frames():
+    pacer = plots.FramePacer(100, 5, threading.Event())
+    time.sleep(0.035)
+    start = time.perf_counter()
+    pacer.wait(True)
+    assert time.perf_counter() - start < 0.005  # no catching up
+    assert pacer.dropped >= 3
+
+
+def test_pacer_wakes_on_data(plotter):
+    assert not plotter.pacer.wake.is_set()
+    put(plotter, [1, 2], [3, 4])
+    assert plotter.pacer.wake.is_set()
+
+
+def test_pacer_bad_fps():
+    with pytest.raises(ValueError):
+        plots.FramePacer(0)
+
+
+@pytest.fixture
+def multi():
+    p = plots.MultiXYPlotter(transport.BaseTransport(), 100000, nseries=3)
+    p.setup_pyplot()
+    yield p
+    p.clear_pyplot()
+
+
+def test_multi_series(multi):
+    assert plots.get_plot_class('multixy') is plots.MultiXYPlotter
+    multi.setup_blit()
+    assert len(multi.lines) == 3
+    x = np.arange(50000.)
+    cols = [x, np.sin(x / 1000), np.cos(x / 1000) + 5, -x / 10000]
+    multi.client.ingest(multi.client.OP_NP_XLYL, [c.tobytes() for c in cols])
+    assert multi.draw_frame()
+    width = multi.subplot.bbox.width
+    for line, y in zip(multi.lines, cols[1:]):
+        xd, yd = line.get_data()
+        assert len(xd) <= 2 * width + 2
+        assert yd.min() == pytest.approx(y.min(), abs=1e-6)
+        assert yd.max() == pytest.approx(y.max(), abs=1e-6)
+    xmin, xmax, ymin, ymax = multi.data_limits
+    assert (xmin, xmax) == (0, 49999)
+    assert ymin == pytest.approx(-4.9999)
+    assert ymax == pytest.approx(6)
+
+
+@pytest.fixture
+def headless(tmpdir):
+    p = plots.HeadlessPlotter(transport.BaseTransport(), 100000, fps=50,
+                              output=str(tmpdir.join("frames.rgba")))
+    p.setup_pyplot()
+    yield p
+    p.clear_pyplot()
+
+
+def test_headless_registered():
+    assert plots.get_plot_class('headless') is plots.HeadlessPlotter
+
+
+def test_headless_draw_frame(headless):
+    headless.setup_blit()
+    frame = headless.frame
+    assert frame.dtype == np.uint8 and frame.shape[2] == 4
+    before = frame.copy()
+    assert not headless.draw_frame()
+    assert np.array_equal(frame, before)
+    put(headless, np.arange(100.), np.arange(100.) ** 2)
+    assert headless.draw_frame()
+    assert not np.array_equal(frame, before)
+    # rendered in place
+    assert np.shares_memory(frame, np.asarray(headless.figure.canvas.buffer_rgba()))
+    after = frame.copy()
+    assert not headless.draw_frame()
+    assert np.array_equal(frame, after)
+
+
+def test_headless_run_plot(headless):
+    headless.writer = export.open_frame_writer(headless.output)
+    put(headless, [0, 1, 2], [3, 4, 5])
+    threading.Timer(0.2, headless.client._finish).start()
+    headless.run_plot()
+    headless.writer.close()
+    nframes = headless.writer.count
+    assert 2 <= nframes <= 20
+    h, w, _ = headless.frame.shape
+    with open(headless.output, 'rb') as f:
+        data = f.read()
+    assert len(data) == nframes * h * w * 4
+    assert data[-h * w * 4:] == headless.frame.tobytes()
+
+
+def test_png_sequence(tmpdir):
+    writer = export.open_frame_writer(str(tmpdir.join("img.png")))
+    assert isinstance(writer, export.PNGSequenceWriter)
+    frame = np.zeros((20, 30, 4), np.uint8)
+    frame[..., 3] = 255
+    frame[5:10, :, 0] = 255
+    writer.write(frame)
+    writer.write(frame, 3)
+    writer.close()
+    assert sorted(f.basename for f in tmpdir.listdir()) == ["img_%05d.png" % i for i in range(4)]
+    assert writer.count == 4
+    assert tmpdir.join("img_00003.png").read_binary() == tmpdir.join("img_00001.png").read_binary()
+    img = matplotlib.image.imread(str(tmpdir.join("img_00000.png")))
+    assert img.shape == (20, 30, 4)
+    assert np.array_equal(img[..., 0] == 1, frame[..., 0] == 255)
@@ -0,0 +1,488 @@
+""" Tests for simplertplot.protocols """
+import io
+import queue
+import threading
+import pytest
+from os import makedirs
+import sys
+# noinspection PyUnresolvedReferences
+from os.path import dirname, join, exists, basename
+from shutil import rmtree
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+_h = logging.StreamHandler()
+_f = logging.Formatter("%(created)s %(name)s %(levelname)s (%(lineno)s): %(message)s")
+_h.setFormatter(_f)
+logger.addHandler(_h)
+logger.propagate = False
+del _h, _f
+
+
+curdir = dirname(__file__)
+test_dir = dirname(curdir)
+test_temp_dir = join(test_dir, "temp")
+temp_dir = join(test_temp_dir, "temp_dir_path")
+test_input = join(curdir, "test_input")
+local_test_input = join(test_input, basename(__file__.replace(".py", "_input")))
+
+
+def setup_module():
+    for d in temp_dir, test_input, local_test_input:
+        try:
+            makedirs(d)
+        except FileExistsError:
+            pass
+    set_up_pyfile_logger()
+    sys.path.append(curdir)
+    sys.path.append(local_test_input)
+
+
+def set_up_pyfile_logger():
+    global pyfile_logger
+    pyfile_logger = logging.getLogger("pyfile_" + basename(__file__.replace(".py", "")))
+    pyfile_formatter = logging.Formatter("")
+    pyfile_handler = logging.FileHandler(join(test_input, local_test_input, "dbg_ut.py"), 'w')
+    pyfile_logger.addHandler(pyfile_handler)
+    pyfile_handler.setFormatter(pyfile_formatter)
+
+
+def teardown_module():
+    try:
+        rmtree(temp_dir)
+    except FileNotFoundError:
+        pass
+
+    for p in (curdir, local_test_input):
+        try:
+            sys.path.remove(p)
+        except Exception:
+            pass
+
+
+import numpy as np
+
+from simplertplot import protocols
+from simplertplot import transport
+from simplertplot.queues import ColumnRingBuffer
+
+
+def new_protocols(max_pts=100, serial_method='pickle'):
+    q = queue.Queue()
+    user = protocols.XYUserProtocol(q, serial_method)
+    plotter = protocols.XYPlotterProtocol(ColumnRingBuffer(max_pts, 2), queue.Queue(), queue.Queue(),
+                                          serial_method)
+    return q, user, plotter
+
+
+class ChunkedReader(io.BytesIO):
+    """ Simulate a socket returning short reads """
+    def readinto(self, b):
+        return super().readinto(memoryview(b)[:7])
+
+
+@pytest.mark.parametrize('serial_method', [None, 'pickle', 'binary'])
+@pytest.mark.parametrize('method', ['put_xyl', 'put_xlyl', 'put_np_xyl', 'put_np_xlyl'])
+def test_ingest(method, serial_method):
+    q, user, plotter = new_protocols(serial_method=serial_method or 'pickle')
+    x = np.arange(10, dtype=float)
+    y = x * 2
+    if method == 'put_xyl':
+        user.put_xyl(list(zip(x.tolist(), y.tolist())))
+    elif method == 'put_xlyl':
+        user.put_xlyl(x.tolist(), y.tolist())
+    elif method == 'put_np_xyl':
+        user.put_np_xyl(np.column_stack((x, y)))
+    else:
+        user.put_np_xlyl(x, y)
+    user.put_xy(10, 20)
+    while not q.empty():
+        msg = q.get()
+        if serial_method:
+            msg = plotter.deserialize(ChunkedReader(user.serialize(msg)))
+        plotter.ingest(*msg)
+    xd, yd = plotter.xyq.get()
+    assert xd.tolist() == list(range(11))
+    assert yd.tolist() == list(range(0, 22, 2))
+    assert plotter.current_update == 11
+
+
+def test_ingest_overflow():
+    q, user, plotter = new_protocols(5)
+    user.put_np_xlyl(np.arange(12), np.arange(12))
+    plotter.ingest(*q.get())
+    assert plotter.xyq.get()[0].tolist() == [7, 8, 9, 10, 11]
+    assert plotter.current_update == 12
+
+
+def test_ingest_bad_op():
+    q, user, plotter = new_protocols()
+    pytest.raises(ValueError, plotter.ingest, 99, ())
+
+
+def test_binary_frames():
+    q, user, plotter = new_protocols(serial_method='binary')
+    user.put_xy(1, 2)
+    user.put_np_xlyl(np.arange(3), np.arange(3) * 2)
+    user.put_xlyl([1, 2], [3, 4])
+    stream = io.BytesIO(b''.join(user.serialize(q.get()) for _ in range(3)))
+    code, data = plotter.deserialize(stream)
+    assert code == user.OP_XY and data.tolist() == [1, 2]
+    code, (xl, yl) = plotter.deserialize(stream)
+    assert code == user.OP_NP_XLYL
+    assert xl.tolist() == [0, 1, 2] and yl.tolist() == [0, 2, 4]
+    code, (xl, yl) = plotter.deserialize(stream)
+    assert code == user.OP_XLYL
+    assert xl.tolist() == [1, 2] and yl.tolist() == [3, 4]
+    pytest.raises(EOFError, plotter.deserialize, stream)
+
+
+def test_binary_mixed_dtypes():
+    ser = protocols.BinarySerializer()
+    x = np.arange(5, dtype=np.float64)
+    y = np.arange(5, dtype=np.int16)
+    code, (xl, yl) = ser.load(io.BytesIO(ser.dumps((protocols.BaseProtocol.OP_NP_XLYL, (x, y)))))
+    assert xl.dtype == np.float64 and yl.dtype == np.int16
+    assert xl.tolist() == yl.tolist() == list(range(5))
+
+
+def test_dtype():
+    q = queue.Queue()
+    user = protocols.XYUserProtocol(q, 'binary', dtype=np.float32)
+    plotter = protocols.XYPlotterProtocol(ColumnRingBuffer(100, 2), queue.Queue(), queue.Queue(), 'binary')
+    tp = WriteTransport()
+    user.connection_made(tp)
+    user.max_latency = 0
+    user.put_np_xlyl(np.arange(3.), np.arange(3.) / 2)
+    user.put_xy(3, 1.5)
+    user._send_pending()
+    (code, (xl, yl)), = tp.frames(plotter.deserialize)
+    # x stays float64, y is sent as float32
+    assert xl.dtype == np.float64 and yl.dtype == np.float32
+    assert len(tp.buf.getvalue()) < 4 * 8 + 4 * 4 + 32
+    plotter.ingest(code, (xl, yl))
+    assert plotter.xyq.get().tolist() == [[0, 1, 2, 3], [0, .5, 1, 1.5]]
+
+
+def test_shm_transport():
+    server = transport.ShmServer('localhost')
+    user_tp = transport.ShmTransport()
+    # connect() waits for the plotter to announce its ring
+    t = threading.Thread(target=user_tp.connect, args=(server.get_addr(),))
+    t.start()
+    plotter_tp = server.accept_connection2()
+    try:
+        ring = plotter_tp.create_ring(100, 2)
+        t.join(5)
+        plotter = protocols.XYPlotterProtocol(ring, queue.Queue(), queue.Queue(), 'binary')
+        plotter.connection_made(plotter_tp)
+        user = protocols.XYUserProtocol(queue.Queue(), 'binary')
+        user.connection_made(user_tp)
+        user.put_np_xlyl(np.arange(5.), np.arange(5.) * 2)
+        user.put_xy(5, 10)
+        with plotter.lock_queue():
+            assert plotter.current_update == 6
+            assert plotter.xyq.get().tolist() == [list(range(6)), list(range(0, 12, 2))]
+    finally:
+        user_tp.close()
+        plotter_tp.close()
+        server.close()
+
+
+def test_int16_passthrough():
+    q = queue.Queue()
+    user = protocols.XYUserProtocol(q, 'binary', dtype=np.int16, nseries=2)
+    plotter = protocols.XYPlotterProtocol(ColumnRingBuffer(100, 3), queue.Queue(), queue.Queue(), 'binary')
+    counts = np.array([[-32768, 0, 32767], [1, 2, 3]], np.int16)
+    user.put_series(np.arange(3.), counts)
+    msg = q.get()
+    assert msg[1][1].dtype == np.int16
+    data = user.serialize(msg)
+    assert len(data) < 3 * 8 + 2 * 3 * 2 + 32
+    code, cols = plotter.deserialize(io.BytesIO(data))
+    assert cols[1].dtype == cols[2].dtype == np.int16
+    plotter.ingest(code, cols)
+    assert plotter.xyq.get()[1:].tolist() == counts.tolist()
+
+
+def test_compact_x():
+    q = queue.Queue()
+    user = protocols.XYUserProtocol(q, 'binary')
+    plotter = protocols.XYPlotterProtocol(ColumnRingBuffer(1000, 2, np.float32), queue.Queue(), queue.Queue(),
+                                          'binary', compact_x=True)
+    # epoch timestamps 1 ms apart, which float32 alone can't tell apart
+    t0 = 1.7e9
+    t = t0 + np.arange(10000) / 1000
+    for i in range(0, len(t), 300):
+        user.put_np_xlyl(t[i:i + 300], t[i:i + 300] - t0)
+        plotter.ingest(*q.get())
+    x, y = plotter.xyq.get()
+    assert np.abs(x + plotter.x_base - t[-1000:]).max() < 1e-3
+    # the base moved up with the data, offsets stay within about
+    # twice the buffer's span
+    assert plotter.x_base > t[0]
+    assert x.max() < 2.5
+    plotter.ingest(user.OP_XY, (t[-1] + 1, 0))
+    assert plotter.xyq.get()[0, -1] + plotter.x_base == t[-1] + 1
+
+
+def test_compact_x_scatter():
+    q = queue.Queue()
+    user = protocols.XYUserProtocol(q, 'binary')
+    ring = ColumnRingBuffer(1000, 2, np.float32)
+    plotter = protocols.XYPlotterProtocol(ring, queue.Queue(), queue.Queue(), 'binary', compact_x=True)
+    shifts = []
+    shift = ring.shift
+    ring.shift = lambda col, delta: (shifts.append(delta), shift(col, delta))
+    # unordered x never moves the base, each batch would shift the
+    # whole buffer otherwise
+    rs = np.random.RandomState(0)
+    for _ in range(50):
+        x = 1.7e9 + rs.uniform(0, 100, 100)
+        user.put_np_xlyl(x, x)
+        plotter.ingest(*q.get())
+        user.put_xy(x[0], 0)
+        plotter.ingest(*q.get())
+    assert not shifts
+    stored = plotter.xyq.get()[0]
+    assert abs(stored[-1] + plotter.x_base - x[0]) < 1e-4
+    assert np.abs(stored).max() < 100
+
+
+def test_binary_rpc():
+    ser = protocols.BinarySerializer()
+    op = protocols.BaseProtocol.OP_RPC
+    req = protocols.RPCRequest("test_rpc", ("Hello",), {'a': 1})
+    _, req2 = ser.load(io.BytesIO(ser.dumps((op, req))))
+    assert (req2.id, req2.func, req2.args, req2.kwargs) == (req.id, "test_rpc", ("Hello",), {'a': 1})
+
+    _, rsp = ser.load(io.BytesIO(ser.dumps((op, req2.respond(value=5)))))
+    assert rsp.id == req.id and rsp.value == 5 and rsp.exc is None
+
+    _, rsp = ser.load(io.BytesIO(ser.dumps((op, req2.respond(exc=KeyError("foo"))))))
+    assert isinstance(rsp.exc, protocols.RPCError)
+    assert "KeyError" in str(rsp.exc)
+
+    value = {'n': np.int64(3), 'a': np.arange(3.), 'x': np.float32(0.5)}
+    _, rsp = ser.load(io.BytesIO(ser.dumps((op, req2.respond(value=value)))))
+    assert rsp.value == {'n': 3, 'a': [0, 1, 2], 'x': 0.5}
+
+
+@pytest.mark.parametrize('serial_method', ['pickle', 'binary'])
+def test_rpc_unserializable_result(serial_method):
+    q, user, plotter = new_protocols(serial_method=serial_method)
+    tp = WriteTransport()
+    plotter.connection_made(tp)
+    req = protocols.RPCRequest("test_rpc", (), {})
+    plotter.rpc_rsp.put(req.respond(value=lambda: None))
+    plotter._send_responses()
+    (op, rsp), = tp.frames(user.deserialize)
+    assert op == user.OP_RPC and rsp.id == req.id
+    assert isinstance(rsp.exc, protocols.RPCError)
+
+
+class WriteTransport(transport.BaseTransport):
+    def __init__(self):
+        self.buf = io.BytesIO()
+
+    def write(self, msg):
+        self.buf.write(msg)
+
+    def frames(self, deserialize):
+        stream = io.BytesIO(self.buf.getvalue())
+        while True:
+            try:
+                yield deserialize(stream)
+            except EOFError:
+                return
+
+
+@pytest.mark.parametrize('serial_method', ['pickle', 'binary'])
+def test_coalesce(serial_method):
+    q, user, plotter = new_protocols(serial_method=serial_method)
+    user.max_latency = 0
+    tp = WriteTransport()
+    user.connection_made(tp)
+    user.put_xy(0, 0)
+    user.put_xyl([(1, 1), (2, 2)])
+    user.put_xy(3, 3)
+    user.put_np_xlyl(np.arange(4, 6), np.arange(4, 6))
+    fut = user.put_rpc("test_rpc", "foo")
+    user.put_xlyl([6], [6])
+    user.put_np_xyl(np.array([[7, 7]]))
+    user._send_pending()
+    assert q.empty()
+
+    ops = []
+    for op, data in tp.frames(plotter.deserialize):
+        ops.append(op)
+        if op == user.OP_RPC:
+            assert data.func == "test_rpc"
+        else:
+            plotter.ingest(op, data)
+    assert ops == [user.OP_NP_XLYL, user.OP_RPC, user.OP_NP_XLYL]
+    xd, yd = plotter.xyq.get()
+    assert xd.tolist() == yd.tolist() == list(range(8))
+    assert not fut.done()
+
+
+def test_coalesce_limits():
+    q, user, plotter = new_protocols()
+    user.max_latency = 3600
+    user.max_batch = 10
+    tp = WriteTransport()
+    user.connection_made(tp)
+    for i in range(25):
+        user.put_xy(i, i)
+    user._send_pending()
+    assert [len(xl) for _, (xl, yl) in tp.frames(plotter.deserialize)] == [10, 10]
+    user.max_latency = 0
+    user._send_pending()
+    assert [len(xl) for _, (xl, yl) in tp.frames(plotter.deserialize)] == [10, 10, 5]
+
+
+def test_step_limits():
+    q, user, plotter = new_protocols()
+    user.max_step_msgs = 3
+    tp = WriteTransport()
+    user.connection_made(tp)
+    for i in range(5):
+        user.put_rpc("test_rpc", i)
+    user._send_pending()
+    assert [req.args for _, req in tp.frames(plotter.deserialize)] == [(0,), (1,), (2,)]
+    assert q.qsize() == 2
+    user.max_step_msgs = 10
+    user.max_step_bytes = 1
+    user._send_pending()
+    assert q.qsize() == 1
+
+
+def queued_x(q, plotter):
+    while not q.empty():
+        code, data = q.get()
+        plotter.ingest(code, data)
+    x, y = plotter.xyq.get()
+    return x.tolist()
+
+
+@pytest.mark.parametrize('serial_method', ['pickle', 'binary'])
+def test_put_series(serial_method):
+    q = queue.Queue()
+    user = protocols.XYUserProtocol(q, serial_method, max_latency=0, nseries=3)
+    plotter = protocols.XYPlotterProtocol(ColumnRingBuffer(100, 4), queue.Queue(), queue.Queue(),
+                                          serial_method)
+    tp = WriteTransport()
+    user.connection_made(tp)
+    x = np.arange(5.)
+    user.put_series(x, [x + 10, x + 20, x + 30])
+    user.put_series(x + 5, np.array([x + 15, x + 25, x + 35]))
+    with pytest.raises(ValueError):
+        user.put_series(x, [x, x])
+    user._send_pending()
+    frames = list(tp.frames(plotter.deserialize))
+    assert len(frames) == 1
+    plotter.ingest(*frames[0])
+    data = plotter.xyq.get()
+    assert data.shape == (4, 10)
+    for i in range(4):
+        assert data[i].tolist() == list(range(i * 10, i * 10 + 10))
+
+
+@pytest.mark.parametrize('method, args', [
+    ('put_xy', (0, 1)),
+    ('put_xyl', ([(0, 1), (1, 2)],)),
+    ('put_xlyl', ([0, 1], [1, 2])),
+    ('put_np_xyl', (np.zeros((2, 2)),)),
+    ('put_np_xlyl', (np.zeros(2), np.zeros(2))),
+])
+def test_single_series_puts(method, args):
+    # one y column can't be sent to a plot of several series
+    q = queue.Queue()
+    user = protocols.XYUserProtocol(q, 'binary', nseries=2)
+    with pytest.raises(ValueError):
+        getattr(user, method)(*args)
+    assert q.empty()
+
+
+def test_overflow_decimate_series():
+    q = queue.Queue(1)
+    user = protocols.XYUserProtocol(q, overflow='decimate', nseries=2)
+    plotter = protocols.XYPlotterProtocol(ColumnRingBuffer(100, 3), queue.Queue(), queue.Queue())
+    x = np.arange(4.)
+    user.put_series(x, [x + 10, x + 20])
+    user.put_series(x + 4, [x + 14, x + 24])
+    assert user.decimated == 4
+    plotter.ingest(*q.get())
+    assert plotter.xyq.get().tolist() == [[0, 2, 4, 6], [10, 12, 14, 16], [20, 22, 24, 26]]
+
+
+def test_overflow_block():
+    q = queue.Queue(2)
+    user = protocols.XYUserProtocol(q)
+    user.put_xy(0, 0)
+    user.put_xy(1, 1)
+    t = threading.Thread(target=user.put_xy, args=(2, 2), daemon=True)
+    t.start()
+    t.join(0.05)
+    assert t.is_alive()
+    q.get()
+    t.join(1)
+    assert not t.is_alive()
+    assert user.dropped == 0
+
+
+def test_overflow_drop_newest():
+    q = queue.Queue(2)
+    user = protocols.XYUserProtocol(q, overflow='drop-newest')
+    plotter = new_protocols()[2]
+    user.put_xy(0, 0)
+    user.put_xlyl([1, 2], [1, 2])
+    user.put_xlyl([3, 4, 5], [3, 4, 5])
+    assert user.dropped == 3
+    assert queued_x(q, plotter) == [0, 1, 2]
+
+
+def test_overflow_drop_oldest():
+    q = queue.Queue(2)
+    user = protocols.XYUserProtocol(q, overflow='drop-oldest')
+    plotter = new_protocols()[2]
+    user.put_xy(0, 0)
+    user.put_xlyl([1, 2], [1, 2])
+    user.put_xlyl([3, 4, 5], [3, 4, 5])
+    assert user.dropped == 1
+    assert q.unfinished_tasks == 2
+    assert queued_x(q, plotter) == [1, 2, 3, 4, 5]
+
+
+def test_overflow_decimate():
+    q = queue.Queue(2)
+    user = protocols.XYUserProtocol(q, overflow='decimate')
+    plotter = new_protocols()[2]
+    user.put_xy(0, 0)
+    user.put_xlyl([1, 2], [1, 2])
+    user.put_np_xlyl(np.array([3., 4, 5]), np.array([3., 4, 5]))
+    assert user.decimated == 3
+    assert user.dropped == 0
+    assert q.qsize() == 1
+    assert q.unfinished_tasks == 1
+    assert queued_x(q, plotter) == [0, 2, 4]
+
+
+def test_overflow_rpc_only():
+    # nothing to make room with: the data is dropped
+    q = queue.Queue(1)
+    user = protocols.XYUserProtocol(q, overflow='drop-oldest')
+    user.put_rpc("test_rpc", 0)
+    user.put_xy(0, 0)
+    assert user.dropped == 1
+    assert q.qsize() == 1
+
+
+def test_overflow_invalid():
+    with pytest.raises(ValueError):
+        protocols.XYUserProtocol(queue.Queue(), overflow='spill')
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,153 @@
+""" Tests for simplertplot.replay """
+import pytest
+from os import makedirs
+import sys
+# noinspection PyUnresolvedReferences
+from os.path import dirname, join, exists, basename
+from shutil import rmtree
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+_h = logging.StreamHandler()
+_f = logging.Formatter("%(created)s %(name)s %(levelname)s (%(lineno)s): %(message)s")
+_h.setFormatter(_f)
+logger.addHandler(_h)
+logger.propagate = False
+del _h, _f
+
+
+curdir = dirname(__file__)
+test_dir = dirname(curdir)
+test_temp_dir = join(test_dir, "temp")
+temp_dir = join(test_temp_dir, "temp_dir_path")
+test_input = join(curdir, "test_input")
+local_test_input = join(test_input, basename(__file__.replace(".py", "_input")))
+
+
+def setup_module():
+    for d in temp_dir, test_input, local_test_input:
+        try:
+            makedirs(d)
+        except FileExistsError:
+            pass
+    set_up_pyfile_logger()
+    sys.path.append(curdir)
+    sys.path.append(local_test_input)
+
+
+def set_up_pyfile_logger():
+    global pyfile_logger
+    pyfile_logger = logging.getLogger("pyfile_" + basename(__file__.replace(".py", "")))
+    pyfile_formatter = logging.Formatter("")
+    pyfile_handler = logging.FileHandler(join(test_input, local_test_input, "dbg_ut.py"), 'w')
+    pyfile_logger.addHandler(pyfile_handler)
+    pyfile_handler.setFormatter(pyfile_formatter)
+
+
+def teardown_module():
+    try:
+        rmtree(temp_dir)
+    except FileNotFoundError:
+        pass
+
+    for p in (curdir, local_test_input):
+        try:
+            sys.path.remove(p)
+        except Exception:
+            pass
+
+
+import queue
+import time
+
+import numpy as np
+
+from simplertplot import protocols
+from simplertplot import replay
+from simplertplot.archive import ColumnArchive
+from simplertplot.queues import ColumnRingBuffer
+
+
+def make_rows(n, ncols=2, rate=1000):
+    t = np.arange(n) / rate
+    return np.column_stack([t] + [np.sin(t + i) for i in range(ncols - 1)])
+
+
+@pytest.fixture
+def npy(tmpdir):
+    path = str(tmpdir.join("rec.npy"))
+    np.save(path, make_rows(1000))
+    return path
+
+
+@pytest.fixture
+def archive(tmpdir):
+    path = str(tmpdir.join("rec"))
+    a = ColumnArchive(path, chunk_rows=300)
+    a.append(make_rows(1000).T)
+    a.close()
+    return path
+
+
+def make_client(n=10000):
+    return protocols.XYPlotterProtocol(ColumnRingBuffer(n, 2, np.float64), queue.Queue(), queue.Queue())
+
+
+@pytest.mark.parametrize("source", ["npy", "archive"])
+def test_iter_blocks(source, request):
+    recording = replay.open_recording(request.getfixturevalue(source))
+    blocks = list(replay.iter_blocks(recording, 128))
+    assert all(b.shape[1] <= 128 for b in blocks)
+    np.testing.assert_array_equal(np.concatenate(blocks, axis=1), make_rows(1000).T)
+
+
+@pytest.mark.parametrize("source", ["npy", "archive"])
+def test_replay_max_speed(source, request):
+    client = make_client()
+    r = replay.Replayer(client, replay.open_recording(request.getfixturevalue(source)), None, 100)
+    r.run()
+    assert r.rows == 1000
+    assert client.finished.is_set()
+    assert client.current_update == 1000
+    np.testing.assert_array_equal(client.xyq.get(), make_rows(1000).T)
+
+
+def test_replay_paced(npy):
+    # 1s recorded, at 5x
+    client = make_client()
+    r = replay.Replayer(client, replay.open_recording(npy), 5)
+    r.start()
+    time.sleep(0.1)
+    assert 0 < len(client.xyq) < 1000
+    r._thread.join(5)
+    assert r.rows == 1000
+    assert 0.19 < r.elapsed < 1
+
+
+def test_replay_stop(npy):
+    client = make_client()
+    r = replay.Replayer(client, replay.open_recording(npy), 0.1)
+    r.start()
+    r.stop()
+    assert r.rows < 1000
+    assert client.finished.is_set()
+
+
+def test_replay_headless(archive, tmpdir):
+    output = str(tmpdir.join("frame_%03d.png"))
+    ns = replay.parse_args([archive, "--speed=max", "--plot=headless", "--output=" + output])
+    r = replay.replay(ns)
+    assert r.rows == 1000
+    assert tmpdir.listdir(lambda f: f.basename.startswith("frame_"))
+
+
+def test_replay_series(tmpdir):
+    path = str(tmpdir.join("rec.npy"))
+    np.save(path, make_rows(100, 4))
+    with pytest.raises(ValueError):
+        replay.replay(replay.parse_args([path, "--plot=headless"]))
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -72,6 +72,7 @@ def tearDownModule():
 
 
 import itertools
+import subprocess
 from simplertplot import queues
 
 
@@ -165,19 +166,241 @@ class TestRingBuffer(unittest.TestCase):
         assert rb.get().tolist() == [2, 3, 4]
 
 
+class TestMirrorRingBuffer(unittest.TestCase):
+    def test_mrb_get(self):
+        rb = queues.MirrorRingBuffer(3, int)
+        exp = [
+            [1],
+            [1, 2],
+            [1, 2, 3],
+            [2, 3, 4],
+            [3, 4, 5],
+            [4, 5, 6],
+            [5, 6, 7],
+            [6, 7, 8]
+        ]
+        it = itertools.count(1).__next__
+        for e in exp:
+            v = it()
+            rb.put(v)
+            res = rb.get().tolist()
+            self.assertEqual(e, res)
+
+    def test_mrb_no_copy(self):
+        rb = queues.MirrorRingBuffer(3, int)
+        rb.put_list([1, 2, 3])
+        rb.put_list([4, 5])
+        res = rb.get()
+        assert res.tolist() == [3, 4, 5]
+        assert np.shares_memory(res, rb._mirror)
+
+    def test_mrb_len(self):
+        rb = queues.MirrorRingBuffer(5, int)
+        rb.put_list([1, 2, 3, 4])
+        rb.put_list([5, 6, 7])
+        assert len(rb) == 5
+        assert rb.get().tolist() == [3, 4, 5, 6, 7]
+
+
+class TestColumnRingBuffer(unittest.TestCase):
+    def test_crb_put(self):
+        rb = queues.ColumnRingBuffer(3, 2, int)
+        for i in range(1, 5):
+            rb.put((i, -i))
+        x, y = rb.get()
+        assert x.tolist() == [2, 3, 4]
+        assert y.tolist() == [-2, -3, -4]
+
+    def test_crb_put_list(self):
+        rb = queues.ColumnRingBuffer(5, 2, int)
+        dx = deque(maxlen=5)
+        dy = deque(maxlen=5)
+        it = itertools.count(1).__next__
+        for n in (2, 3, 1, 4, 5, 0, 3):
+            xl = [it() for _ in range(n)]
+            yl = [-v for v in xl]
+            dx.extend(xl)
+            dy.extend(yl)
+            rb.put_list((xl, np.asarray(yl)))
+            x, y = rb.get()
+            assert x.tolist() == list(dx)
+            assert y.tolist() == list(dy)
+            assert len(rb) == len(dx)
+
+    def test_crb_snapshot(self):
+        rb = queues.ColumnRingBuffer(3, 3, int)
+        rb.put_list(([1, 2, 3], [4, 5, 6], [7, 8, 9]))
+        rb.put((10, 11, 12))
+        res = rb.get()
+        assert res.shape == (3, 3)
+        assert res.tolist() == [[2, 3, 10], [5, 6, 11], [8, 9, 12]]
+        assert np.shares_memory(res, rb._mirror)
+
+    def test_crb_shift(self):
+        rb = queues.ColumnRingBuffer(3, 2, int)
+        rb.put_list(([2, 3, 4], [6, 7, 8]))
+        rb.shift(0, 2)
+        rb.put((5, 9))
+        assert rb.get().tolist() == [[1, 2, 5], [7, 8, 9]]
+
+    def test_crb_err(self):
+        rb = queues.ColumnRingBuffer(3, 2, int)
+        self.assertRaises(ValueError, rb.put_list, ([1, 2],))
+        self.assertRaises(ValueError, rb.put_list, ([1, 2, 3, 4], [1, 2, 3, 4]))
+
+
+class TestLODColumnRingBuffer(unittest.TestCase):
+    def fill(self, maxsize, sizes, seed=0):
+        rb = queues.LODColumnRingBuffer(maxsize, 2, np.float64, block=4, factor=2)
+        rng = np.random.RandomState(seed)
+        xs = []
+        ys = []
+        t = 0
+        for n in sizes:
+            x = np.arange(t, t + n, dtype=np.float64)
+            y = rng.randn(n)
+            t += n
+            if n == 1:
+                rb.put((x[0], y[0]))
+            else:
+                rb.put_list((x, y))
+            xs.append(x)
+            ys.append(y)
+        return rb, np.concatenate(xs)[-maxsize:], np.concatenate(ys)[-maxsize:]
+
+    def check_levels(self, rb, y):
+        first = rb._total - len(rb)
+        for i, level in enumerate(rb.levels):
+            mins, maxs, means = rb.stats(i)
+            size = level.size
+            off = -(-first // size) * size - first
+            nb = mins.shape[1]
+            ref = y[off: off + nb * size].reshape(nb, size)
+            assert nb == (len(y) - off) // size
+            assert np.array_equal(mins[1], ref.min(axis=1))
+            assert np.array_equal(maxs[1], ref.max(axis=1))
+            assert np.allclose(means[1], ref.mean(axis=1))
+
+    def test_lod_levels(self):
+        rb, x, y = self.fill(100, [3, 1, 1, 17, 40, 1, 99, 64, 5, 33])
+        assert [level.size for level in rb.levels] == [4, 8, 16, 32]
+        self.check_levels(rb, y)
+
+    def test_lod_big_put(self):
+        # puts of nearly maxsize rows overwrite part of a block at once
+        rb, x, y = self.fill(100, [7, 99, 98, 100, 3, 97])
+        self.check_levels(rb, y)
+
+    def test_lod_put_rows(self):
+        rb, x, y = self.fill(50, [1] * 173)
+        self.check_levels(rb, y)
+
+    def test_lod_envelope(self):
+        rb, x, y = self.fill(1000, [123] * 20)
+        ex, ey = rb.envelope(20)
+        assert ex[0] == x[0] and ex[-1] == x[-1]
+        assert np.all(np.diff(ex) >= 0)
+        assert ey.max() == y.max()
+        assert ey.min() == y.min()
+        assert len(ex) < len(x)
+
+    def test_lod_envelope_range(self):
+        rb, x, y = self.fill(1000, [500, 700])
+        ex, ey = rb.envelope(10, 100, 500)
+        assert ex[0] == x[100] and ex[-1] == x[499]
+        assert ey.max() == y[100:500].max()
+        assert ey.min() == y[100:500].min()
+
+    def test_lod_envelope_small(self):
+        rb, x, y = self.fill(1000, [30])
+        ex, ey = rb.envelope(20)
+        assert ex.tolist() == x.tolist()
+
+    def test_lod_extrema(self):
+        rb, x, y = self.fill(1000, [77, 1, 1, 300, 999, 5, 250])
+        for start, stop in ((0, None), (0, 1), (3, 4), (5, 900), (17, 18 + 64), (511, 1000)):
+            mins, maxs = rb.extrema(start, stop)
+            assert mins.tolist() == [x[start:stop].min(), y[start:stop].min()]
+            assert maxs.tolist() == [x[start:stop].max(), y[start:stop].max()]
+        self.assertRaises(ValueError, rb.extrema, 5, 5)
+
+    def test_lod_shift(self):
+        rb, x, y = self.fill(100, [3, 1, 40, 99, 17])
+        rb.shift(1, 5)
+        self.check_levels(rb, y - 5)
+        rb.shift(0, 10)
+        mins, maxs = rb.extrema(5, 90)
+        assert mins[0] == x[5] - 10 and maxs[0] == x[89] - 10
+        ex, ey = rb.envelope(20)
+        assert ex[0] == x[0] - 10 and ex[-1] == x[-1] - 10
+
+    def test_lod_extrema_nan(self):
+        rb = queues.LODColumnRingBuffer(100, 2, np.float64, block=4, factor=2)
+        y = np.arange(100.)
+        y[::3] = np.nan
+        rb.put_list((np.arange(100.), y))
+        mins, maxs = rb.extrema()
+        assert mins[1] == 1 and maxs[1] == 98
+
+
+class TestSharedColumnRingBuffer(unittest.TestCase):
+    def test_scrb_attach(self):
+        owner = queues.SharedColumnRingBuffer(4, 2, int)
+        try:
+            user = queues.SharedColumnRingBuffer(4, 2, int, owner.name)
+            user.put((1, -1))
+            user.put_list(([2, 3, 4, 5], [-2, -3, -4, -5]))
+            assert owner.written == 5
+            assert len(owner) == 4
+            assert owner.get().tolist() == [[2, 3, 4, 5], [-2, -3, -4, -5]]
+            user.close()
+        finally:
+            owner.close()
+
+    def test_scrb_attach_keeps_rows(self):
+        owner = queues.SharedColumnRingBuffer(8, 2, int)
+        try:
+            owner.put_list(([1, 2, 3, 4, 5], [-1, -2, -3, -4, -5]))
+            user = queues.SharedColumnRingBuffer(8, 2, int, owner.name)
+            assert len(owner) == len(user) == 5
+            user.put((6, -6))
+            assert owner.get()[0].tolist() == [1, 2, 3, 4, 5, 6]
+            assert owner.written == 6
+            user.close()
+        finally:
+            owner.close()
+
+    def test_scrb_attached_process_exits(self):
+        # the attaching process mustn't unlink the owner's block on exit
+        owner = queues.SharedColumnRingBuffer(4, 2, int)
+        try:
+            src = ("import sys; from simplertplot import queues; "
+                   "queues.SharedColumnRingBuffer(4, 2, int, sys.argv[1]).close()")
+            p = subprocess.run([sys.executable, "-c", src, owner.name], capture_output=True, timeout=60)
+            assert p.returncode == 0, p.stderr
+            assert b"leaked" not in p.stderr
+            queues.SharedColumnRingBuffer(4, 2, int, owner.name).close()
+        finally:
+            owner.close()
+
+
 def generator(slc):
     for item in slc:
         yield item
 
 
+@pytest.mark.parametrize('kls', [queues.RingBuffer, queues.MirrorRingBuffer])
 @pytest.mark.parametrize('conv', [tuple, list, np.asarray, generator])
 @pytest.mark.parametrize('nstart', list(range(6)))
 @pytest.mark.parametrize('slen', list(range(6)))
 @pytest.mark.parametrize('nputs', list(range(6)))
-def test_set_slice6(nstart, slen, nputs, conv):
+def test_set_slice6(nstart, slen, nputs, conv, kls):
     count = itertools.count(1)
     nc = count.__next__
-    new = new_deque_ringbuffer
+
+    def new(len=5, initializer=()):
+        return new_deque_ringbuffer(len, initializer, kls)
+
     put = put_item
     extend = extend_items
     get_slc = get_slice
@@ -209,9 +432,9 @@ def test_set_slice6(nstart, slen, nputs, conv):
     verify()
 
 
-def new_deque_ringbuffer(len=5, initializer=()):
+def new_deque_ringbuffer(len=5, initializer=(), kls=queues.RingBuffer):
     d = deque(maxlen=len)
-    rb = queues.RingBuffer(len, int)
+    rb = kls(len, int)
     for v in initializer:
         put_item(d, v)
         put_item(rb, v)
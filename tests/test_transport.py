@@ -72,9 +72,14 @@ def teardown_module():
 if __name__ == '__main__':
     pytest.main()
 
+import os
+import queue
 import threading
 import socket
+from simplertplot import eventloop
+from simplertplot import protocols
 from simplertplot import transport
+from simplertplot.queues import ColumnRingBuffer
 
 
 def blocking(addr, nmessages, flag):
@@ -115,3 +120,77 @@ def test_transport_blocking():
         time.sleep(0.1)  # force thread switch
         w.send(second)
     assert not fail.is_set()
+
+
+def test_close_sends_eof():
+    server = transport.TCPServer('localhost')
+    t = transport.TCPTransport.from_address(server.get_addr())
+    peer = server.accept_connection2()
+    try:
+        t.write_buffered(b"abc")
+        t.close()
+        peer.sock.settimeout(5)
+        # buffered writes are flushed, then the peer sees EOF
+        assert peer.read(3) == b"abc"
+        assert peer.sock.recv(1) == b""
+        assert t.sock.fileno() == -1
+    finally:
+        peer.close()
+        server.close()
+
+
+unix_only = pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'), reason="no AF_UNIX sockets")
+
+
+@unix_only
+def test_unix_transport():
+    server = transport.UnixServer('localhost')
+    user_tp = transport.UnixSocketTransport.from_address(server.get_addr())
+    plotter_tp = server.accept_connection2()
+    assert isinstance(plotter_tp, transport.UnixSocketTransport)
+    loop = eventloop.ThreadedEventLoop()
+    rpc_req = queue.Queue()
+    plotter = protocols.XYPlotterProtocol(ColumnRingBuffer(100, 2), rpc_req, queue.Queue(), 'binary')
+    plotter.connection_made(plotter_tp)
+    plotter.attach(loop)
+    user = protocols.XYUserProtocol(queue.Queue(), 'binary')
+    user.connection_made(user_tp)
+    user.attach(loop)
+    try:
+        user.put_xlyl([1, 2, 3], [4, 5, 6])
+        fut = user.put_rpc("test_rpc", "abcd")
+        req = rpc_req.get(timeout=5)
+        assert (req.func, req.args) == ("test_rpc", ("abcd",))
+        plotter.respond(req.respond(value=4))
+        assert fut.result(5) == 4
+        with plotter.lock_queue():
+            assert plotter.current_update == 3
+            assert plotter.xyq.get().tolist() == [[1, 2, 3], [4, 5, 6]]
+    finally:
+        user.detach()
+        plotter.detach()
+        loop.stop()
+        user_tp.close()
+        plotter_tp.close()
+        server.close()
+
+
+@unix_only
+def test_unix_server_socket_file():
+    addr = ('localhost', 49152 + os.getpid() % 10000)
+    path = transport.unix_socket_path(addr)
+    assert transport.unix_socket_path(path) == path
+    # a socket file left behind by a server that died
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close()
+    assert os.path.exists(path)
+    server = transport.UnixServer(*addr)
+    try:
+        assert server.get_addr() == addr
+        t = transport.UnixSocketTransport.from_address(addr)
+        server.accept_connection2().close()
+        t.close()
+    finally:
+        server.close()
+    assert not os.path.exists(path)